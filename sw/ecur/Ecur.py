@@ -0,0 +1,528 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Pure-python version of 'libecur' (ecur.c); register access over
+# EoE/UDP. The API mirrors the C library:
+#
+#   e = Ecur( "10.10.10.10" )
+#   d = e.qRead32( 0x1000, 4 )      # queue a read (burst of 4)
+#   e.qWrite16( 0x2002, [ 0x1234 ] )
+#   e.execute()                     # one datagram; 'd' is now filled
+#
+# Operations are packed into a single datagram (of at most BUFSZ octets)
+# until 'execute' is called; an operation that does not fit (request or
+# reply) is rejected (ECUR_ERR_NOSPACE_REQ/ECUR_ERR_NOSPACE_REP) -- the
+# caller then executes and queues the operation again.
+#
+# Read data are stored into a caller-supplied (mutable) sequence or into
+# an 'array' which is allocated by the qReadXX routines. Callbacks are
+# executed as cb( data, nelms, closure ) where a negative 'nelms' is an
+# error code (ECUR_ERR_XXX).
+
+import os
+import socket
+import select
+import time
+from   array     import array
+from   ecur.EcurProto import *
+
+class EcurReader(object):
+  __slots__ = ( "data", "lane", "nelms", "cb", "closure" )
+
+  def __init__(self, data, lane, nelms, cb, closure):
+    self.data    = data
+    self.lane    = lane
+    self.nelms   = nelms
+    self.cb      = cb
+    self.closure = closure
+
+  def done(self, nelms):
+    if ( not self.cb is None ):
+      self.cb( self.data, nelms, self.closure )
+
+# Round-trip time estimation (as TCP does; RFC 6298) and link statistics.
+# Lost requests or replies are recovered by re-sending the request with
+# the same sequence number after the retransmission timeout ('rto')
+# expires; the firmware then replays its cached reply, i.e., writes are
+# not executed again. The timeout is doubled on every retry (but capped
+# at 'maxRto'). RTT samples from re-sent requests are ambiguous and not
+# used (Karn's algorithm).
+class EcurLinkStats(object):
+
+  ALPHA   = 1.0/8.0
+  BETA    = 1.0/4.0
+  K       = 4
+  MIN_RTO = 0.002
+  MAX_RTO = 1.0
+
+  def __init__(self, minRto = MIN_RTO, maxRto = MAX_RTO):
+    super().__init__()
+    self._minRto = minRto
+    self._maxRto = maxRto
+    self.reset()
+
+  def reset(self):
+    self._srtt     = None
+    self._rttvar   = None
+    self._rto      = self._maxRto
+    self._minRtt   = None
+    self._maxRtt   = None
+    self.requests  = 0  # requests executed
+    self.sends     = 0  # datagrams sent (including retries)
+    self.retries   = 0  # datagrams re-sent
+    self.recovered = 0  # requests which needed a retry but succeeded
+    self.failed    = 0  # requests which timed out
+    self.stale     = 0  # stale/unexpected replies discarded
+
+  @property
+  def srtt(self):
+    return self._srtt
+
+  @property
+  def rttvar(self):
+    return self._rttvar
+
+  @property
+  def rto(self):
+    return self._rto
+
+  # timeout for the n-th attempt (starting at 0)
+  def timeout(self, attempt):
+    return min( self._maxRto, self._rto * (1 << attempt) )
+
+  def sample(self, rtt):
+    if ( self._srtt is None ):
+      self._srtt   = rtt
+      self._rttvar = rtt/2.0
+      self._minRtt = rtt
+      self._maxRtt = rtt
+    else:
+      self._rttvar = (1.0 - self.BETA) * self._rttvar + self.BETA * abs( self._srtt - rtt )
+      self._srtt   = (1.0 - self.ALPHA) * self._srtt + self.ALPHA * rtt
+      self._minRtt = min( self._minRtt, rtt )
+      self._maxRtt = max( self._maxRtt, rtt )
+    self._rto = min( self._maxRto, max( self._minRto, self._srtt + self.K * self._rttvar ) )
+
+  def sent(self, attempt):
+    self.sends += 1
+    if ( attempt > 0 ):
+      self.retries += 1
+
+  # 'attempts' datagrams were sent; 'rtt' is None if the request failed
+  def done(self, attempts, rtt):
+    self.requests += 1
+    if ( rtt is None ):
+      self.failed    += 1
+    elif ( 1 == attempts ):
+      self.sample( rtt )
+    else:
+      self.recovered += 1
+
+  # fraction of datagrams (requests or replies) lost
+  @property
+  def lossRate(self):
+    return 0.0 if 0 == self.sends else float( self.retries )/float( self.sends )
+
+  def asDict(self):
+    return { "requests" : self.requests,  "sends"  : self.sends,
+             "retries"  : self.retries,   "recovered" : self.recovered,
+             "failed"   : self.failed,    "stale"  : self.stale,
+             "lossRate" : self.lossRate,  "srtt"   : self._srtt,
+             "rttvar"   : self._rttvar,   "rto"    : self._rto,
+             "minRtt"   : self._minRtt,   "maxRtt" : self._maxRtt }
+
+  def __str__(self):
+    def ms(x):
+      return "-" if x is None else "{:.3f}ms".format( 1000.0*x )
+    return ( "requests {:d}, sent {:d}, retries {:d}, recovered {:d}, failed {:d}, stale {:d}, loss {:.2%}, "
+             "srtt {}, rttvar {}, rto {}, min {}, max {}" ).format(
+               self.requests, self.sends, self.retries, self.recovered, self.failed, self.stale, self.lossRate,
+               ms( self._srtt ), ms( self._rttvar ), ms( self._rto ), ms( self._minRtt ), ms( self._maxRtt ) )
+
+# qReadXX/qWriteXX in terms of '_qOp'
+class EcurOps(object):
+
+  @staticmethod
+  def _mkData(data, typ, n):
+    if ( data is None ):
+      return array( typ, bytes( n * array( typ ).itemsize ) )
+    if ( len( data ) < n ):
+      raise EcurError( ECUR_ERR_INVALID_COUNT, "data buffer too small" )
+    return data
+
+  @staticmethod
+  def _wrData(data):
+    if isinstance( data, int ):
+      return [ data ]
+    return data
+
+  # Queue operations; qReadXX return the sequence the data are stored in
+  # (once the request has been executed).
+  def qRead8(self, addr, n = 1, data = None, cb = None, closure = None):
+    data = self._mkData( data, "B", n )
+    self._qOp( addr >> 2, laneCode( addr, 1 ), data, n, True, cb, closure )
+    return data
+
+  def qRead16(self, addr, n = 1, data = None, cb = None, closure = None):
+    data = self._mkData( data, "H", n )
+    self._qOp( addr >> 2, laneCode( addr, 2 ), data, n, True, cb, closure )
+    return data
+
+  def qRead32(self, addr, n = 1, data = None, cb = None, closure = None):
+    data = self._mkData( data, "I", n )
+    self._qOp( addr >> 2, laneCode( addr, 4 ), data, n, True, cb, closure )
+    return data
+
+  def qWrite8(self, addr, data, n = None):
+    data = self._wrData( data )
+    self._qOp( addr >> 2, laneCode( addr, 1 ), data, len( data ) if n is None else n, False )
+
+  def qWrite16(self, addr, data, n = None):
+    data = self._wrData( data )
+    self._qOp( addr >> 2, laneCode( addr, 2 ), data, len( data ) if n is None else n, False )
+
+  def qWrite32(self, addr, data, n = None):
+    data = self._wrData( data )
+    self._qOp( addr >> 2, laneCode( addr, 4 ), data, len( data ) if n is None else n, False )
+
+# A request with a raw payload (e.g., recorded by EcurRecorder); only
+# the sequence number is set when it is sent
+class EcurRawReq(object):
+
+  def __init__(self, payload):
+    super().__init__()
+    self._buf = bytearray( payload )
+
+  def setSeq(self, seq):
+    self._buf[1] = ( self._buf[1] & ~SEQ_MSK & 0xff ) | ( seq & SEQ_MSK )
+
+  @property
+  def seqByte(self):
+    return self._buf[1]
+
+  @property
+  def request(self):
+    return memoryview( self._buf )
+
+# A request (datagram) under construction and the readers waiting for
+# its reply. The buffer is preallocated and reused.
+class EcurReq(EcurOps):
+
+  def __init__(self):
+    super().__init__()
+    self._xbuf    = bytearray( BUFSZ )
+    self._xlen    = 0
+    self._rlen    = 0
+    self._readers = list()
+    # the device (ecur.EcurAsync) which handed out the request and
+    # recycles it
+    self.owner    = None
+
+  def flush(self, frm, err):
+    for r in self._readers[frm:]:
+      r.done( err )
+    self._readers.clear()
+
+  # start a new request; the sequence number is set when the request
+  # is sent (setSeq)
+  def begin(self, cmd = CMD_RDW):
+    self.flush( 0, ECUR_ERR_INTERNAL )
+    self._xlen = packHeader( self._xbuf, 0, cmd, 0 )
+    self._rlen = HEADER_SIZE
+
+  def setSeq(self, seq):
+    self._xbuf[1] = ( seq & SEQ_MSK )
+
+  @property
+  def seq(self):
+    return self._xbuf[1] & SEQ_MSK
+
+  # the header byte carrying the sequence number (echoed by the target)
+  @property
+  def seqByte(self):
+    return self._xbuf[1]
+
+  @property
+  def empty(self):
+    return 0 == self._xlen
+
+  @property
+  def pending(self):
+    return self._xlen > HEADER_SIZE
+
+  # size of the request and of the expected reply
+  @property
+  def size(self):
+    return self._xlen
+
+  @property
+  def replySize(self):
+    return self._rlen + STATUS_SIZE
+
+  @property
+  def numReaders(self):
+    return len( self._readers )
+
+  # the datagram to send
+  @property
+  def request(self):
+    return memoryview( self._xbuf )[0:self._xlen]
+
+  def clear(self):
+    self._xlen = 0
+
+  # RETURNS: number of bytes still available in the request and reply
+  def space(self):
+    xlen = self._xlen if self._xlen > 0 else HEADER_SIZE
+    rlen = self._rlen if self._xlen > 0 else HEADER_SIZE
+    return BUFSZ - xlen, BUFSZ - STATUS_SIZE - rlen
+
+  def _qOp(self, wordAddr, lane, data, n, rdnwr, cb = None, closure = None):
+    checkOp( wordAddr, n )
+    datSz = dataSize( lane, n )
+    reqSz = CMD_SIZE
+    repSz = 0
+    if ( rdnwr ):
+      repSz += datSz
+    else:
+      reqSz += datSz
+
+    if ( 0 == self._xlen ):
+      self.begin( CMD_RDW )
+
+    if ( self._xlen + reqSz > BUFSZ ):
+      raise EcurError( ECUR_ERR_NOSPACE_REQ, "request does not fit in buffer" )
+
+    if ( self._rlen + repSz > BUFSZ - STATUS_SIZE ):
+      raise EcurError( ECUR_ERR_NOSPACE_REP, "reply would not fit in buffer" )
+
+    if ( rdnwr and MAX_READERS == len( self._readers ) ):
+      raise EcurError( ECUR_ERR_NOSPACE_REP, "too many readers" )
+
+    off = packCmd( self._xbuf, self._xlen, wordAddr, lane, n, rdnwr )
+    if ( rdnwr ):
+      self._readers.append( EcurReader( data, lane, n, cb, closure ) )
+      self._rlen += repSz
+    else:
+      off = packData( self._xbuf, off, lane, data, n )
+    self._xlen = off
+
+  # Scatter the reply ('rlen' bytes in 'rbuf') to the readers; the
+  # request is cleared.
+  # RETURNS: number of elements processed
+  def processReply(self, rbuf, rlen):
+    self._xlen = 0
+    if ( rlen < HEADER_SIZE + STATUS_SIZE ):
+      self.flush( 0, ECUR_ERR_INVALID_REP )
+      raise EcurError( ECUR_ERR_INVALID_REP, "not enough data received" )
+    err, nelmsOK = unpackStatus( rbuf, rlen - STATUS_SIZE )
+    ridx = HEADER_SIZE
+    eidx = rlen - STATUS_SIZE
+    rdr  = 0
+    # on error the reply holds the data read before the failing transfer
+    while ( ridx < eidx and rdr < len( self._readers ) ):
+      r     = self._readers[rdr]
+      nelms = min( r.nelms, ( (eidx - ridx) >> (2 if LC_DW == r.lane else 1) ) )
+      d     = unpackData( rbuf, ridx, r.lane, nelms )
+      if isinstance( r.data, array ):
+        d   = array( r.data.typecode, d )
+      r.data[0:nelms] = d
+      ridx += dataSize( r.lane, nelms )
+      r.done( nelms )
+      rdr  += 1
+    if ( err ):
+      self.flush( rdr, ECUR_ERR_INVALID_REP )
+      raise EcurTargetError( nelmsOK )
+    if ( ridx < eidx ):
+      self.flush( rdr, ECUR_ERR_INVALID_REP )
+      raise EcurError( ECUR_ERR_INVALID_REP, "more data than expected" )
+    self.flush( rdr, ECUR_ERR_INVALID_REP )
+    return nelmsOK
+
+class Ecur(EcurOps):
+
+  # maximal retransmission timeout and max. number of attempts (see EcurLinkStats)
+  TIMEOUT = EcurLinkStats.MAX_RTO
+  RETRIES = 8
+
+  # If 'destIP' is None or empty then the ECUR_TARGET_IP env-variable
+  # is used. All datagrams are logged to the 'recorder' (EcurRecorder),
+  # if given.
+  def __init__(self, destIP = None, destPort = DEFAULT_PORT, verbosity = 0, timeout = TIMEOUT, retries = RETRIES, minTimeout = EcurLinkStats.MIN_RTO, recorder = None):
+    super().__init__()
+    if ( destIP is None or 0 == len( destIP ) ):
+      destIP = os.environ.get( "ECUR_TARGET_IP" )
+      if ( destIP is None ):
+        raise EcurError( ECUR_ERR_IO, "No destination IP passed - set 'ECUR_TARGET_IP' env-variable!" )
+    self._seq     = 0
+    self._dbg     = verbosity
+    self._retries = retries
+    self._stats   = EcurLinkStats( minTimeout, timeout )
+    self._req     = EcurReq()
+    self._rec     = recorder
+    # reply buffer is larger so we notice oversized replies
+    self._rbuf    = bytearray( BUFSZ + 2 )
+    self._sd      = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    try:
+      self._sd.bind( ("", 0) )
+      self._sd.connect( (destIP, destPort) )
+      self._peer = self._sd.getpeername()
+      self._sd.setblocking( False )
+      self._checkVersion()
+    except:
+      self._sd.close()
+      raise
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+  def close(self):
+    self._req.flush( 0, ECUR_ERR_INTERNAL )
+    if ( not self._sd is None ):
+      self._sd.close()
+      self._sd = None
+
+  def fileno(self):
+    return self._sd.fileno()
+
+  @property
+  def verbosity(self):
+    return self._dbg
+
+  @property
+  def stats(self):
+    return self._stats
+
+  def prt(self, level, msg):
+    if ( self._dbg > level ):
+      print( msg )
+
+  def _nextSeq(self):
+    seq       = self._seq
+    self._seq = (self._seq + 1) & SEQ_MSK
+    return seq
+
+  def _checkVersion(self):
+    self._req.begin( CMD_VER )
+    got = self._xfer( self._req )
+    self._req.clear()
+    if ( got < HEADER_SIZE ):
+      raise EcurError( ECUR_ERR_IO, "no response to version check" )
+    seq, cmd, ver = unpackHeader( self._rbuf )
+    self.prt( 0, "Ecur: Version check reply: seq {:d}, cmd {:d}, version {:d}".format( seq, cmd, ver ) )
+    if ( ver != PROTO_VERSION ):
+      raise EcurError( ECUR_ERR_INVALID_REP, "Firmware expects protocol version {:d}, we use {:d}".format( ver, PROTO_VERSION ) )
+
+  # Send the request and wait for the reply; the request is re-sent
+  # (with the same sequence number, i.e., the target replays its reply
+  # rather than executing again) if there is no reply within the
+  # retransmission timeout. Replies with a different header (stale
+  # replies) are discarded.
+  # RETURNS: size of the reply or 0 on timeout
+  def _xfer(self, xreq):
+    xreq.setSeq( self._nextSeq() )
+    req = xreq.request
+    st  = self._stats
+    for attempt in range( self._retries ):
+      st.sent( attempt )
+      self._sd.send( req )
+      if ( not self._rec is None ):
+        self._rec.request( self._peer, req )
+      tsnd = time.monotonic()
+      tend = tsnd + st.timeout( attempt )
+      while True:
+        tmo = tend - time.monotonic()
+        if ( tmo <= 0 ):
+          break
+        rdbl, wrbl, errl = select.select( [ self._sd ], [], [], tmo )
+        if ( 0 == len( rdbl ) ):
+          break
+        got = self._sd.recv_into( self._rbuf )
+        if ( not self._rec is None ):
+          self._rec.reply( self._peer, memoryview( self._rbuf )[0:got] )
+        # the firmware echoes the header (except for the version
+        # command which carries the firmware's version)
+        if ( got >= HEADER_SIZE and self._rbuf[1] == xreq.seqByte ):
+          st.done( attempt + 1, time.monotonic() - tsnd )
+          return got
+        st.stale += 1
+        self.prt( 1, "Ecur: discarding stale/unexpected reply" )
+      self.prt( 1, "Ecur: timeout; retrying" )
+    st.done( self._retries, None )
+    return 0
+
+  # Send a raw request (the sequence number is re-assigned) and wait
+  # for the reply (no retries beyond the usual retransmission).
+  # RETURNS: the reply (bytes) or None on timeout
+  def xferRaw(self, payload):
+    got = self._xfer( EcurRawReq( payload ) )
+    return bytes( self._rbuf[0:got] ) if got > 0 else None
+
+  def _qOp(self, wordAddr, lane, data, n, rdnwr, cb = None, closure = None):
+    self._req._qOp( wordAddr, lane, data, n, rdnwr, cb, closure )
+
+  # RETURNS: number of bytes still available in the request and reply
+  def space(self):
+    return self._req.space()
+
+  @property
+  def pending(self):
+    return self._req.pending
+
+  # Execute queued operations (writes always posted); 'req' may be
+  # a request (EcurReq) built by the caller.
+  # RETURNS: number of elements processed
+  def execute(self, req = None):
+    if ( req is None ):
+      req = self._req
+    if ( req.empty ):
+      return 0
+    try:
+      got = self._xfer( req )
+    except OSError as e:
+      got = -1
+      self.prt( -1, "Ecur: UDP transfer failed: {}".format( e ) )
+    if ( got <= 0 ):
+      req.clear()
+      req.flush( 0, ECUR_ERR_IO )
+      raise EcurError( ECUR_ERR_IO, "UDP transfer failed" )
+    try:
+      return req.processReply( self._rbuf, got )
+    except EcurTargetError:
+      self.prt( 0, "Ecur: errors were encountered on the target" )
+      raise
+
+  # Wrappers for synchronous operation; reads return the data
+  def read8(self, addr, n = 1, data = None):
+    data = self.qRead8( addr, n, data )
+    self.execute()
+    return data
+
+  def read16(self, addr, n = 1, data = None):
+    data = self.qRead16( addr, n, data )
+    self.execute()
+    return data
+
+  def read32(self, addr, n = 1, data = None):
+    data = self.qRead32( addr, n, data )
+    self.execute()
+    return data
+
+  def write8(self, addr, data, n = None):
+    self.qWrite8( addr, data, n )
+    return self.execute()
+
+  def write16(self, addr, data, n = None):
+    self.qWrite16( addr, data, n )
+    return self.execute()
+
+  def write32(self, addr, data, n = None):
+    self.qWrite32( addr, data, n )
+    return self.execute()
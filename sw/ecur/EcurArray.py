@@ -0,0 +1,267 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Array view (numpy) of the remote double-word address space.
+#
+#   a = EcurArray( ecur, base = 0x10000, length = 4096 )
+#   x = a[100:200]             # numpy array (copy)
+#   y = a[[ 3, 7, 1000 ]]      # fancy indexing
+#   a[0:16] = 0                # buffered until 'flush'
+#   a.flush()
+#
+# The space is divided into pages (of 'pageWords' double-words) which
+# are fetched on first access; missing pages are fetched with as few
+# burst reads (and datagrams) as possible. Up to 'maxPages' pages are
+# cached; the least recently used ('EVICT_LRU') or oldest ('EVICT_FIFO')
+# page is evicted when the cache is full. With a 'ttl' (seconds) pages
+# are re-fetched if they are older. Writes are buffered in the pages
+# and written back (only modified words) by 'flush()' or when a page
+# is evicted.
+
+import time
+import numpy
+from   collections    import OrderedDict
+from   ecur.EcurProto import *
+
+class EcurArrayPage(object):
+  __slots__ = ( "data", "valid", "dirty", "tstamp" )
+
+  def __init__(self, n):
+    self.data   = numpy.zeros( n, dtype = numpy.uint32 )
+    self.valid  = numpy.zeros( n, dtype = bool )
+    self.dirty  = numpy.zeros( n, dtype = bool )
+    self.tstamp = time.monotonic()
+
+class EcurArrayStats(object):
+
+  def __init__(self):
+    super().__init__()
+    self.reset()
+
+  def reset(self):
+    self.hits      = 0  # page accesses served from the cache
+    self.misses    = 0  # pages fetched
+    self.evictions = 0  # pages evicted
+    self.bursts    = 0  # burst commands issued
+    self.datagrams = 0  # datagrams executed
+
+  def __str__(self):
+    return "hits {:d}, misses {:d}, evictions {:d}, bursts {:d}, datagrams {:d}".format(
+             self.hits, self.misses, self.evictions, self.bursts, self.datagrams )
+
+class EcurArray(object):
+
+  EVICT_LRU  = "lru"
+  EVICT_FIFO = "fifo"
+
+  # 'base' is a byte-address (double-word aligned); 'length' in double-words
+  # (default: up to the end of the address space)
+  def __init__(self, ecur, base = 0, length = None, pageWords = MAX_BURST, maxPages = 64, ttl = None, evict = EVICT_LRU):
+    super().__init__()
+    if ( 0 != (base & 3) ):
+      raise EcurError( ECUR_ERR_INVALID_ADDR, "base address must be double-word aligned" )
+    avail = MAX_WORD_ADDR + 1 - (base >> 2)
+    if ( length is None ):
+      length = avail
+    if ( length < 0 or length > avail ):
+      raise EcurError( ECUR_ERR_INVALID_ADDR, "array exceeds the address space" )
+    if ( not evict in (self.EVICT_LRU, self.EVICT_FIFO) ):
+      raise ValueError( "invalid eviction policy '{}'".format( evict ) )
+    self._ecur   = ecur
+    self._base   = base >> 2
+    self._len    = length
+    self._pw     = pageWords
+    self._max    = maxPages
+    self._ttl    = ttl
+    self._lru    = ( self.EVICT_LRU == evict )
+    self._pages  = OrderedDict()
+    self._stats  = EcurArrayStats()
+
+  def __len__(self):
+    return self._len
+
+  @property
+  def shape(self):
+    return ( self._len, )
+
+  @property
+  def dtype(self):
+    return numpy.dtype( numpy.uint32 )
+
+  @property
+  def stats(self):
+    return self._stats
+
+  def __array__(self, dtype = None, copy = None):
+    a = self[:]
+    return a if dtype is None else a.astype( dtype )
+
+  # RETURNS: array of (non-negative) indices
+  def _index(self, key):
+    if isinstance( key, slice ):
+      return numpy.arange( *key.indices( self._len ), dtype = numpy.int64 )
+    idx = numpy.asarray( key )
+    if ( idx.dtype == bool ):
+      if ( idx.shape != ( self._len, ) ):
+        raise IndexError( "boolean index does not match the array" )
+      return numpy.flatnonzero( idx )
+    idx = idx.astype( numpy.int64 ).ravel()
+    idx = numpy.where( idx < 0, idx + self._len, idx )
+    if ( idx.size > 0 and ( idx.min() < 0 or idx.max() >= self._len ) ):
+      raise IndexError( "index out of range" )
+    return idx
+
+  def _pageLen(self, p):
+    return min( self._pw, self._len - p * self._pw )
+
+  def _page(self, p):
+    pg = self._pages.get( p )
+    if ( pg is None ):
+      pg = EcurArrayPage( self._pageLen( p ) )
+      self._pages[p] = pg
+    elif ( self._lru ):
+      self._pages.move_to_end( p )
+    return pg
+
+  def _execute(self):
+    if ( self._ecur.pending ):
+      self._ecur.execute()
+      self._stats.datagrams += 1
+
+  # Queue burst accesses to 'n' words at word-index 'idx' (packing
+  # datagrams and splitting bursts as needed).
+  def _qBursts(self, idx, buf, rdnwr):
+    off = 0
+    n   = len( buf )
+    while ( off < n ):
+      xsp, rsp = self._ecur.space()
+      if ( rdnwr ):
+        fit = rsp // 4 if xsp >= CMD_SIZE else 0
+      else:
+        fit = (xsp - CMD_SIZE) // 4 if xsp > CMD_SIZE else 0
+      fit = min( fit, n - off, MAX_BURST )
+      if ( fit < 1 ):
+        self._execute()
+        continue
+      addr = ( self._base + idx + off ) << 2
+      if ( rdnwr ):
+        self._ecur.qRead32( addr, fit, buf[off:off+fit] )
+      else:
+        self._ecur.qWrite32( addr, buf[off:off+fit], fit )
+      self._stats.bursts += 1
+      off += fit
+
+  # Fetch pages 'pnos' (sorted); consecutive pages are read in bursts.
+  def _fetch(self, pnos):
+    spans = list()
+    for p in pnos:
+      if ( len( spans ) > 0 and spans[-1][0] + spans[-1][1] == p ):
+        spans[-1][1] += 1
+      else:
+        spans.append( [ p, 1 ] )
+    bufs = list()
+    for p, n in spans:
+      w0  = p * self._pw
+      buf = numpy.zeros( min( self._len, (p + n) * self._pw ) - w0, dtype = numpy.uint32 )
+      self._qBursts( w0, buf, True )
+      bufs.append( (p, n, buf) )
+    self._execute()
+    now = time.monotonic()
+    for p, n, buf in bufs:
+      for i in range( n ):
+        pg  = self._pages[p + i]
+        new = buf[ i * self._pw : i * self._pw + len( pg.data ) ]
+        # keep words we have modified
+        pg.data   = numpy.where( pg.dirty, pg.data, new )
+        pg.valid[:] = True
+        pg.tstamp = now
+        self._stats.misses += 1
+
+  # RETURNS: page numbers and offsets for indices 'idx'
+  def _split(self, idx):
+    return idx // self._pw, idx % self._pw
+
+  def __getitem__(self, key):
+    scalar = isinstance( key, (int, numpy.integer) )
+    idx    = self._index( key )
+    pnos, offs = self._split( idx )
+    upn    = numpy.unique( pnos )
+    now    = time.monotonic()
+    need   = list()
+    sel    = dict()
+    for p in upn.tolist():
+      pg = self._page( p )
+      if ( not self._ttl is None and now - pg.tstamp >= self._ttl ):
+        pg.valid = pg.dirty.copy()
+      s      = numpy.flatnonzero( pnos == p ) if len( upn ) > 1 else slice( None )
+      sel[p] = s
+      if ( pg.valid[ offs[s] ].all() ):
+        self._stats.hits += 1
+      else:
+        need.append( p )
+    if ( len( need ) > 0 ):
+      self._fetch( need )
+    res = numpy.empty( len( idx ), dtype = numpy.uint32 )
+    for p, s in sel.items():
+      res[s] = self._pages[p].data[ offs[s] ]
+    self._trim( set( upn.tolist() ) )
+    if ( scalar ):
+      return int( res[0] )
+    if ( not isinstance( key, slice ) ):
+      res = res.reshape( numpy.shape( key ) ) if numpy.asarray( key ).dtype != bool else res
+    return res
+
+  def __setitem__(self, key, value):
+    idx  = self._index( key )
+    vals = numpy.broadcast_to( numpy.asarray( value, dtype = numpy.int64 ).ravel() & 0xffffffff, idx.shape ).astype( numpy.uint32 )
+    pnos, offs = self._split( idx )
+    upn  = numpy.unique( pnos )
+    for p in upn.tolist():
+      pg = self._page( p )
+      s  = numpy.flatnonzero( pnos == p ) if len( upn ) > 1 else slice( None )
+      pg.data [ offs[s] ] = vals[s]
+      pg.valid[ offs[s] ] = True
+      pg.dirty[ offs[s] ] = True
+    self._trim( set( upn.tolist() ) )
+
+  def _writeBack(self, pnos):
+    for p in pnos:
+      pg = self._pages[p]
+      d  = numpy.flatnonzero( pg.dirty )
+      if ( 0 == len( d ) ):
+        continue
+      # runs of consecutive modified words
+      brk = numpy.flatnonzero( numpy.diff( d ) != 1 ) + 1
+      for run in numpy.split( d, brk ):
+        self._qBursts( p * self._pw + int( run[0] ), pg.data[ run[0] : run[-1] + 1 ], False )
+    self._execute()
+    for p in pnos:
+      self._pages[p].dirty[:] = False
+
+  # evict pages beyond 'maxPages' (except those in 'keep')
+  def _trim(self, keep = ()):
+    if ( len( self._pages ) <= self._max ):
+      return
+    victims = list()
+    for p in self._pages.keys():
+      if ( len( self._pages ) - len( victims ) <= self._max ):
+        break
+      if ( not p in keep ):
+        victims.append( p )
+    self._writeBack( victims )
+    for p in victims:
+      del self._pages[p]
+      self._stats.evictions += 1
+
+  # write back all modified words
+  def flush(self):
+    self._writeBack( list( self._pages.keys() ) )
+
+  # drop cached pages (modified words are written back first)
+  def invalidate(self):
+    self.flush()
+    self._pages.clear()
@@ -0,0 +1,365 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# asyncio client for many targets ('devices') sharing a single socket.
+#
+# The firmware caches only the last reply (for replay if a request with
+# the same header is received again) -- hence there is at most one
+# request in flight per device; further requests wait for their turn
+# (up to 'maxQueued', beyond that they are rejected with
+# ECUR_ERR_NOSPACE_REQ). Requests to different devices proceed
+# concurrently, i.e., polling all devices takes about one round-trip:
+#
+#   async with EcurFleet() as fleet:
+#     for ip in ips:
+#       fleet.device( ip )
+#     res = await fleet.sweep( lambda dev: dev.read32( 0x1000, 4 ) )
+#
+# As the synchronous driver does, a device starts with a version check
+# (before its first request; 'checkVersion' may also be called
+# explicitly). This also clears the firmware's reply cache which could
+# otherwise match the signature of our first request (left over from a
+# previous session) and be replayed.
+#
+# Several operations may be packed into one request:
+#
+#   req = dev.request()
+#   d   = req.qRead32( 0x1000, 4 )
+#   req.qWrite16( 0x2002, [ 0x1234 ] )
+#   await dev.execute( req )
+
+import asyncio
+import socket
+from   ecur.EcurProto import *
+from   ecur.Ecur      import EcurReq, EcurRawReq, EcurLinkStats
+
+class EcurProtocol(asyncio.DatagramProtocol):
+
+  def __init__(self, fleet):
+    super().__init__()
+    self._fleet = fleet
+
+  def connection_made(self, transport):
+    self._fleet._connected( transport )
+
+  def datagram_received(self, data, addr):
+    self._fleet._dispatch( data, addr )
+
+  def error_received(self, exc):
+    self._fleet.prt( 0, "EcurProtocol: {}".format( exc ) )
+
+  def connection_lost(self, exc):
+    self._fleet._disconnected( exc )
+
+  # back-pressure from the transport (send buffer full)
+  def pause_writing(self):
+    self._fleet._writable.clear()
+
+  def resume_writing(self):
+    self._fleet._writable.set()
+
+class EcurDevice(object):
+
+  def __init__(self, fleet, addr, timeout, retries, maxQueued, minTimeout):
+    super().__init__()
+    self._fleet     = fleet
+    self._addr      = addr
+    self._retries   = retries
+    self._stats     = EcurLinkStats( minTimeout, timeout )
+    self._maxQueued = maxQueued
+    self._seq       = 0
+    self._verified  = False
+    self._lock      = asyncio.Lock()
+    self._queued    = 0
+    self._fut       = None
+    self._expect    = None
+    self._pool      = list()
+
+  @property
+  def addr(self):
+    return self._addr
+
+  @property
+  def stats(self):
+    return self._stats
+
+  # number of requests in flight or waiting
+  @property
+  def queued(self):
+    return self._queued
+
+  # RETURNS: an empty request (to be passed to 'execute')
+  def request(self):
+    req       = self._pool.pop() if len( self._pool ) > 0 else EcurReq()
+    req.owner = self
+    return req
+
+  # return a request to the pool; requests not handed out by 'request'
+  # (or already recycled) are ignored
+  def _recycle(self, req):
+    req.clear()
+    if ( req.owner is self ):
+      req.owner = None
+      self._pool.append( req )
+
+  def _nextSeq(self):
+    seq       = self._seq
+    self._seq = (self._seq + 1) & SEQ_MSK
+    return seq
+
+  def _deliver(self, data):
+    fut = self._fut
+    # the firmware echoes the header (except for the version
+    # command which carries the firmware's version)
+    if ( fut is None or fut.done() or len( data ) < HEADER_SIZE or data[1] != self._expect ):
+      self._stats.stale += 1
+      self._fleet.prt( 1, "EcurDevice {}: discarding stale/unexpected reply".format( self._addr ) )
+      return
+    fut.set_result( data )
+
+  def _abort(self, exc):
+    if ( not self._fut is None and not self._fut.done() ):
+      self._fut.set_exception( exc )
+
+  # Send the request and wait for the reply; the request is re-sent
+  # with the same sequence number if there is no reply within the
+  # retransmission timeout (see EcurLinkStats).
+  # RETURNS: the reply or None on timeout
+  async def _xfer(self, req):
+    req.setSeq( self._nextSeq() )
+    self._expect = req.seqByte
+    loop         = asyncio.get_running_loop()
+    st           = self._stats
+    try:
+      for attempt in range( self._retries ):
+        self._fut = loop.create_future()
+        st.sent( attempt )
+        await self._fleet._send( req.request, self._addr )
+        tsnd = loop.time()
+        try:
+          rep = await asyncio.wait_for( self._fut, st.timeout( attempt ) )
+          st.done( attempt + 1, loop.time() - tsnd )
+          return rep
+        except asyncio.TimeoutError:
+          self._fleet.prt( 1, "EcurDevice {}: timeout; retrying".format( self._addr ) )
+    finally:
+      self._fut = None
+    st.done( self._retries, None )
+    return None
+
+  async def _xferChecked(self, req):
+    try:
+      return await self._xfer( req )
+    except OSError as e:
+      self._fleet.prt( -1, "EcurDevice {}: UDP transfer failed: {}".format( self._addr, e ) )
+      return None
+
+  # Must be called with the lock held
+  async def _checkVersion(self):
+    req = self.request()
+    req.begin( CMD_VER )
+    try:
+      rep = await self._xferChecked( req )
+    finally:
+      self._recycle( req )
+    if ( rep is None ):
+      raise EcurError( ECUR_ERR_IO, "no response to version check from {}".format( self._addr ) )
+    seq, cmd, ver = unpackHeader( rep )
+    self._fleet.prt( 0, "EcurDevice {}: Version check reply: seq {:d}, cmd {:d}, version {:d}".format( self._addr, seq, cmd, ver ) )
+    if ( ver != PROTO_VERSION ):
+      raise EcurError( ECUR_ERR_INVALID_REP, "Firmware expects protocol version {:d}, we use {:d}".format( ver, PROTO_VERSION ) )
+    self._verified = True
+    return ver
+
+  # Execute 'fn' (a coroutine function) when it's our turn
+  async def _locked(self, fn, *args):
+    if ( self._queued >= self._maxQueued ):
+      raise EcurError( ECUR_ERR_NOSPACE_REQ, "too many requests queued for {}".format( self._addr ) )
+    self._queued += 1
+    try:
+      async with self._lock:
+        return await fn( *args )
+    finally:
+      self._queued -= 1
+
+  async def _runChecked(self, req):
+    if ( not self._verified ):
+      await self._checkVersion()
+    return await self._xferChecked( req )
+
+  # RETURNS: the reply or None on timeout
+  async def _run(self, req):
+    return await self._locked( self._runChecked, req )
+
+  # Execute the request; a request obtained from 'request' is recycled
+  # and must not be used afterwards.
+  # RETURNS: number of elements processed
+  async def execute(self, req):
+    try:
+      if ( req.empty ):
+        return 0
+      try:
+        rep = await self._run( req )
+      except:
+        req.clear()
+        req.flush( 0, ECUR_ERR_IO )
+        raise
+      if ( rep is None ):
+        req.clear()
+        req.flush( 0, ECUR_ERR_IO )
+        raise EcurError( ECUR_ERR_IO, "UDP transfer to {} failed".format( self._addr ) )
+      return req.processReply( rep, len( rep ) )
+    finally:
+      self._recycle( req )
+
+  # Send a raw request (the sequence number is re-assigned) and wait
+  # for the reply.
+  # RETURNS: the reply (bytes) or None on timeout
+  async def xferRaw(self, payload):
+    return await self._run( EcurRawReq( payload ) )
+
+  # RETURNS: the firmware's protocol version
+  async def checkVersion(self):
+    return await self._locked( self._checkVersion )
+
+  # Wrappers for single operations; reads return the data
+  async def read8(self, addr, n = 1, data = None):
+    req  = self.request()
+    data = req.qRead8( addr, n, data )
+    await self.execute( req )
+    return data
+
+  async def read16(self, addr, n = 1, data = None):
+    req  = self.request()
+    data = req.qRead16( addr, n, data )
+    await self.execute( req )
+    return data
+
+  async def read32(self, addr, n = 1, data = None):
+    req  = self.request()
+    data = req.qRead32( addr, n, data )
+    await self.execute( req )
+    return data
+
+  async def write8(self, addr, data, n = None):
+    req  = self.request()
+    req.qWrite8( addr, data, n )
+    return await self.execute( req )
+
+  async def write16(self, addr, data, n = None):
+    req  = self.request()
+    req.qWrite16( addr, data, n )
+    return await self.execute( req )
+
+  async def write32(self, addr, data, n = None):
+    req  = self.request()
+    req.qWrite32( addr, data, n )
+    return await self.execute( req )
+
+class EcurFleet(object):
+
+  # maximal retransmission timeout and max. number of attempts (see EcurLinkStats)
+  TIMEOUT    = EcurLinkStats.MAX_RTO
+  RETRIES    = 8
+  MAX_QUEUED = 16
+
+  # All datagrams are logged to the 'recorder' (EcurRecorder), if given.
+  def __init__(self, localAddr = ("0.0.0.0", 0), verbosity = 0, timeout = TIMEOUT, retries = RETRIES, maxQueued = MAX_QUEUED, minTimeout = EcurLinkStats.MIN_RTO, recorder = None):
+    super().__init__()
+    self._rec       = recorder
+    self._localAddr = localAddr
+    self._dbg       = verbosity
+    self._minTmo    = minTimeout
+    self._tmo       = timeout
+    self._retries   = retries
+    self._maxQueued = maxQueued
+    self._devs      = dict()
+    self._transport = None
+    self._writable  = None
+
+  async def open(self):
+    loop           = asyncio.get_running_loop()
+    self._writable = asyncio.Event()
+    self._writable.set()
+    await loop.create_datagram_endpoint( lambda: EcurProtocol( self ), local_addr = self._localAddr )
+    return self
+
+  def close(self):
+    if ( not self._transport is None ):
+      self._transport.close()
+      self._transport = None
+
+  async def __aenter__(self):
+    return await self.open()
+
+  async def __aexit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+  @property
+  def verbosity(self):
+    return self._dbg
+
+  def prt(self, level, msg):
+    if ( self._dbg > level ):
+      print( msg )
+
+  # RETURNS: the device at 'ip' ('destIP' must be numerical or resolvable;
+  #          replies are matched by source address)
+  def device(self, destIP, destPort = DEFAULT_PORT, timeout = None, retries = None, maxQueued = None, minTimeout = None):
+    addr = ( socket.gethostbyname( destIP ), destPort )
+    dev  = self._devs.get( addr )
+    if ( dev is None ):
+      dev = EcurDevice( self,
+                        addr,
+                        self._tmo       if timeout   is None else timeout,
+                        self._retries   if retries   is None else retries,
+                        self._maxQueued if maxQueued is None else maxQueued,
+                        self._minTmo    if minTimeout is None else minTimeout )
+      self._devs[addr] = dev
+    return dev
+
+  @property
+  def devices(self):
+    return list( self._devs.values() )
+
+  # RETURNS: statistics of all devices (dictionary indexed by address)
+  def stats(self):
+    return { d.addr : d.stats for d in self._devs.values() }
+
+  # Run the coroutine function 'fn( device )' on all devices concurrently.
+  # RETURNS: list of results (or exceptions) in the order of 'devices'
+  async def sweep(self, fn, devices = None):
+    if ( devices is None ):
+      devices = self.devices
+    return await asyncio.gather( *[ fn( d ) for d in devices ], return_exceptions = True )
+
+  def _connected(self, transport):
+    self._transport = transport
+
+  def _disconnected(self, exc):
+    self._transport = None
+    # wake up the senders; they fail when trying to send
+    self._writable.set()
+    for d in self._devs.values():
+      d._abort( EcurError( ECUR_ERR_IO, "socket closed" ) )
+
+  def _dispatch(self, data, addr):
+    if ( not self._rec is None ):
+      self._rec.reply( addr, data )
+    dev = self._devs.get( addr[0:2] )
+    if ( dev is None ):
+      self.prt( 1, "EcurFleet: discarding reply from unknown source {}".format( addr ) )
+      return
+    dev._deliver( data )
+
+  async def _send(self, data, addr):
+    await self._writable.wait()
+    if ( self._transport is None ):
+      raise EcurError( ECUR_ERR_IO, "socket not open" )
+    self._transport.sendto( data, addr )
+    if ( not self._rec is None ):
+      self._rec.request( addr, data )
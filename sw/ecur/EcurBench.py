@@ -0,0 +1,348 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Latency/throughput benchmark for Udp2Bus targets:
+#
+#   python3 -m ecur.EcurBench -a 10.10.10.10 -b 0x10000
+#   python3 -m ecur.EcurBench -S -l 0.0005              # local stand-in
+#   python3 -m ecur.EcurBench -S -C ./libecur.so        # also run libecur
+#                                                       # (make libecur.so)
+#
+# Workloads ('mixes'); every datagram is executed synchronously:
+#
+#   single  : one 32-bit read per datagram
+#   burst   : 256-word (32-bit) burst reads, as many as fit the datagram
+#   scatter : 32-bit writes to random addresses, packed to MTU
+#   mixed   : random 8/16/32-bit reads and writes (bursts of 1..16) to
+#             random addresses, packed to MTU
+#
+# The datagrams are generated up-front (and re-used) so that the time
+# spent in the benchmark is (mostly) spent in the client. Reported are
+# operations (transfers) and payload bytes per second and the latency
+# (execution time) of the datagrams.
+#
+# The access window ('-b', '-w') must be safe to read and write!
+
+import sys
+import time
+import ctypes
+import random
+from   ecur.EcurProto import *
+from   ecur.Ecur      import Ecur
+
+# A batch (datagram) is a list of (rdnwr, width, addr, values-or-count);
+# RETURNS: list of batches
+def mkBatches(mix, base, window, nBatches = 64, seed = 0):
+  rnd = random.Random( seed )
+
+  def fits(xlen, rlen, rdnwr, width, n):
+    if ( rdnwr ):
+      return xlen + CMD_SIZE <= BUFSZ and rlen + dataSize( laneCode( 0, width ), n ) <= BUFSZ - STATUS_SIZE
+    return xlen + CMD_SIZE + dataSize( laneCode( 0, width ), n ) <= BUFSZ
+
+  def size(xlen, rlen, rdnwr, width, n):
+    d = dataSize( laneCode( 0, width ), n )
+    return ( xlen + CMD_SIZE, rlen + d ) if rdnwr else ( xlen + CMD_SIZE + d, rlen )
+
+  batches = list()
+  for b in range( nBatches ):
+    ops  = list()
+    xlen = HEADER_SIZE
+    rlen = HEADER_SIZE
+    while True:
+      if   ( "single" == mix ):
+        op = ( True, 4, base, 1 )
+      elif ( "burst" == mix ):
+        n  = min( MAX_BURST, window // 4 )
+        op = ( True, 4, base, n )
+        if ( not fits( xlen, rlen, True, 4, n ) ):
+          # fill the rest of the datagram
+          n  = ( BUFSZ - STATUS_SIZE - rlen ) // 4
+          op = ( True, 4, base, n ) if n > 0 else None
+      elif ( "scatter" == mix ):
+        op = ( False, 4, base + 4 * rnd.randrange( window // 4 ), [ rnd.getrandbits( 32 ) ] )
+      elif ( "mixed" == mix ):
+        w  = rnd.choice( [ 1, 2, 4 ] )
+        n  = rnd.randrange( 1, 17 )
+        a  = base + w * rnd.randrange( ( window - n * w ) // w )
+        if ( rnd.random() < 0.5 ):
+          op = ( True, w, a, n )
+        else:
+          op = ( False, w, a, [ rnd.getrandbits( 8 * w ) for i in range( n ) ] )
+      else:
+        raise ValueError( "unknown mix '{}'".format( mix ) )
+      if ( op is None ):
+        break
+      n = op[3] if op[0] else len( op[3] )
+      if ( not fits( xlen, rlen, op[0], op[1], n ) or ( op[0] and sum( [ 1 for o in ops if o[0] ] ) >= MAX_READERS ) ):
+        break
+      xlen, rlen = size( xlen, rlen, op[0], op[1], n )
+      ops.append( op )
+      if ( "single" == mix ):
+        break
+    batches.append( ops )
+  return batches
+
+# RETURNS: (transfers, payload bytes) of a batch
+def batchLoad(ops):
+  nops   = 0
+  nbytes = 0
+  for rdnwr, width, addr, v in ops:
+    n       = v if rdnwr else len( v )
+    nops   += n
+    nbytes += n * width
+  return nops, nbytes
+
+class EcurPyDriver(object):
+
+  name = "python"
+
+  def __init__(self, ip, port):
+    super().__init__()
+    self._e = Ecur( ip, port )
+
+  # RETURNS: a callable which queues and executes the batch
+  def prepare(self, ops):
+    e  = self._e
+    rd = { 1 : e.qRead8,  2 : e.qRead16,  4 : e.qRead32  }
+    wr = { 1 : e.qWrite8, 2 : e.qWrite16, 4 : e.qWrite32 }
+    calls = list()
+    for rdnwr, width, addr, v in ops:
+      if ( rdnwr ):
+        calls.append( ( rd[width], ( addr, v ) ) )
+      else:
+        calls.append( ( wr[width], ( addr, v ) ) )
+    def run():
+      for fn, args in calls:
+        fn( *args )
+      return e.execute
+    return run
+
+  def close(self):
+    self._e.close()
+
+# libecur (C) via ctypes
+class EcurCDriver(object):
+
+  name = "libecur"
+
+  def __init__(self, ip, port, libPath):
+    super().__init__()
+    lib = ctypes.CDLL( libPath )
+    lib.ecurOpen.restype   = ctypes.c_void_p
+    lib.ecurOpen.argtypes  = [ ctypes.c_char_p, ctypes.c_uint, ctypes.c_int ]
+    lib.ecurClose.argtypes = [ ctypes.c_void_p ]
+    lib.ecurExecute.argtypes = [ ctypes.c_void_p ]
+    for w in [ 8, 16, 32 ]:
+      fn = getattr( lib, "ecurQRead{:d}".format( w ) )
+      fn.argtypes = [ ctypes.c_void_p, ctypes.c_uint32, ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p ]
+      fn = getattr( lib, "ecurQWrite{:d}".format( w ) )
+      fn.argtypes = [ ctypes.c_void_p, ctypes.c_uint32, ctypes.c_void_p, ctypes.c_uint ]
+    self._lib = lib
+    self._e   = lib.ecurOpen( ip.encode(), port, 0 )
+    if ( not self._e ):
+      raise EcurError( ECUR_ERR_IO, "ecurOpen() failed" )
+    # read-back data of a batch never exceed a datagram
+    self._rbuf = ctypes.create_string_buffer( 2 * BUFSZ )
+    self._keep = list()
+
+  def prepare(self, ops):
+    lib   = self._lib
+    e     = self._e
+    typ   = { 1 : ctypes.c_uint8, 2 : ctypes.c_uint16, 4 : ctypes.c_uint32 }
+    calls = list()
+    roff  = 0
+    for rdnwr, width, addr, v in ops:
+      if ( rdnwr ):
+        fn    = getattr( lib, "ecurQRead{:d}".format( 8 * width ) )
+        roff  = ( roff + width - 1 ) // width * width
+        args  = ( e, addr, ctypes.addressof( self._rbuf ) + roff, v, None, None )
+        roff += v * width
+      else:
+        fn    = getattr( lib, "ecurQWrite{:d}".format( 8 * width ) )
+        buf   = ( typ[width] * len( v ) )( *v )
+        self._keep.append( buf )
+        args  = ( e, addr, ctypes.addressof( buf ), len( v ) )
+      calls.append( ( fn, args ) )
+    execute = lib.ecurExecute
+    def xfer():
+      st = execute( e )
+      if ( st < 0 ):
+        raise EcurError( st, "ecurExecute() failed" )
+      return st
+    def run():
+      for fn, args in calls:
+        st = fn( *args )
+        if ( st < 0 ):
+          raise EcurError( st, "libecur: queueing operation failed" )
+      return xfer
+    return run
+
+  def close(self):
+    self._lib.ecurClose( self._e )
+    self._e = None
+
+class EcurBenchResult(object):
+
+  PERCENTILES = [ 50.0, 99.0, 99.9 ]
+
+  def __init__(self, driver, mix, lat, nops, nbytes, elapsed):
+    super().__init__()
+    self.driver  = driver
+    self.mix     = mix
+    self.lat     = sorted( lat )
+    self.nops    = nops
+    self.nbytes  = nbytes
+    self.elapsed = elapsed
+
+  def percentile(self, p):
+    return self.lat[ min( len( self.lat ) - 1, int( p/100.0 * len( self.lat ) ) ) ]
+
+  @property
+  def opsPerSec(self):
+    return self.nops / self.elapsed
+
+  @property
+  def bytesPerSec(self):
+    return self.nbytes / self.elapsed
+
+  @property
+  def datagramsPerSec(self):
+    return len( self.lat ) / self.elapsed
+
+  def summary(self):
+    pct = ", ".join( [ "p{:g} {:8.1f}us".format( p, 1.0e6 * self.percentile( p ) ) for p in self.PERCENTILES ] )
+    return "{:8s} {:8s}: {:10.0f} ops/s {:10.3f} MB/s {:8.0f} dgrams/s; latency {}".format(
+             self.driver, self.mix, self.opsPerSec, self.bytesPerSec / 1.0e6, self.datagramsPerSec, pct )
+
+  # latency histogram (power-of-two microsecond buckets)
+  def histogram(self, width = 50):
+    bins = dict()
+    for l in self.lat:
+      b = max( 0, int( 1.0e6 * l ).bit_length() - 1 )
+      bins[b] = bins.get( b, 0 ) + 1
+    mx  = max( bins.values() )
+    txt = list()
+    for b in range( min( bins.keys() ), max( bins.keys() ) + 1 ):
+      n = bins.get( b, 0 )
+      txt.append( "  {:>8d}us .. {:>8d}us {:8d} {}".format( 1 << b, 2 << b, n, "#" * int( round( width * n / mx ) ) ) )
+    return "\n".join( txt )
+
+# Run 'iterations' datagrams of 'mix' (or for 'duration' seconds if given)
+# RETURNS: EcurBenchResult
+def runBench(driver, mix, base, window, iterations = 1000, duration = None):
+  batches = mkBatches( mix, base, window )
+  runs    = [ driver.prepare( b ) for b in batches ]
+  loads   = [ batchLoad( b ) for b in batches ]
+  lat     = list()
+  nops    = 0
+  nbytes  = 0
+  i       = 0
+  now     = time.perf_counter
+  t0      = now()
+  tend    = None if duration is None else t0 + duration
+  while ( ( tend is None and i < iterations ) or ( not tend is None and now() < tend ) ):
+    k       = i % len( runs )
+    execute = runs[k]()
+    t       = now()
+    execute()
+    lat.append( now() - t )
+    nops   += loads[k][0]
+    nbytes += loads[k][1]
+    i      += 1
+  return EcurBenchResult( driver.name, mix, lat, nops, nbytes, now() - t0 )
+
+MIXES = [ "single", "burst", "scatter", "mixed" ]
+
+if __name__ == "__main__":
+
+  import getopt
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "ha:p:b:w:m:n:t:C:Sl:L:H" )
+
+  ip       = None
+  port     = DEFAULT_PORT
+  base     = 0
+  window   = 0x4000
+  mixes    = MIXES
+  iters    = 1000
+  duration = None
+  clib     = None
+  local    = False
+  latency  = 0.0
+  loss     = 0.0
+  hist     = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-hSH] [-a ip] [-p port] [-b base] [-w window] [-m mix[,mix]] [-n iterations] [-t seconds] [-C libecur.so] [-l latency] [-L loss]".format( sys.argv[0] ))
+      print("  Udp2Bus latency/throughput benchmark")
+      print("   -h   : print this message")
+      print("   -a   : target IP address (default: ECUR_TARGET_IP env-var)")
+      print("   -p   : target port (default: {:d})".format( port ))
+      print("   -b   : base (byte-) address of the window accessed (default: 0)")
+      print("   -w   : size of the window in bytes (default: 0x{:x}); must be safe to write!".format( window ))
+      print("   -m   : comma-separated list of mixes (default: {})".format( ",".join( MIXES ) ))
+      print("   -n   : number of datagrams per mix (default: {:d})".format( iters ))
+      print("   -t   : run each mix for a number of seconds (instead of -n)")
+      print("   -C   : path to libecur.so; compare with the C library")
+      print("   -S   : run against a local stand-in (ecur.EcurServer)")
+      print("   -l   : latency of the local stand-in (seconds)")
+      print("   -L   : loss probability of the local stand-in")
+      print("   -H   : print latency histograms")
+      sys.exit(0)
+    elif opt[0] in ('-a'):
+      ip       = opt[1]
+    elif opt[0] in ('-p'):
+      port     = int( opt[1], 0 )
+    elif opt[0] in ('-b'):
+      base     = int( opt[1], 0 )
+    elif opt[0] in ('-w'):
+      window   = int( opt[1], 0 )
+    elif opt[0] in ('-m'):
+      mixes    = opt[1].split(",")
+    elif opt[0] in ('-n'):
+      iters    = int( opt[1], 0 )
+    elif opt[0] in ('-t'):
+      duration = float( opt[1] )
+    elif opt[0] in ('-C'):
+      clib     = opt[1]
+    elif opt[0] in ('-S'):
+      local    = True
+    elif opt[0] in ('-l'):
+      latency  = float( opt[1] )
+    elif opt[0] in ('-L'):
+      loss     = float( opt[1] )
+    elif opt[0] in ('-H'):
+      hist     = True
+
+  srv = None
+  if ( local ):
+    from ecur.EcurServer import EcurServer
+    srv  = EcurServer( latency = latency, reqLoss = loss, repLoss = loss ).start()
+    ip   = "127.0.0.1"
+    port = srv.port
+
+  drivers = [ EcurPyDriver( ip, port ) ]
+  if ( not clib is None ):
+    try:
+      drivers.append( EcurCDriver( ip if not ip is None else "", port, clib ) )
+    except OSError as e:
+      print( "WARNING -- unable to load libecur ({}); skipping".format( e ), file = sys.stderr )
+
+  try:
+    for mix in mixes:
+      for d in drivers:
+        res = runBench( d, mix, base, window, iters, duration )
+        print( res.summary() )
+        if ( hist ):
+          print( res.histogram() )
+  finally:
+    for d in drivers:
+      d.close()
+    if ( not srv is None ):
+      srv.close()
@@ -0,0 +1,252 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Shadow-register cache with write-combining.
+#
+# Registers are declared in a register map (EcurRegMap):
+#
+#   HOST     : only written by us; reads are served from a local shadow
+#              (after the first remote read or write) and writes are
+#              buffered -- writes to the same address collapse (last
+#              write wins).
+#   VOLATILE : always accessed remotely (e.g., counters or status).
+#              Buffered writes are flushed first: they form a planner
+#              phase of their own which the target executes before the
+#              VOLATILE access (they may share a datagram).
+#
+# Undeclared addresses are VOLATILE. Buffered writes are flushed (as
+# bursts, see EcurPlanner, i.e., in address order) by 'flush()', when
+# the cache is used as a context manager ('with cache:'), before a
+# VOLATILE access or when the oldest buffered write is older than
+# 'flushWindow' seconds. NOTE: there is no timer; the window is only
+# checked when the cache is accessed, i.e., while the cache is idle
+# buffered writes remain pending indefinitely -- call 'flush()' (or use
+# a 'with' block) if they must reach the target.
+#
+#   m = EcurRegMap()
+#   m.declare( 0x1000, 64 )                    # 16 32-bit config registers
+#   m.declare( 0x2000, 88, EcurRegMap.VOLATILE )
+#   c = EcurCache( ecur, m, flushWindow = 0.01 )
+#   c.update( 0x1004, 4, 0x00f0, 0x0030 )      # read-modify-write
+#   c.read( 0x2000 )                           # flushes, then reads
+
+import time
+import bisect
+from   ecur.EcurProto   import *
+from   ecur.EcurPlanner import EcurPlanner
+
+class EcurRegMap(object):
+
+  HOST     = "host"
+  VOLATILE = "volatile"
+
+  def __init__(self):
+    super().__init__()
+    # sorted, non-overlapping (start, end, policy)
+    self._starts  = list()
+    self._regions = list()
+
+  # declare 'nbytes' starting at byte-address 'addr'
+  def declare(self, addr, nbytes = 4, policy = HOST):
+    if ( not policy in (self.HOST, self.VOLATILE) ):
+      raise ValueError( "invalid policy '{}'".format( policy ) )
+    i = bisect.bisect_right( self._starts, addr )
+    if ( ( i > 0 and self._regions[i-1][1] > addr ) or ( i < len( self._starts ) and self._starts[i] < addr + nbytes ) ):
+      raise ValueError( "region 0x{:x}..0x{:x} overlaps a declared region".format( addr, addr + nbytes - 1 ) )
+    self._starts.insert( i, addr )
+    self._regions.insert( i, (addr, addr + nbytes, policy) )
+    return self
+
+  def policy(self, addr, width = 1):
+    i = bisect.bisect_right( self._starts, addr ) - 1
+    if ( i >= 0 and addr + width <= self._regions[i][1] ):
+      return self._regions[i][2]
+    return self.VOLATILE
+
+class EcurCacheStats(object):
+
+  def __init__(self):
+    super().__init__()
+    self.reset()
+
+  def reset(self):
+    self.reads     = 0  # reads issued by the user
+    self.hits      = 0  # ... served from the shadow
+    self.writes    = 0  # writes issued by the user
+    self.combined  = 0  # ... collapsed with a buffered write
+    self.remote    = 0  # accesses sent to the target
+    self.datagrams = 0  # datagrams sent
+
+  def __str__(self):
+    return "reads {:d} (hits {:d}), writes {:d} (combined {:d}), remote accesses {:d}, datagrams {:d}".format(
+             self.reads, self.hits, self.writes, self.combined, self.remote, self.datagrams )
+
+class EcurCache(object):
+
+  def __init__(self, ecur, regMap = None, flushWindow = None):
+    super().__init__()
+    self._ecur    = ecur
+    self._map     = EcurRegMap() if regMap is None else regMap
+    self._window  = flushWindow
+    self._planner = EcurPlanner()
+    # byte-address -> byte value
+    self._shadow  = dict()
+    # addr -> (width, value)
+    self._wbuf    = dict()
+    self._wbytes  = set()
+    self._tfirst  = None
+    self._stats   = EcurCacheStats()
+
+  @property
+  def regMap(self):
+    return self._map
+
+  @property
+  def stats(self):
+    return self._stats
+
+  @property
+  def pending(self):
+    return len( self._wbuf )
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.flush()
+
+  @staticmethod
+  def _mask(width):
+    return ( 1 << (8*width) ) - 1
+
+  def _setShadow(self, addr, width, value):
+    for i in range( width ):
+      self._shadow[addr + i] = ( value >> (8*i) ) & 0xff
+
+  def _getShadow(self, addr, width):
+    v = 0
+    for i in range( width ):
+      b = self._shadow.get( addr + i )
+      if ( b is None ):
+        return None
+      v |= b << (8*i)
+    return v
+
+  # drop cached values ('addr' None: everything)
+  def invalidate(self, addr = None, nbytes = 4):
+    if ( addr is None ):
+      self._shadow.clear()
+    else:
+      for i in range( addr, addr + nbytes ):
+        self._shadow.pop( i, None )
+
+  def _expired(self):
+    return ( not self._window is None and not self._tfirst is None and time.monotonic() - self._tfirst >= self._window )
+
+  # Add the buffered writes to the planner, followed by a barrier so
+  # that accesses added by the caller are executed after them.
+  # RETURNS: the write accesses
+  def _planWrites(self):
+    p = self._planner
+    w = list()
+    for addr, (width, val) in self._wbuf.items():
+      w.append( p.write( addr, width, val ) )
+    p.barrier()
+    self._wbuf.clear()
+    self._wbytes.clear()
+    self._tfirst = None
+    return w
+
+  # Execute everything in the planner in as few datagrams as possible;
+  # 'w' are the buffered writes (see '_planWrites').
+  def _execute(self, w):
+    p = self._planner
+    self._stats.remote += len( p.ops )
+    try:
+      p.execute( self._ecur )
+    finally:
+      self._stats.datagrams += p.datagrams
+      # also if the transfer failed altogether
+      for op in w:
+        if ( not op.ok ):
+          # the shadow no longer reflects the target
+          self.invalidate( op.addr, op.width )
+    if ( len( p.failed ) > 0 ):
+      raise p.failed[0].error
+
+  # Write all buffered writes to the target
+  def flush(self):
+    if ( len( self._wbuf ) > 0 ):
+      self._execute( self._planWrites() )
+
+  def _checkWindow(self):
+    if ( self._expired() ):
+      self.flush()
+
+  def read(self, addr, width = 4):
+    laneCode( addr, width )
+    self._stats.reads += 1
+    self._checkWindow()
+    if ( EcurRegMap.HOST == self._map.policy( addr, width ) ):
+      v = self._getShadow( addr, width )
+      if ( not v is None ):
+        self._stats.hits += 1
+        return v
+      # a buffered write overlapping this register must go first
+      if ( not self._wbytes.isdisjoint( range( addr, addr + width ) ) ):
+        self.flush()
+      op = self._planner.read( addr, width )
+      p  = self._planner
+      self._stats.remote += 1
+      try:
+        p.execute( self._ecur )
+      finally:
+        self._stats.datagrams += p.datagrams
+      if ( not op.ok ):
+        raise op.error
+      self._setShadow( addr, width, op.value )
+      return op.value
+    w  = self._planWrites()
+    op = self._planner.read( addr, width )
+    self._execute( w )
+    return op.value
+
+  def write(self, addr, width, value):
+    laneCode( addr, width )
+    value &= self._mask( width )
+    self._stats.writes += 1
+    if ( EcurRegMap.HOST == self._map.policy( addr, width ) ):
+      b = range( addr, addr + width )
+      if ( addr in self._wbuf and self._wbuf[addr][0] == width ):
+        self._stats.combined += 1
+      elif ( not self._wbytes.isdisjoint( b ) ):
+        # overlaps a buffered write of different width/alignment
+        self.flush()
+      if ( self._tfirst is None ):
+        self._tfirst = time.monotonic()
+      self._wbuf[addr] = (width, value)
+      self._wbytes.update( b )
+      self._setShadow( addr, width, value )
+      self._checkWindow()
+    else:
+      w = self._planWrites()
+      self._planner.write( addr, width, value )
+      self._execute( w )
+
+  # read-modify-write: bits set in 'mask' are replaced by those in 'value'
+  def update(self, addr, width, mask, value):
+    old = self.read( addr, width )
+    new = ( old & ~mask ) | ( value & mask )
+    if ( new != old ):
+      self.write( addr, width, new )
+    return new
+
+  def setBits(self, addr, width, bits):
+    return self.update( addr, width, bits, bits )
+
+  def clrBits(self, addr, width, bits):
+    return self.update( addr, width, bits, 0 )
@@ -0,0 +1,299 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Poller for the firmware's network statistics counters (the block of 22
+# counters printed by ecurPrintNetStats()):
+#
+#   python3 -m ecur.EcurNetStats -a 10.10.10.10 -b 0x1000 -r 100 -P /var/lib/node_exporter/ecur.prom
+#
+# The block is read in a single burst; the counters are narrow (13 bits,
+# see StatCounterType in Lan9254ESCPkg.vhd) and wrap around -- deltas are
+# computed modulo 2^counterBits (the poll rate must be high enough for a
+# counter not to wrap more than once between polls) and accumulated into
+# 64-bit totals. Timestamps, deltas and rates of the last 'depth' polls
+# are kept in (fixed-size) numpy ring buffers.
+#
+# Export formats:
+#   - Prometheus text file (for the node_exporter 'textfile' collector);
+#     written atomically.
+#   - compact binary time series (EcurNetStatsWriter): a header followed
+#     by fixed-size records (timestamp + 16-bit deltas); see
+#     'readNetStats'.
+
+import os
+import sys
+import time
+import struct
+import numpy
+from   ecur.EcurProto import *
+
+# (same order as ecur.c)
+NET_STATS_LABELS = [
+  "mbxPkts",
+  "rxpPDOs",
+  "eoeFrgs",
+  "eoeFrms",
+  "eoeDrps",
+  "nMacDrp",
+  "nShtDrp",
+  "nArpHdr",
+  "nIP4Hdr",
+  "nUnkHdr",
+  "nArpDrp",
+  "nArpReq",
+  "nIP4Drp",
+  "nPinReq",
+  "nUdpReq",
+  "nUnkIP4",
+  "nIP4Mis",
+  "nPinDrp",
+  "nPinHdr",
+  "nUdpMis",
+  "nUdpHdr",
+  "nPktFwd",
+]
+
+class EcurNetStats(object):
+
+  COUNTER_BITS = 13
+  DEPTH        = 3600
+
+  def __init__(self, ecur, locbas, depth = DEPTH, counterBits = COUNTER_BITS, labels = NET_STATS_LABELS):
+    super().__init__()
+    n             = len( labels )
+    self._ecur    = ecur
+    self._locbas  = locbas
+    self._labels  = list( labels )
+    self._msk     = ( 1 << counterBits ) - 1
+    self._depth   = depth
+    self._raw     = numpy.zeros( n, dtype = numpy.uint32 )
+    self._prev    = None
+    self._tprev   = None
+    self._totals  = numpy.zeros( n, dtype = numpy.uint64 )
+    # ring buffers
+    self._t       = numpy.zeros( depth, dtype = numpy.float64 )
+    self._deltas  = numpy.zeros( (depth, n), dtype = numpy.uint32 )
+    self._rates   = numpy.zeros( (depth, n), dtype = numpy.float64 )
+    self._head    = 0
+    self._fill    = 0
+    # indices of the counters which count dropped packets
+    self._drops   = [ i for i in range( n ) if "Drp" in self._labels[i] ]
+    self._sinks   = list()
+
+  @property
+  def labels(self):
+    return self._labels
+
+  @property
+  def totals(self):
+    return self._totals
+
+  @property
+  def dropIndices(self):
+    return self._drops
+
+  # 'sink( stats, t, deltas, rates )' is called after every poll (but
+  # the first one which only establishes the baseline)
+  def addSink(self, sink):
+    self._sinks.append( sink )
+
+  # Read the counters.
+  # RETURNS: (t, deltas, rates) or None for the first poll
+  def poll(self):
+    self._ecur.read32( self._locbas, len( self._labels ), self._raw )
+    t   = time.time()
+    cur = self._raw & self._msk
+    if ( self._prev is None ):
+      self._prev  = cur.copy()
+      self._tprev = t
+      return None
+    deltas         = ( cur - self._prev ) & self._msk
+    dt             = t - self._tprev
+    rates          = deltas / dt if dt > 0 else numpy.zeros( len( deltas ) )
+    self._prev[:]  = cur
+    self._tprev    = t
+    self._totals  += deltas
+    h              = self._head
+    self._t[h]     = t
+    self._deltas[h]= deltas
+    self._rates[h] = rates
+    self._head     = ( h + 1 ) % self._depth
+    self._fill     = min( self._fill + 1, self._depth )
+    for s in self._sinks:
+      s( self, t, deltas, rates )
+    return t, deltas, rates
+
+  # Poll every 'period' seconds (absolute schedule, i.e., no drift)
+  # 'count' times (forever if None).
+  def run(self, period, count = None):
+    tnext = time.monotonic()
+    i     = 0
+    while ( count is None or i < count ):
+      self.poll()
+      i     += 1
+      tnext += period
+      dly    = tnext - time.monotonic()
+      if ( dly > 0 ):
+        time.sleep( dly )
+      else:
+        # we are late; don't try to catch up
+        tnext = time.monotonic()
+
+  # RETURNS: (t, deltas, rates) of the last 'n' polls (all if None) in
+  #          chronological order (copies)
+  def history(self, n = None):
+    if ( n is None or n > self._fill ):
+      n = self._fill
+    idx = ( numpy.arange( self._head - n, self._head ) ) % self._depth
+    return self._t[idx], self._deltas[idx], self._rates[idx]
+
+  def promText(self, prefix = "ecur_net", target = None):
+    lbl = "" if target is None else '{{target="{}"}}'.format( target )
+    txt = list()
+    last = None
+    if ( self._fill > 0 ):
+      last = self._rates[ (self._head - 1) % self._depth ]
+    for i in range( len( self._labels ) ):
+      nam = "{}_{}".format( prefix, self._labels[i] )
+      txt.append( "# TYPE {}_total counter".format( nam ) )
+      txt.append( "{}_total{} {:d}".format( nam, lbl, int( self._totals[i] ) ) )
+      if ( not last is None ):
+        txt.append( "# TYPE {}_rate gauge".format( nam ) )
+        txt.append( "{}_rate{} {:.6g}".format( nam, lbl, last[i] ) )
+    return "\n".join( txt ) + "\n"
+
+  # write Prometheus text file (atomically; the textfile collector must
+  # never see a partial file)
+  def writePrometheus(self, fnam, prefix = "ecur_net", target = None):
+    tmp = fnam + ".tmp"
+    with open( tmp, "w" ) as f:
+      f.write( self.promText( prefix, target ) )
+    os.replace( tmp, fnam )
+
+# Binary time series:
+#
+#   header : magic 'ECNS', version (u16), number of counters (u16),
+#            counter bits (u16), reserved (u16),
+#            labels (8 bytes each, NUL-padded)
+#   record : time (f64, seconds since the epoch), deltas (u16 each)
+#
+# All little-endian.
+class EcurNetStatsWriter(object):
+
+  MAGIC   = b'ECNS'
+  VERSION = 1
+  HDR     = struct.Struct( "<4sHHHH" )
+
+  def __init__(self, fnam, stats, counterBits = EcurNetStats.COUNTER_BITS):
+    super().__init__()
+    n          = len( stats.labels )
+    self._rec  = numpy.zeros( 1, dtype = recordDtype( n ) )
+    exists     = os.path.exists( fnam ) and os.path.getsize( fnam ) > 0
+    self._f    = open( fnam, "ab" )
+    if ( not exists ):
+      self._f.write( self.HDR.pack( self.MAGIC, self.VERSION, n, counterBits, 0 ) )
+      for l in stats.labels:
+        self._f.write( l.encode()[0:8].ljust( 8, b'\0' ) )
+    stats.addSink( self )
+
+  def __call__(self, stats, t, deltas, rates):
+    self._rec["t"]      = t
+    # deltas of narrow counters always fit
+    self._rec["deltas"] = deltas
+    self._f.write( self._rec.tobytes() )
+    self._f.flush()
+
+  def close(self):
+    self._f.close()
+
+def recordDtype(n):
+  return numpy.dtype( [ ("t", "<f8"), ("deltas", "<u2", (n,)) ] )
+
+# RETURNS: labels, records (numpy structured array with fields 't' and
+#          'deltas')
+def readNetStats(fnam):
+  with open( fnam, "rb" ) as f:
+    buf = f.read()
+  magic, ver, n, bits, rsvd = EcurNetStatsWriter.HDR.unpack_from( buf, 0 )
+  if ( magic != EcurNetStatsWriter.MAGIC or ver != EcurNetStatsWriter.VERSION ):
+    raise ValueError( "'{}' is not a net-stats time series (version {:d})".format( fnam, EcurNetStatsWriter.VERSION ) )
+  off    = EcurNetStatsWriter.HDR.size
+  labels = [ buf[off + 8*i : off + 8*(i+1)].rstrip( b'\0' ).decode() for i in range( n ) ]
+  off   += 8*n
+  dt     = recordDtype( n )
+  nrec   = ( len( buf ) - off ) // dt.itemsize
+  return labels, numpy.frombuffer( buf, dtype = dt, count = nrec, offset = off )
+
+if __name__ == "__main__":
+
+  import getopt
+  from   ecur.Ecur import Ecur
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "ha:p:b:r:n:P:B:q" )
+
+  ip     = None
+  port   = DEFAULT_PORT
+  locbas = None
+  rate   = 10.0
+  count  = None
+  prom   = None
+  binf   = None
+  quiet  = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-hq] [-a ip] [-p port] -b locbas [-r rate] [-n count] [-P prom-file] [-B binary-file]".format( sys.argv[0] ))
+      print("  Poll the firmware's network statistics counters")
+      print("   -h   : print this message")
+      print("   -a   : target IP address (default: ECUR_TARGET_IP env-var)")
+      print("   -p   : target port (default: {:d})".format( port ))
+      print("   -b   : (byte-) address of the statistics counters")
+      print("   -r   : poll rate in Hz (default: {:g})".format( rate ))
+      print("   -n   : number of polls (default: forever)")
+      print("   -P   : write Prometheus text file (every poll)")
+      print("   -B   : append to binary time series file")
+      print("   -q   : quiet; do not report drops")
+      sys.exit(0)
+    elif opt[0] in ('-a'):
+      ip     = opt[1]
+    elif opt[0] in ('-p'):
+      port   = int( opt[1], 0 )
+    elif opt[0] in ('-b'):
+      locbas = int( opt[1], 0 )
+    elif opt[0] in ('-r'):
+      rate   = float( opt[1] )
+    elif opt[0] in ('-n'):
+      count  = int( opt[1], 0 )
+    elif opt[0] in ('-P'):
+      prom   = opt[1]
+    elif opt[0] in ('-B'):
+      binf   = opt[1]
+    elif opt[0] in ('-q'):
+      quiet  = True
+
+  if ( locbas is None ):
+    print( "Error: address of the statistics counters (-b) required", file = sys.stderr )
+    sys.exit(1)
+
+  e     = Ecur( ip, port )
+  stats = EcurNetStats( e, locbas )
+  if ( not binf is None ):
+    wr = EcurNetStatsWriter( binf, stats )
+  if ( not prom is None ):
+    stats.addSink( lambda s, t, d, r: s.writePrometheus( prom, target = ip ) )
+  if ( not quiet ):
+    def report(s, t, deltas, rates):
+      drp = [ "{}: {:d}".format( s.labels[i], int( deltas[i] ) ) for i in s.dropIndices if deltas[i] > 0 ]
+      if ( len( drp ) > 0 ):
+        print( "{} DROPS -- {}".format( time.strftime( "%H:%M:%S", time.localtime( t ) ), ", ".join( drp ) ) )
+    stats.addSink( report )
+  try:
+    stats.run( 1.0/rate, None if count is None else count + 1 )
+  except KeyboardInterrupt:
+    pass
+  for l, v in zip( stats.labels, stats.totals ):
+    print( "{}: {:8d}".format( l, int( v ) ) )
@@ -0,0 +1,310 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Transaction planner: collects individual register accesses and executes
+# them in as few bursts and datagrams as possible.
+#
+#   p = EcurPlanner()
+#   a = p.read ( 0x1000, 4 )
+#   b = p.read ( 0x1004, 4 )         # merged with 'a' into a burst of 2
+#   p.write( 0x2001, 1, 0xaa )
+#   p.execute( ecur )                # or: await p.executeAsync( device )
+#   if ( a.ok ): print( a.value )
+#
+# - accesses of the same width and direction to consecutive addresses
+#   are merged into bursts (of at most MAX_BURST transfers); identical
+#   reads are only executed once.
+# - the bursts are packed into datagrams in order; a burst which does
+#   not fit into the remaining request or reply space is split.
+# - accesses are reordered (to form bursts) but an access never moves
+#   across a preceding, overlapping access if one of them is a write;
+#   such an access starts a new 'phase' which is executed after the
+#   previous one. 'barrier()' starts a new phase explicitly.
+# - the target aborts a datagram at the first failing transfer; the
+#   status reports the number of successful transfers ('nelmsOK'). The
+#   corresponding access is flagged (its 'error' is set) and the rest of
+#   the datagram is re-submitted (unless 'stopOnError' is set in which
+#   case the remaining accesses are flagged as not executed).
+
+from   collections    import deque
+from   ecur.EcurProto import *
+from   ecur.Ecur      import EcurReq
+
+class EcurPlanOp(object):
+  __slots__ = ( "addr", "width", "rdnwr", "value", "error", "done", "cb" )
+
+  def __init__(self, addr, width, rdnwr, value = None, cb = None):
+    self.addr  = addr
+    self.width = width
+    self.rdnwr = rdnwr
+    self.value = value
+    self.error = None
+    self.done  = False
+    self.cb    = cb
+
+  @property
+  def ok(self):
+    return self.done and self.error is None
+
+  def complete(self, error = None):
+    self.error = error
+    self.done  = True
+    if ( not self.cb is None ):
+      self.cb( self )
+
+# a burst; each element is a list of the accesses it serves
+class EcurPlanRun(object):
+  __slots__ = ( "addr", "width", "rdnwr", "elms" )
+
+  def __init__(self, addr, width, rdnwr):
+    self.addr  = addr
+    self.width = width
+    self.rdnwr = rdnwr
+    self.elms  = list()
+
+  def lane(self, start):
+    return laneCode( self.addr + start * self.width, self.width )
+
+class EcurPlanPhase(object):
+
+  def __init__(self):
+    super().__init__()
+    # (width, addr) -> list of accesses
+    self._rd      = dict()
+    self._wr      = dict()
+    self._rdBytes = set()
+    self._wrBytes = set()
+
+  @property
+  def empty(self):
+    return 0 == len( self._rd ) + len( self._wr )
+
+  # RETURNS: False if 'op' conflicts with an access in this phase
+  def add(self, op):
+    b = range( op.addr, op.addr + op.width )
+    if ( op.rdnwr ):
+      if ( not self._wrBytes.isdisjoint( b ) ):
+        return False
+      self._rdBytes.update( b )
+      self._rd.setdefault( (op.width, op.addr), list() ).append( op )
+    else:
+      if ( not self._wrBytes.isdisjoint( b ) or not self._rdBytes.isdisjoint( b ) ):
+        return False
+      self._wrBytes.update( b )
+      self._wr[ (op.width, op.addr) ] = [ op ]
+    return True
+
+  @staticmethod
+  def _mkRuns(ops, rdnwr):
+    runs = list()
+    run  = None
+    for k in sorted( ops.keys() ):
+      w, a = k
+      if ( run is None or run.width != w or run.addr + len( run.elms ) * w != a ):
+        run = EcurPlanRun( a, w, rdnwr )
+        runs.append( run )
+      run.elms.append( ops[k] )
+    return runs
+
+  def runs(self):
+    return self._mkRuns( self._wr, False ) + self._mkRuns( self._rd, True )
+
+class EcurPlanner(object):
+
+  def __init__(self, stopOnError = False):
+    super().__init__()
+    self._stopOnError = stopOnError
+    self._req         = EcurReq()
+    self.reset()
+
+  # discard all accesses
+  def reset(self):
+    self._phases    = [ EcurPlanPhase() ]
+    self._ops       = list()
+    self._pending   = deque()
+    self._failed    = list()
+    self._datagrams = 0
+
+  def _add(self, op):
+    # check alignment
+    laneCode( op.addr, op.width )
+    checkOp( op.addr >> 2, 1 )
+    if ( not self._phases[-1].add( op ) ):
+      self._phases.append( EcurPlanPhase() )
+      self._phases[-1].add( op )
+    self._ops.append( op )
+    return op
+
+  # Add accesses; 'width' is 1, 2 or 4 (bytes); 'cb( op )' is executed
+  # when the access is completed (successfully or not).
+  # RETURNS: the access (EcurPlanOp); a read's value is available once
+  #          the access is 'done'
+  def read(self, addr, width = 4, cb = None):
+    return self._add( EcurPlanOp( addr, width, True, cb = cb ) )
+
+  def write(self, addr, width, value, cb = None):
+    return self._add( EcurPlanOp( addr, width, False, value, cb ) )
+
+  # Accesses added after the barrier are executed after all accesses
+  # added before it (they may still share a datagram).
+  def barrier(self):
+    if ( not self._phases[-1].empty ):
+      self._phases.append( EcurPlanPhase() )
+
+  @property
+  def ops(self):
+    return self._ops
+
+  # accesses which failed in the last execution
+  @property
+  def failed(self):
+    return self._failed
+
+  # number of datagrams used by the last execution
+  @property
+  def datagrams(self):
+    return self._datagrams
+
+  def _plan(self):
+    self._pending.clear()
+    self._datagrams = 0
+    for ph in self._phases:
+      for run in ph.runs():
+        for start in range( 0, len( run.elms ), MAX_BURST ):
+          self._pending.append( (run, start, min( MAX_BURST, len( run.elms ) - start )) )
+
+  @staticmethod
+  def _scatter(data, nelms, closure):
+    run, start = closure
+    for i in range( nelms ):
+      for op in run.elms[start + i]:
+        op.value = data[i]
+        op.complete()
+
+  # Fill 'req' with pending bursts (splitting the last one if necessary).
+  # RETURNS: list of the bursts (run, start, count) in the request
+  def _pack(self, req):
+    req.begin( CMD_RDW )
+    cmds = list()
+    while ( len( self._pending ) > 0 ):
+      run, start, n = self._pending[0]
+      lane          = run.lane( start )
+      esz           = dataSize( lane, 1 )
+      xsp, rsp      = req.space()
+      if ( run.rdnwr ):
+        fit = 0 if ( xsp < CMD_SIZE or req.numReaders >= MAX_READERS ) else rsp // esz
+      else:
+        fit = (xsp - CMD_SIZE) // esz if ( xsp > CMD_SIZE ) else 0
+      fit = min( fit, n )
+      if ( fit < 1 ):
+        break
+      addr = run.addr + start * run.width
+      if ( run.rdnwr ):
+        req._qOp( addr >> 2, lane, [ 0 for i in range( fit ) ], fit, True, self._scatter, (run, start) )
+      else:
+        req._qOp( addr >> 2, lane, [ run.elms[start + i][0].value for i in range( fit ) ], fit, False )
+      cmds.append( (run, start, fit) )
+      if ( fit == n ):
+        self._pending.popleft()
+      else:
+        self._pending[0] = (run, start + fit, n - fit)
+        break
+    self._datagrams += 1
+    return cmds
+
+  # Process the outcome of a datagram; 'nelmsOK' is None on success.
+  def _complete(self, cmds, nelmsOK = None):
+    idx  = 0
+    redo = list()
+    for run, start, n in cmds:
+      for i in range( start, start + n ):
+        if ( nelmsOK is None or idx < nelmsOK ):
+          # reads have been completed by '_scatter'
+          if ( not run.rdnwr ):
+            run.elms[i][0].complete()
+        elif ( idx == nelmsOK ):
+          err = EcurTargetError( nelmsOK, "transfer to 0x{:x} failed on the target".format( run.addr + i * run.width ) )
+          for op in run.elms[i]:
+            op.complete( err )
+        else:
+          redo.append( (run, i) )
+        idx += 1
+    if ( 0 == len( redo ) ):
+      return
+    if ( self._stopOnError ):
+      self._abort( [ (run, i, 1) for run, i in redo ], EcurError( ECUR_ERR_INVALID_REP, "not executed (previous error)" ) )
+      return
+    # re-submit the remainder (in order)
+    for run, i in reversed( redo ):
+      self._pending.appendleft( (run, i, 1) )
+    self._coalescePending( len( redo ) )
+
+  # merge consecutive single elements at the head of the queue again
+  def _coalescePending(self, n):
+    head = [ self._pending.popleft() for i in range( n ) ]
+    out  = list()
+    for run, i, c in head:
+      if ( len( out ) > 0 and out[-1][0] is run and out[-1][1] + out[-1][2] == i and out[-1][2] < MAX_BURST ):
+        out[-1] = ( run, out[-1][1], out[-1][2] + c )
+      else:
+        out.append( (run, i, c) )
+    for e in reversed( out ):
+      self._pending.appendleft( e )
+
+  def _abort(self, cmds, err):
+    for run, start, n in list( cmds ) + list( self._pending ):
+      for i in range( start, start + n ):
+        for op in run.elms[i]:
+          if ( not op.done ):
+            op.complete( err )
+    self._pending.clear()
+
+  def _finish(self):
+    self._failed = [ op for op in self._ops if not op.error is None ]
+    self._phases = [ EcurPlanPhase() ]
+    self._ops    = list()
+    return len( self._failed )
+
+  # Execute all accesses using 'ecur' (Ecur). Errors flagged by the target
+  # are reported by the individual accesses; the planner is reset but the
+  # accesses remain valid.
+  # RETURNS: number of failed accesses
+  def execute(self, ecur):
+    self._plan()
+    try:
+      while ( len( self._pending ) > 0 ):
+        cmds = self._pack( self._req )
+        try:
+          ecur.execute( self._req )
+          self._complete( cmds )
+        except EcurTargetError as e:
+          self._complete( cmds, e.nelmsOK )
+        except EcurError as e:
+          self._abort( cmds, e )
+          raise
+    finally:
+      nerr = self._finish()
+    return nerr
+
+  # Same as 'execute' for an EcurDevice (ecur.EcurAsync)
+  async def executeAsync(self, dev):
+    self._plan()
+    try:
+      while ( len( self._pending ) > 0 ):
+        req  = dev.request()
+        cmds = self._pack( req )
+        try:
+          await dev.execute( req )
+          self._complete( cmds )
+        except EcurTargetError as e:
+          self._complete( cmds, e.nelmsOK )
+        except EcurError as e:
+          self._abort( cmds, e )
+          raise
+    finally:
+      nerr = self._finish()
+    return nerr
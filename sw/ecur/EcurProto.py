@@ -0,0 +1,169 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Constants and encoding helpers for the UDP register-access protocol
+# implemented by hdl/Udp2Bus.vhd (see there for a full description).
+#
+# All words are little-endian 16-bit words:
+#
+#   request-header : seq (11..8), command (7..4), version (3..0)
+#   command        : address (15..0), then read (31), lane (30..28),
+#                    burst-1 (27..20), address (19..16)
+#   status         : error (15), number of successful transfers (10..0)
+
+import struct
+
+PROTO_VERSION     = 1
+
+# firmware default (see Lan9254ESCWrapper.vhd: DEFAULT_UDP_PORT_G)
+DEFAULT_PORT      = 4096
+
+# EoE size limit minus headers
+BUFSZ             = 1472 - 14 - 20 - 8
+
+SEQ_MSK           = 0xf
+
+HEADER_SIZE       = 2
+STATUS_SIZE       = 2
+CMD_SIZE          = 4
+
+STATUS_ERR        = 0x8000
+STATUS_NELMS_MSK  = 0x07ff
+
+CMD_NON           = 0
+CMD_VER           = 1
+CMD_RDW           = 2
+
+MAX_BURST         = 256
+MAX_READERS       = 256
+MAX_WORD_ADDR     = 0x000fffff
+
+# Lane Codes
+LC_B0             = 0 # byte 0 (bits  7 ..  0 of double-word)
+LC_B1             = 1 # byte 1 (bits 15 ..  8 of double-word)
+LC_B2             = 2 # byte 2 (bits 23 .. 16 of double-word)
+LC_B3             = 3 # byte 3 (bits 31 .. 24 of double-word)
+LC_W0             = 4 # word   (lower 16-bit  of double-word)
+LC_W1             = 5 # word   (upper 16-bit  of double-word)
+LC_DW             = 6 # double-word
+
+OP_READ           = (1<<31)
+OP_WRITE          = 0
+
+# Error codes (same as ecur.h)
+ECUR_ERR_INVALID_COUNT = -1 # Invalid burst count
+ECUR_ERR_INVALID_ADDR  = -2 # Address too big (not supported by protocol) or misaligned
+ECUR_ERR_NOSPACE_REQ   = -3 # no space in xmit buffer for this request
+ECUR_ERR_NOSPACE_REP   = -4 # no space in rcv buffer for the reply
+ECUR_ERR_INVALID_REP   = -5 # unable to process reply
+ECUR_ERR_IO            = -6 # network error
+ECUR_ERR_INTERNAL      = -7 # should not happen
+
+class EcurError(RuntimeError):
+  def __init__(self, code, msg):
+    super().__init__( msg )
+    self._code = code
+
+  @property
+  def code(self):
+    return self._code
+
+# The target flagged an error; the transfers preceding the failed one
+# were executed ('nelmsOK').
+class EcurTargetError(EcurError):
+  def __init__(self, nelmsOK, msg = "errors were encountered on the target"):
+    super().__init__( ECUR_ERR_INVALID_REP, msg )
+    self._nelmsOK = nelmsOK
+
+  @property
+  def nelmsOK(self):
+    return self._nelmsOK
+
+_H = struct.Struct("<H")
+_I = struct.Struct("<I")
+
+def mkHeader(cmd, seq):
+  return ( ( (seq & SEQ_MSK) << 8 ) | ( (cmd & 0xf) << 4 ) | PROTO_VERSION )
+
+def packHeader(buf, off, cmd, seq):
+  _H.pack_into( buf, off, mkHeader( cmd, seq ) )
+  return off + HEADER_SIZE
+
+def unpackHeader(buf, off = 0):
+  h = _H.unpack_from( buf, off )[0]
+  # seq, cmd, version
+  return (h >> 8) & SEQ_MSK, (h >> 4) & 0xf, h & 0xf
+
+def unpackStatus(buf, off):
+  s = _H.unpack_from( buf, off )[0]
+  return ( 0 != (s & STATUS_ERR) ), (s & STATUS_NELMS_MSK)
+
+# map byte address and width (1, 2 or 4 bytes) to a lane code
+def laneCode(addr, width):
+  if   ( 1 == width ):
+    return LC_B0 + (addr & 3)
+  elif ( 2 == width ):
+    if   ( 0 == (addr & 3) ):
+      return LC_W0
+    elif ( 2 == (addr & 3) ):
+      return LC_W1
+  elif ( 4 == width ):
+    if ( 0 == (addr & 3) ):
+      return LC_DW
+  else:
+    raise EcurError( ECUR_ERR_INTERNAL, "invalid width {} (must be 1, 2 or 4)".format( width ) )
+  raise EcurError( ECUR_ERR_INVALID_ADDR, "misaligned address 0x{:x} for width {:d}".format( addr, width ) )
+
+def laneWidth(lane):
+  if ( lane <= LC_B3 ):
+    return 1
+  if ( lane <= LC_W1 ):
+    return 2
+  return 4
+
+# size of the data of a burst (in the request for writes, the reply for reads);
+# 8-bit data occupy 16-bit words
+def dataSize(lane, n):
+  return n << ( 2 if LC_DW == lane else 1 )
+
+def checkOp(wordAddr, n):
+  if ( n > MAX_BURST or n < 1 ):
+    raise EcurError( ECUR_ERR_INVALID_COUNT, "invalid burst count {}".format( n ) )
+  if ( (wordAddr & ~MAX_WORD_ADDR) != 0 ):
+    raise EcurError( ECUR_ERR_INVALID_ADDR, "word address 0x{:x} not supported by protocol (too big)".format( wordAddr ) )
+
+def cmdWord(wordAddr, lane, n, rdnwr):
+  w = ( lane << 28 ) | ( (n - 1) << 20 ) | wordAddr
+  if ( rdnwr ):
+    w |= OP_READ
+  return w
+
+def packCmd(buf, off, wordAddr, lane, n, rdnwr):
+  _I.pack_into( buf, off, cmdWord( wordAddr, lane, n, rdnwr ) )
+  return off + CMD_SIZE
+
+def unpackCmd(buf, off):
+  w = _I.unpack_from( buf, off )[0]
+  # wordAddr, lane, n, rdnwr
+  return ( w & MAX_WORD_ADDR ), ( (w >> 28) & 7 ), ( ((w >> 20) & 0xff) + 1 ), ( 0 != (w & OP_READ) )
+
+# struct format for 'n' data items on 'lane'
+def dataFmt(lane, n):
+  return "<{:d}{}".format( n, "I" if LC_DW == lane else "H" )
+
+def packData(buf, off, lane, data, n):
+  if ( lane <= LC_B3 ):
+    # only the low byte is used
+    data = [ d & 0xff for d in data[0:n] ]
+  struct.pack_into( dataFmt( lane, n ), buf, off, *data[0:n] )
+  return off + dataSize( lane, n )
+
+def unpackData(buf, off, lane, n):
+  d = struct.unpack_from( dataFmt( lane, n ), buf, off )
+  if ( lane <= LC_B3 ):
+    d = [ x & 0xff for x in d ]
+  return d
@@ -0,0 +1,377 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Capture and replay of register-access sessions.
+#
+#   with EcurRecorder( "field.ecr" ) as rec:
+#     e = Ecur( ip, recorder = rec )       # or EcurFleet( recorder = rec )
+#     ...
+#
+#   python3 -m ecur.EcurRecorder -d field.ecr                 # dump
+#   python3 -m ecur.EcurRecorder -a 10.10.10.10 field.ecr     # replay, same pace
+#   python3 -m ecur.EcurRecorder -S -s 0 field.ecr            # replay (stand-in), max. speed
+#
+# Every datagram sent or received (including retries, stale replies and
+# the version check) is appended to the session file; an index file
+# ('<session>.idx') holds the time and offset of every record. Readers
+# scan records not covered by the index; when a session is re-opened
+# for appending the index is rebuilt (if it is missing or incomplete)
+# and a torn record at the end (e.g., after a crash) is dropped.
+#
+#   session : 'ECRS', version (u16), reserved (u16), { record }
+#   record  : time (f64, seconds since the epoch), direction (u8: 0 request,
+#             1 reply), sequence number (u8), peer IPv4 address (4 bytes),
+#             peer port (u16), payload length (u16), payload
+#   index   : 'ECRI', version (u16), reserved (u16), { time (f64), offset (u64) }
+#
+# All little-endian. Replay re-issues the requests (retries are left to the
+# client; re-sent requests are skipped) at the original pace, scaled by
+# 'speed' or as fast as possible; each reply is compared with the recorded
+# one (ignoring the sequence number which is re-assigned).
+
+import os
+import sys
+import time
+import socket
+import struct
+import bisect
+from   ecur.EcurProto import *
+
+class EcurRecord(object):
+  __slots__ = ( "t", "direction", "seq", "peer", "payload" )
+
+  def __init__(self, t, direction, seq, peer, payload):
+    self.t         = t
+    self.direction = direction
+    self.seq       = seq
+    self.peer      = peer
+    self.payload   = payload
+
+  @property
+  def isRequest(self):
+    return EcurRecorder.REQ == self.direction
+
+class EcurRecorder(object):
+
+  REQ     = 0
+  REP     = 1
+
+  MAGIC   = b'ECRS'
+  IMAGIC  = b'ECRI'
+  VERSION = 1
+  FHDR    = struct.Struct( "<4sHH" )
+  RHDR    = struct.Struct( "<dBB4sHH" )
+  IENT    = struct.Struct( "<dQ" )
+
+  def __init__(self, fnam):
+    super().__init__()
+    new       = not os.path.exists( fnam ) or 0 == os.path.getsize( fnam )
+    if ( not new ):
+      # make sure the index is complete and the file ends with a
+      # complete record before we append
+      EcurSession( fnam, repair = True ).close()
+    self._f   = open( fnam, "ab" )
+    if ( new ):
+      self._f.write( self.FHDR.pack( self.MAGIC, self.VERSION, 0 ) )
+    self._f.seek( 0, os.SEEK_END )
+    self._off = self._f.tell()
+    inew      = new or not os.path.exists( fnam + ".idx" ) or 0 == os.path.getsize( fnam + ".idx" )
+    # a new session must not inherit a stale index
+    self._i   = open( fnam + ".idx", "wb" if inew else "ab" )
+    if ( inew ):
+      self._i.write( self.FHDR.pack( self.IMAGIC, self.VERSION, 0 ) )
+
+  def _record(self, direction, peer, data, t):
+    if ( t is None ):
+      t = time.time()
+    seq = ( data[1] & SEQ_MSK ) if len( data ) > 1 else 0
+    self._f.write( self.RHDR.pack( t, direction, seq, socket.inet_aton( peer[0] ), peer[1], len( data ) ) )
+    self._f.write( data )
+    self._i.write( self.IENT.pack( t, self._off ) )
+    self._off += self.RHDR.size + len( data )
+
+  def request(self, peer, data, t = None):
+    self._record( self.REQ, peer, data, t )
+
+  def reply(self, peer, data, t = None):
+    self._record( self.REP, peer, data, t )
+
+  def flush(self):
+    self._f.flush()
+    self._i.flush()
+
+  def close(self):
+    self._f.close()
+    self._i.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+# Read access to a session file; with 'repair' the index file is
+# rewritten if it does not match the session and a torn record at the
+# end of the session is dropped (EcurRecorder does this before it
+# appends; don't repair a session which is still being recorded).
+class EcurSession(object):
+
+  def __init__(self, fnam, repair = False):
+    super().__init__()
+    self._f = open( fnam, "rb" )
+    magic, ver, rsvd = EcurRecorder.FHDR.unpack( self._f.read( EcurRecorder.FHDR.size ) )
+    if ( magic != EcurRecorder.MAGIC or ver != EcurRecorder.VERSION ):
+      raise ValueError( "'{}' is not a session file (version {:d})".format( fnam, EcurRecorder.VERSION ) )
+    self._times = list()
+    self._offs  = list()
+    self._loadIndex( fnam + ".idx", repair )
+
+  # RETURNS: offset past the (complete) record at 'off' or None
+  def _skip(self, off):
+    self._f.seek( off )
+    hdr = self._f.read( EcurRecorder.RHDR.size )
+    if ( len( hdr ) < EcurRecorder.RHDR.size ):
+      return None
+    t, d, s, ip, port, l = EcurRecorder.RHDR.unpack( hdr )
+    if ( len( self._f.read( l ) ) < l ):
+      return None
+    return off + EcurRecorder.RHDR.size + l
+
+  def _loadIndex(self, inam, repair):
+    ent   = EcurRecorder.IENT
+    hsz   = EcurRecorder.FHDR.size
+    dirty = True
+    try:
+      with open( inam, "rb" ) as f:
+        buf = f.read()
+      if ( buf[0:4] == EcurRecorder.IMAGIC ):
+        n     = ( len( buf ) - hsz ) // ent.size
+        dirty = ( len( buf ) != hsz + n * ent.size )
+        for t, off in ent.iter_unpack( buf[hsz : hsz + n * ent.size] ):
+          self._times.append( t )
+          self._offs.append( off )
+    except OSError:
+      pass
+    # drop index entries of records which are not (or not completely) there
+    off = hsz
+    while ( len( self._offs ) > 0 ):
+      nxt = self._skip( self._offs[-1] )
+      if ( not nxt is None ):
+        off = nxt
+        break
+      self._times.pop()
+      self._offs.pop()
+      dirty = True
+    # scan records not covered by the index
+    while True:
+      nxt = self._skip( off )
+      if ( nxt is None ):
+        break
+      self._f.seek( off )
+      self._times.append( EcurRecorder.RHDR.unpack( self._f.read( EcurRecorder.RHDR.size ) )[0] )
+      self._offs.append( off )
+      dirty = True
+      off   = nxt
+    if ( not repair ):
+      return
+    if ( dirty ):
+      with open( inam, "wb" ) as f:
+        f.write( EcurRecorder.FHDR.pack( EcurRecorder.IMAGIC, EcurRecorder.VERSION, 0 ) )
+        for t, o in zip( self._times, self._offs ):
+          f.write( ent.pack( t, o ) )
+    # drop a torn tail so records can be appended
+    if ( off < os.path.getsize( self._f.name ) ):
+      os.truncate( self._f.name, off )
+
+  def _read(self, off):
+    self._f.seek( off )
+    t, d, s, ip, port, l = EcurRecorder.RHDR.unpack( self._f.read( EcurRecorder.RHDR.size ) )
+    return EcurRecord( t, d, s, ( socket.inet_ntoa( ip ), port ), self._f.read( l ) )
+
+  def __len__(self):
+    return len( self._offs )
+
+  def __getitem__(self, i):
+    return self._read( self._offs[i] )
+
+  def __iter__(self):
+    for off in self._offs:
+      yield self._read( off )
+
+  # RETURNS: index of the first record at or after time 't'
+  def find(self, t):
+    return bisect.bisect_left( self._times, t )
+
+  def close(self):
+    self._f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+# RETURNS: list of (request, recorded reply or None) with re-sent
+#          requests removed
+def sessionTransactions(session):
+  xacts = list()
+  last  = dict()
+  pend  = dict()
+  for r in session:
+    if ( r.isRequest ):
+      if ( last.get( r.peer ) == r.payload ):
+        # retry
+        continue
+      last[r.peer] = r.payload
+      x            = [ r, None ]
+      pend[r.peer] = x
+      xacts.append( x )
+    else:
+      x = pend.get( r.peer )
+      if ( not x is None and len( r.payload ) >= HEADER_SIZE and r.payload[1] == x[0].payload[1] ):
+        x[1] = r
+        del pend[r.peer]
+  return xacts
+
+# Compare replies (ignoring the sequence number)
+# RETURNS: None if they match or a description of the difference
+def diffReplies(rec, rep):
+  if ( len( rec ) != len( rep ) ):
+    return "length {:d} (recorded {:d})".format( len( rep ), len( rec ) )
+  if ( rec[0] != rep[0] or ( rec[1] & ~SEQ_MSK ) != ( rep[1] & ~SEQ_MSK ) ):
+    return "header 0x{:04x} (recorded 0x{:04x})".format( rep[0] | (rep[1] << 8), rec[0] | (rec[1] << 8) )
+  if ( rec[HEADER_SIZE:] == rep[HEADER_SIZE:] ):
+    return None
+  msg = list()
+  if ( len( rec ) >= HEADER_SIZE + STATUS_SIZE and rec[-2:] != rep[-2:] ):
+    msg.append( "status 0x{:04x} (recorded 0x{:04x})".format( rep[-2] | (rep[-1] << 8), rec[-2] | (rec[-1] << 8) ) )
+  nd = sum( [ 1 for i in range( HEADER_SIZE, len( rec ) - STATUS_SIZE, 2 ) if rec[i:i+2] != rep[i:i+2] ] )
+  if ( nd > 0 ):
+    msg.append( "{:d} data words differ".format( nd ) )
+  return ", ".join( msg )
+
+class EcurReplayResult(object):
+
+  def __init__(self):
+    super().__init__()
+    self.requests = 0
+    self.matched  = 0
+    self.diffs    = list()  # (index, request, description)
+    self.elapsed  = 0.0
+
+  def __str__(self):
+    return "replayed {:d} requests in {:.3f}s; {:d} replies match, {:d} differ".format(
+             self.requests, self.elapsed, self.matched, len( self.diffs ) )
+
+# Replay a session; 'connect( peer )' returns an Ecur handle for an
+# original peer. 'speed' scales the original pace (None or 0: as fast as
+# possible).
+def replay(session, connect, speed = 1.0, report = None):
+  from ecur.Ecur import Ecur
+  res   = EcurReplayResult()
+  hdls  = dict()
+  xacts = sessionTransactions( session )
+  if ( 0 == len( xacts ) ):
+    return res
+  t0    = time.monotonic()
+  tr0   = xacts[0][0].t
+  for i in range( len( xacts ) ):
+    req, rec = xacts[i]
+    if ( speed ):
+      dly = ( req.t - tr0 ) / speed - ( time.monotonic() - t0 )
+      if ( dly > 0 ):
+        time.sleep( dly )
+    e = hdls.get( req.peer )
+    if ( e is None ):
+      e = connect( req.peer )
+      hdls[req.peer] = e
+    rep = e.xferRaw( req.payload )
+    res.requests += 1
+    if ( rec is None ):
+      continue
+    if ( rep is None ):
+      d = "no reply"
+    else:
+      d = diffReplies( rec.payload, rep )
+    if ( d is None ):
+      res.matched += 1
+    else:
+      res.diffs.append( (i, req, d) )
+      if ( not report is None ):
+        report( i, req, d )
+  res.elapsed = time.monotonic() - t0
+  for e in hdls.values():
+    e.close()
+  return res
+
+if __name__ == "__main__":
+
+  import getopt
+  from   ecur.Ecur import Ecur
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hda:p:s:S" )
+
+  dump  = False
+  ip    = None
+  port  = None
+  speed = 1.0
+  local = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-hdS] [-a ip] [-p port] [-s speed] session-file".format( sys.argv[0] ))
+      print("  Dump or replay a recorded register-access session")
+      print("   -h   : print this message")
+      print("   -d   : dump the session")
+      print("   -a   : replay against this target (default: the original targets)")
+      print("   -p   : port of the target (default: the original port)")
+      print("   -s   : speed-up factor (default: 1, i.e., original pace; 0: max. speed)")
+      print("   -S   : replay against a local stand-in (ecur.EcurServer)")
+      sys.exit(0)
+    elif opt[0] in ('-d'):
+      dump  = True
+    elif opt[0] in ('-a'):
+      ip    = opt[1]
+    elif opt[0] in ('-p'):
+      port  = int( opt[1], 0 )
+    elif opt[0] in ('-s'):
+      speed = float( opt[1] )
+    elif opt[0] in ('-S'):
+      local = True
+
+  if ( len( args ) < 1 ):
+    print( "Error: session file required", file = sys.stderr )
+    sys.exit(1)
+
+  sess = EcurSession( args[0] )
+
+  if ( dump ):
+    t0 = None
+    for r in sess:
+      if ( t0 is None ):
+        t0 = r.t
+      print( "{:12.6f} {} {}:{:d} seq {:2d} {}".format( r.t - t0, "->" if r.isRequest else "<-", r.peer[0], r.peer[1], r.seq, r.payload.hex() ) )
+    sys.exit(0)
+
+  srv = None
+  if ( local ):
+    from ecur.EcurServer import EcurServer
+    srv  = EcurServer().start()
+    ip   = "127.0.0.1"
+    port = srv.port
+
+  def connect(peer):
+    return Ecur( peer[0] if ip is None else ip, peer[1] if port is None else port )
+
+  def report(i, req, d):
+    print( "#{:d} ({}:{:d}): {}".format( i, req.peer[0], req.peer[1], d ) )
+
+  try:
+    print( replay( sess, connect, speed, report ) )
+  finally:
+    if ( not srv is None ):
+      srv.close()
@@ -0,0 +1,393 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Stand-in for the firmware (hdl/Udp2Bus.vhd) for testing clients without
+# hardware:
+#
+#   python3 -m ecur.EcurServer -p 4096 -l 0.0005 -L 0.01
+#
+# or, from a test:
+#
+#   with EcurServer() as srv:
+#     e = Ecur( "127.0.0.1", srv.port )
+#
+# EcurTarget implements the protocol engine and mirrors the firmware's
+# state machine (including its corner cases):
+#   - the version-check reply is just the header (with the version we
+#     support); an unsupported command/version is answered with the
+#     header where command is ILLEGAL.
+#   - a data-transfer request with the same signature (header bits 11..0)
+#     as the previous request is not executed; the cached reply is sent.
+#   - the request is aborted at the first bus error, when the reply is
+#     full (MAX_FRAME_SIZE_G/2 words), when a command is incomplete or a
+#     write burst is truncated. The status reports the error flag and the
+#     number of (successful) transfers.
+#   - byte-lane 0 (and 16/32-bit) reads return bits 15..0 of the bus data.
+#
+# The bus is a pluggable register model (see EcurMemModel) with the methods
+#
+#   read ( dwaddr, be )       -> 32-bit data
+#   write( dwaddr, be, data )
+#
+# which raise EcurBusError to signal a bus error.
+#
+# EcurServer adds the UDP socket, a reply latency and (random) loss of
+# requests and replies. Requests larger than 'maxFrameSize' are dropped
+# (as does the firmware's UDP receiver).
+
+import sys
+import time
+import heapq
+import socket
+import select
+import struct
+import random
+import threading
+from   ecur.EcurProto import *
+
+class EcurBusError(Exception):
+  pass
+
+# Sparse double-word memory; accesses to double-word addresses in any of
+# the 'errRanges' ((first, last) tuples) raise a bus error.
+class EcurMemModel(object):
+
+  def __init__(self, errRanges = ()):
+    super().__init__()
+    self._mem = dict()
+    self._err = list( errRanges )
+
+  def _check(self, dwaddr):
+    for lo, hi in self._err:
+      if ( dwaddr >= lo and dwaddr <= hi ):
+        raise EcurBusError( "bus error at double-word address 0x{:x}".format( dwaddr ) )
+
+  def read(self, dwaddr, be):
+    self._check( dwaddr )
+    return self._mem.get( dwaddr, 0 )
+
+  def write(self, dwaddr, be, data):
+    self._check( dwaddr )
+    m = 0
+    for i in range( 4 ):
+      if ( (be & (1 << i)) != 0 ):
+        m |= 0xff << (8*i)
+    self._mem[dwaddr] = ( self._mem.get( dwaddr, 0 ) & ~m ) | ( data & m )
+
+  # byte-level access for tests
+  def peek(self, addr, width = 4):
+    v = self._mem.get( addr >> 2, 0 ) >> ( 8 * (addr & 3) )
+    return v & ( ( 1 << (8*width) ) - 1 )
+
+  def poke(self, addr, width, value):
+    be = ( (1 << width) - 1 ) << (addr & 3)
+    self.write( addr >> 2, be, value << ( 8 * (addr & 3) ) )
+
+class EcurTargetStats(object):
+
+  def __init__(self):
+    super().__init__()
+    self.reset()
+
+  def reset(self):
+    self.requests = 0  # datagrams processed
+    self.replays  = 0  # ... answered from the reply cache
+    self.errors   = 0  # ... with error flag or illegal command
+    self.xfers    = 0  # successful transfers
+    self.dropped  = 0  # oversized requests dropped
+
+  def __str__(self):
+    return "requests {:d} (replays {:d}, errors {:d}), transfers {:d}, dropped {:d}".format(
+             self.requests, self.replays, self.errors, self.xfers, self.dropped )
+
+class EcurTarget(object):
+
+  # lane code -> byte-enables
+  BE = [ 0x1, 0x2, 0x4, 0x8, 0x3, 0xc, 0xf, 0xf ]
+
+  NUMCMDS_MSK = 0x3ff
+
+  def __init__(self, model = None, maxFrameSize = BUFSZ):
+    super().__init__()
+    self._model  = EcurMemModel() if model is None else model
+    self._maxFrm = maxFrameSize
+    self._maxWds = maxFrameSize // 2
+    self._sig    = 0
+    self._cache  = b''
+    self._stats  = EcurTargetStats()
+
+  @property
+  def model(self):
+    return self._model
+
+  @property
+  def stats(self):
+    return self._stats
+
+  @property
+  def maxFrameSize(self):
+    return self._maxFrm
+
+  # Process a request (UDP payload).
+  # RETURNS: the reply or None if the request is dropped
+  def process(self, req):
+    if ( len( req ) > self._maxFrm or len( req ) < 1 ):
+      self._stats.dropped += 1
+      return None
+    if ( 0 != ( len( req ) & 1 ) ):
+      req = bytes( req ) + b'\0'
+    words = struct.unpack( "<{:d}H".format( len( req ) // 2 ), req )
+    hdr   = words[0]
+    sig   = hdr & 0xfff
+    self._stats.requests += 1
+    if   ( ( (hdr >> 4) & 0xf ) == CMD_VER ):
+      self._sig   = sig
+      self._cache = struct.pack( "<H", ( hdr & ~0xf ) | PROTO_VERSION )
+    elif ( ( hdr & 0xff ) == ( (CMD_RDW << 4) | PROTO_VERSION ) ):
+      if ( self._sig == sig ):
+        self._stats.replays += 1
+        return self._cache
+      self._sig   = sig
+      self._cache = self._xfer( words )
+    else:
+      self._stats.errors += 1
+      self._sig   = sig & ~0xf0
+      self._cache = struct.pack( "<H", ( hdr & ~0xff ) | (CMD_NON << 4) | PROTO_VERSION )
+    return self._cache
+
+  def _xfer(self, words):
+    nw      = len( words )
+    out     = [ words[0] ]
+    pos     = 1
+    err     = False
+    numCmds = 0
+    # header and footer
+    numWrds = 2
+    model   = self._model
+    maxWds  = self._maxWds
+    done    = ( pos >= nw )
+    while ( not done ):
+      # CMD1/CMD2
+      alo  = words[pos]
+      pos += 1
+      if ( pos >= nw ):
+        # incomplete command
+        err = True
+        break
+      c      = words[pos]
+      pos   += 1
+      dwaddr = alo | ( (c & 0xf) << 16 )
+      lane   = (c >> 12) & 7
+      be     = self.BE[lane]
+      len1   = ( lane < 4 )
+      burst  = (c >> 4) & 0xff
+      rdnwr  = ( 0 != (c & 0x8000) )
+      if ( rdnwr ):
+        done = ( pos >= nw )
+      elif ( pos >= nw ):
+        # incomplete command (no write data)
+        err = True
+        break
+      while True:
+        if ( not rdnwr ):
+          # CMD3/CMD4
+          d    = words[pos]
+          pos += 1
+          if ( len1 ):
+            data = (d & 0xff) * 0x01010101
+          else:
+            data = d | (d << 16)
+            if ( 0xf == be ):
+              if ( pos >= nw ):
+                err = True
+                break
+              data = (data & 0xffff) | (words[pos] << 16)
+              pos += 1
+          done = ( pos >= nw )
+        # XFER
+        try:
+          if ( rdnwr ):
+            rdata = model.read( dwaddr, be ) & 0xffffffff
+          else:
+            model.write( dwaddr, be, data )
+        except EcurBusError:
+          err = True
+          break
+        numCmds += 1
+        if ( rdnwr ):
+          if ( numWrds >= maxWds ):
+            err = True
+          else:
+            old      = numWrds
+            numWrds += 1
+            if   ( 0 != (be & 1) ):
+              out.append( rdata & 0xffff )
+              if ( 0 != (be & 4) ):
+                if ( old >= maxWds - 1 ):
+                  err = True
+                else:
+                  numWrds = old + 2
+                  out.append( rdata >> 16 )
+            elif ( 0 != (be & 2) ):
+              out.append( (rdata >>  8) & 0xff )
+            elif ( 0 != (be & 4) ):
+              out.append( (rdata >> 16) & 0xffff )
+            else:
+              out.append( (rdata >> 24) & 0xff )
+          if ( err ):
+            break
+        if ( 0 == burst ):
+          break
+        # advance the byte-lanes and address
+        if   ( len1 ):
+          be = ( (be << 1) | (be >> 3) ) & 0xf
+        elif ( 0 == (be & 1) or 0 == (be & 4) ):
+          be = (~be) & 0xf
+        if ( 0 != (be & 1) ):
+          dwaddr = ( dwaddr + 1 ) & MAX_WORD_ADDR
+        burst -= 1
+        if ( not rdnwr and done ):
+          # write burst truncated
+          err = True
+          break
+      if ( err ):
+        break
+    self._stats.xfers += numCmds
+    if ( err ):
+      self._stats.errors += 1
+    out.append( ( STATUS_ERR if err else 0 ) | ( numCmds & self.NUMCMDS_MSK ) )
+    return struct.pack( "<{:d}H".format( len( out ) ), *out )
+
+class EcurServer(object):
+
+  def __init__(self, model = None, host = "127.0.0.1", port = 0, maxFrameSize = BUFSZ, latency = 0.0, reqLoss = 0.0, repLoss = 0.0, seed = None):
+    super().__init__()
+    self._tgt     = EcurTarget( model, maxFrameSize )
+    self._latency = latency
+    self._reqLoss = reqLoss
+    self._repLoss = repLoss
+    self._rnd     = random.Random( seed )
+    self._sd      = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    self._sd.bind( (host, port) )
+    self._sd.setblocking( False )
+    self._thread  = None
+    self._running = False
+    self.lost     = 0
+
+  @property
+  def port(self):
+    return self._sd.getsockname()[1]
+
+  @property
+  def addr(self):
+    return self._sd.getsockname()
+
+  @property
+  def target(self):
+    return self._tgt
+
+  @property
+  def model(self):
+    return self._tgt.model
+
+  def serve(self):
+    # replies waiting for their due time: (time, seqno, reply, addr)
+    due   = list()
+    n     = 0
+    rbuf  = bytearray( 65536 )
+    self._running = True
+    while ( self._running ):
+      tmo = 0.1
+      if ( len( due ) > 0 ):
+        tmo = max( 0.0, min( tmo, due[0][0] - time.monotonic() ) )
+      rdbl, wrbl, errl = select.select( [ self._sd ], [], [], tmo )
+      if ( len( rdbl ) > 0 ):
+        try:
+          got, addr = self._sd.recvfrom_into( rbuf )
+        except OSError:
+          continue
+        if ( self._rnd.random() < self._reqLoss ):
+          self.lost += 1
+          continue
+        rep = self._tgt.process( memoryview( rbuf )[0:got] )
+        if ( rep is None ):
+          continue
+        if ( self._rnd.random() < self._repLoss ):
+          self.lost += 1
+          continue
+        if ( self._latency > 0.0 ):
+          heapq.heappush( due, ( time.monotonic() + self._latency, n, rep, addr ) )
+          n += 1
+        else:
+          self._sd.sendto( rep, addr )
+      now = time.monotonic()
+      while ( len( due ) > 0 and due[0][0] <= now ):
+        t, i, rep, addr = heapq.heappop( due )
+        self._sd.sendto( rep, addr )
+
+  def start(self):
+    self._thread = threading.Thread( target = self.serve, daemon = True )
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._running = False
+    if ( not self._thread is None ):
+      self._thread.join()
+      self._thread = None
+
+  def close(self):
+    self.stop()
+    self._sd.close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    self.close()
+
+if __name__ == "__main__":
+
+  import getopt
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hH:p:l:L:F:" )
+
+  host     = "127.0.0.1"
+  port     = DEFAULT_PORT
+  latency  = 0.0
+  loss     = 0.0
+  frmSize  = BUFSZ
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-H host] [-p port] [-l latency] [-L loss] [-F max-frame-size]".format( sys.argv[0] ))
+      print("  Udp2Bus firmware stand-in (memory model)")
+      print("   -h   : print this message")
+      print("   -H   : address to bind to (default: {})".format( host ))
+      print("   -p   : UDP port (default: {:d})".format( port ))
+      print("   -l   : reply latency in seconds (default: 0)")
+      print("   -L   : probability of losing a request and of losing a reply (default: 0)")
+      print("   -F   : MAX_FRAME_SIZE_G (default: {:d})".format( frmSize ))
+      sys.exit(0)
+    elif opt[0] in ('-H'):
+      host    = opt[1]
+    elif opt[0] in ('-p'):
+      port    = int( opt[1], 0 )
+    elif opt[0] in ('-l'):
+      latency = float( opt[1] )
+    elif opt[0] in ('-L'):
+      loss    = float( opt[1] )
+    elif opt[0] in ('-F'):
+      frmSize = int( opt[1], 0 )
+
+  srv = EcurServer( host = host, port = port, maxFrameSize = frmSize, latency = latency, reqLoss = loss, repLoss = loss )
+  print( "Serving on {}:{:d}".format( *srv.addr ) )
+  try:
+    srv.serve()
+  except KeyboardInterrupt:
+    pass
+  print( srv.target.stats )
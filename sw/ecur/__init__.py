@@ -0,0 +1,11 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Python client for the EoE/UDP register-access protocol (hdl/Udp2Bus.vhd)
+
+from ecur.EcurProto import *
+from ecur.Ecur      import Ecur, EcurReader, EcurReq
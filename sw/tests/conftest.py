@@ -0,0 +1,20 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# make the 'ecur' package importable
+import os
+import sys
+import pytest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+from   ecur.EcurServer import EcurServer
+
+@pytest.fixture
+def server():
+  with EcurServer() as srv:
+    yield srv
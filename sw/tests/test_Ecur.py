@@ -0,0 +1,52 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+from   ecur.EcurServer import EcurServer, EcurMemModel
+from   ecur.Ecur       import Ecur
+from   ecur.EcurProto  import EcurTargetError
+
+# memory model counting the writes to every double-word
+class CountModel(EcurMemModel):
+
+  def __init__(self, errRanges = ()):
+    super().__init__( errRanges )
+    self.writes = dict()
+
+  def write(self, dwaddr, be, data):
+    self.writes[dwaddr] = self.writes.get( dwaddr, 0 ) + 1
+    super().write( dwaddr, be, data )
+
+def test_readWrite(server):
+  with Ecur( "127.0.0.1", server.port, timeout = 0.5 ) as e:
+    e.write32( 0x100, [ 0x11223344, 0x55667788 ] )
+    e.write16( 0x106, 0xabcd )
+    e.write8 ( 0x105, 0x5a )
+    assert server.model.peek( 0x104 ) == 0xabcd5a88
+    assert list( e.read32( 0x100, 2 ) ) == [ 0x11223344, 0xabcd5a88 ]
+    assert list( e.read16( 0x100, 4 ) ) == [ 0x3344, 0x1122, 0x5a88, 0xabcd ]
+    assert list( e.read8 ( 0x104, 4 ) ) == [ 0x88, 0x5a, 0xcd, 0xab ]
+
+def test_lossyLink():
+  m = CountModel()
+  with EcurServer( m, reqLoss = 0.3, repLoss = 0.3, seed = 1 ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.05, retries = 20, minTimeout = 0.01 ) as e:
+      for i in range( 50 ):
+        e.write32( 0x200 + 4*i, i )
+      assert list( e.read32( 0x200, 50 ) ) == list( range( 50 ) )
+    # retransmitted requests are answered from the reply cache
+    assert srv.target.stats.replays > 0
+  assert all( n == 1 for n in m.writes.values() )
+  assert len( m.writes ) == 50
+
+def test_busError():
+  with EcurServer( EcurMemModel( [ ( 0x42, 0x42 ) ] ) ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.5 ) as e:
+      e.write32( 0x100, 1 )
+      with pytest.raises( EcurTargetError ) as x:
+        e.write32( 0x100, [ 1, 2, 3 ] )
+      assert x.value.nelmsOK == 2
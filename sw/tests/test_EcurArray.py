@@ -0,0 +1,92 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import time
+import numpy
+import pytest
+from   ecur.EcurServer import EcurServer, EcurMemModel
+from   ecur.Ecur       import Ecur
+from   ecur.EcurArray  import EcurArray
+
+# memory model logging the (byte-) addresses of all writes
+class LogModel(EcurMemModel):
+
+  def __init__(self):
+    super().__init__()
+    self.log = list()
+
+  def write(self, dwaddr, be, data):
+    self.log.append( 4*dwaddr )
+    super().write( dwaddr, be, data )
+
+@pytest.fixture
+def target():
+  m = LogModel()
+  with EcurServer( m ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.5 ) as e:
+      for i in range( 64 ):
+        m.poke( 0x10000 + 4*i, 4, 0x1000 + i )
+      del m.log[:]
+      yield e, m
+
+def test_read(target):
+  e, m = target
+  a = EcurArray( e, base = 0x10000, length = 64, pageWords = 8 )
+  assert list( a[3:21] ) == [ 0x1000 + i for i in range( 3, 21 ) ]
+  # three consecutive pages in a single datagram
+  assert a.stats.misses    == 3
+  assert a.stats.datagrams == 1
+  assert a[[ 20, 4, -1 ]].tolist() == [ 0x1014, 0x1004, 0x103f ]
+  assert a.stats.misses    == 4
+  assert a[10] == 0x100a
+  assert a.stats.hits      >= 1
+  assert len( m.log ) == 0
+
+def test_writeBack(target):
+  e, m = target
+  a = EcurArray( e, base = 0x10000, length = 64, pageWords = 8 )
+  a[2:4] = 0xaa
+  a[6]   = 0xbb
+  # modified words are kept when the page is fetched
+  assert list( a[0:8] ) == [ 0x1000, 0x1001, 0xaa, 0xaa, 0x1004, 0x1005, 0xbb, 0x1007 ]
+  assert len( m.log ) == 0
+  a.flush()
+  assert sorted( m.log ) == [ 0x10008, 0x1000c, 0x10018 ]
+  assert m.peek( 0x10018 ) == 0xbb
+  del m.log[:]
+  a.flush()
+  assert len( m.log ) == 0
+
+# page 0 is written and accessed again after page 1; fetching page 2
+# evicts page 1 (LRU) or page 0 (FIFO, written back)
+@pytest.mark.parametrize( "evict, kept", [ ( EcurArray.EVICT_LRU, 0 ), ( EcurArray.EVICT_FIFO, 8 ) ] )
+def test_evict(target, evict, kept):
+  e, m = target
+  a = EcurArray( e, base = 0x10000, length = 64, pageWords = 8, maxPages = 2, evict = evict )
+  a[0]  = 0x55
+  a[8]
+  a[0]
+  a[16]
+  assert a.stats.evictions == 1
+  if ( 0 == kept ):
+    assert len( m.log ) == 0
+  else:
+    assert m.log == [ 0x10000 ]
+    assert m.peek( 0x10000 ) == 0x55
+  misses = a.stats.misses
+  a[kept]
+  assert a.stats.misses == misses
+
+def test_ttl(target):
+  e, m = target
+  a = EcurArray( e, base = 0x10000, length = 64, pageWords = 8, ttl = 0.05 )
+  assert a[1] == 0x1001
+  m.poke( 0x10004, 4, 0x77 )
+  assert a[1] == 0x1001
+  time.sleep( 0.06 )
+  assert a[1] == 0x77
+  assert a.stats.misses == 2
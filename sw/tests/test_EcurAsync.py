@@ -0,0 +1,65 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import asyncio
+from   ecur.EcurProto import *
+from   ecur.EcurAsync import EcurFleet
+from   ecur.Ecur      import EcurReq
+
+def read32(srv, addr):
+  async def run():
+    async with EcurFleet( timeout = 0.5 ) as fleet:
+      return ( await fleet.device( "127.0.0.1", srv.port ).read32( addr ) )[0]
+  return asyncio.run( run() )
+
+def test_readWrite(server):
+  async def run():
+    async with EcurFleet( timeout = 0.5 ) as fleet:
+      dev = fleet.device( "127.0.0.1", server.port )
+      await dev.write32( 0x1000, [ 0x12345678, 0x9abcdef0 ] )
+      req = dev.request()
+      d   = req.qRead16( 0x1002, 1 )
+      req.qWrite8( 0x1004, [ 0x55 ] )
+      e   = req.qRead32( 0x1004, 1 )
+      await dev.execute( req )
+      return d[0], e[0]
+  assert asyncio.run( run() ) == ( 0x1234, 0x9abcde55 )
+
+# a new session must not be answered from the reply cached for the
+# previous session's request with the same signature
+def test_newSessionNotReplayed(server):
+  server.model.poke( 0x1000, 4, 0x11111111 )
+  server.model.poke( 0x1004, 4, 0x22222222 )
+  assert read32( server, 0x1000 ) == 0x11111111
+  assert read32( server, 0x1004 ) == 0x22222222
+  assert server.target.stats.replays == 0
+
+def test_checkVersion(server):
+  async def run():
+    async with EcurFleet( timeout = 0.5 ) as fleet:
+      return await fleet.device( "127.0.0.1", server.port ).checkVersion()
+  assert asyncio.run( run() ) == PROTO_VERSION
+
+# executing a request twice (or one not obtained from the device) must
+# not put duplicates into the pool
+def test_requestPool(server):
+  async def run():
+    async with EcurFleet( timeout = 0.5 ) as fleet:
+      dev = fleet.device( "127.0.0.1", server.port )
+      req = dev.request()
+      req.qWrite32( 0x1000, [ 1 ] )
+      await dev.execute( req )
+      req.qWrite32( 0x1000, [ 2 ] )
+      await dev.execute( req )
+      own = EcurReq()
+      own.qWrite32( 0x1004, [ 3 ] )
+      await dev.execute( own )
+      got = [ dev.request() for i in range( 3 ) ]
+      return [ r is req or r is own for r in got ]
+  assert asyncio.run( run() ) == [ True, False, False ]
+  assert server.model.peek( 0x1000 ) == 2
+  assert server.model.peek( 0x1004 ) == 3
@@ -0,0 +1,57 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+from   ecur.EcurProto import *
+from   ecur.Ecur      import EcurReq
+from   ecur.EcurBench import mkBatches, batchLoad, runBench, EcurPyDriver, MIXES
+
+BASE   = 0x10000
+WINDOW = 0x1000
+
+# every batch fits a single datagram and stays inside the window
+@pytest.mark.parametrize( "mix", MIXES )
+def test_batches(mix):
+  batches = mkBatches( mix, BASE, WINDOW, nBatches = 16, seed = 1 )
+  assert len( batches ) == 16
+  assert batches == mkBatches( mix, BASE, WINDOW, nBatches = 16, seed = 1 )
+  for ops in batches:
+    assert len( ops ) > 0
+    req = EcurReq()
+    rd  = { 1 : req.qRead8,  2 : req.qRead16,  4 : req.qRead32  }
+    wr  = { 1 : req.qWrite8, 2 : req.qWrite16, 4 : req.qWrite32 }
+    for rdnwr, width, addr, v in ops:
+      n = v if rdnwr else len( v )
+      assert addr % width == 0
+      assert addr >= BASE and addr + n * width <= BASE + WINDOW
+      if ( rdnwr ):
+        rd[width]( addr, n )
+      else:
+        wr[width]( addr, v )
+    if ( "single" == mix ):
+      assert ops == [ ( True, 4, BASE, 1 ) ]
+    else:
+      # packed to (nearly) the MTU
+      xsp, rsp = req.space()
+      assert min( xsp, rsp ) < 4 + 16 * 4
+
+def test_batchLoad():
+  assert batchLoad( [ ( True, 2, 0, 5 ), ( False, 4, 0, [ 1, 2 ] ) ] ) == ( 7, 18 )
+
+@pytest.mark.parametrize( "mix", MIXES )
+def test_run(server, mix):
+  drv = EcurPyDriver( "127.0.0.1", server.port )
+  try:
+    server.target.stats.reset()
+    res = runBench( drv, mix, BASE, WINDOW, iterations = 20 )
+  finally:
+    drv.close()
+  assert len( res.lat ) == 20
+  assert res.nops == server.target.stats.xfers
+  assert server.target.stats.errors == 0
+  assert res.percentile( 50.0 ) <= res.percentile( 99.9 )
+  assert len( res.histogram() ) > 0
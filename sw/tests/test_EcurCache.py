@@ -0,0 +1,101 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+from   ecur.EcurServer import EcurServer, EcurMemModel
+from   ecur.Ecur       import Ecur
+from   ecur.EcurCache  import EcurCache, EcurRegMap
+from   ecur.EcurProto  import EcurError
+
+# memory model logging the (byte-) addresses of all accesses
+class LogModel(EcurMemModel):
+
+  def __init__(self):
+    super().__init__()
+    self.log = list()
+
+  def read(self, dwaddr, be):
+    self.log.append( ( "r", 4*dwaddr ) )
+    return super().read( dwaddr, be )
+
+  def write(self, dwaddr, be, data):
+    self.log.append( ( "w", 4*dwaddr ) )
+    super().write( dwaddr, be, data )
+
+@pytest.fixture
+def target():
+  m = LogModel()
+  with EcurServer( m ) as srv:
+    e = Ecur( "127.0.0.1", srv.port, timeout = 0.5 )
+    yield e, m
+    e.close()
+
+def mkCache(e, window = None):
+  return EcurCache( e, EcurRegMap().declare( 0x1000, 64 ), flushWindow = window )
+
+def test_hostWritesBuffered(target):
+  e, m = target
+  c    = mkCache( e )
+  c.write( 0x1000, 4, 1 )
+  c.write( 0x1000, 4, 2 )
+  assert c.pending == 1
+  assert c.read( 0x1000 ) == 2
+  assert len( m.log ) == 0
+  c.flush()
+  assert m.log == [ ( "w", 0x1000 ) ]
+  assert m.peek( 0x1000 ) == 2
+  assert c.stats.combined == 1
+
+def test_volatileAfterBufferedWrites(target):
+  e, m = target
+  c    = mkCache( e )
+  c.write( 0x1000, 4, 1 )
+  c.write( 0x1004, 4, 2 )
+  # volatile; lower address than the buffered writes
+  c.write( 0x0100, 4, 3 )
+  assert m.log == [ ( "w", 0x1000 ), ( "w", 0x1004 ), ( "w", 0x0100 ) ]
+  del m.log[:]
+  c.write( 0x1008, 4, 4 )
+  c.read( 0x0200 )
+  assert m.log == [ ( "w", 0x1008 ), ( "r", 0x0200 ) ]
+
+def test_updateReadsOnce(target):
+  e, m = target
+  m.poke( 0x1004, 4, 0xaa55 )
+  del m.log[:]
+  c    = mkCache( e )
+  assert c.update( 0x1004, 4, 0x00f0, 0x0030 ) == 0xaa35
+  assert c.setBits( 0x1004, 4, 0x1000000 ) == 0x100aa35
+  with c:
+    pass
+  assert m.peek( 0x1004 ) == 0x100aa35
+  assert m.log == [ ( "r", 0x1004 ), ( "w", 0x1004 ) ]
+
+def test_flushWindow(target):
+  e, m = target
+  c    = mkCache( e, window = 0.0 )
+  c.write( 0x1000, 4, 1 )
+  assert c.pending == 0
+  assert m.peek( 0x1000 ) == 1
+
+# a failed transfer must not leave unwritten values in the shadow
+def test_transportError():
+  m = LogModel()
+  with EcurServer( m ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.02, retries = 2, minTimeout = 0.01 ) as e:
+      c = mkCache( e )
+      c.write( 0x1000, 4, 0x11111111 )
+      c.flush()
+      c.write( 0x1000, 4, 0x22222222 )
+      srv.stop()
+      with pytest.raises( EcurError ):
+        c.flush()
+      assert c.pending == 0
+      # not served from the shadow
+      with pytest.raises( EcurError ):
+        c.read( 0x1000 )
+  assert m.peek( 0x1000 ) == 0x11111111
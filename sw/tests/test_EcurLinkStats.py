@@ -0,0 +1,71 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+from   ecur.EcurServer import EcurServer
+from   ecur.Ecur       import Ecur, EcurLinkStats
+from   ecur.EcurProto  import EcurError
+
+def test_rto():
+  st = EcurLinkStats( minRto = 0.001, maxRto = 1.0 )
+  assert st.rto == 1.0
+  st.done( 1, 0.010 )
+  # first sample: srtt = rtt, rttvar = rtt/2
+  assert st.srtt   == pytest.approx( 0.010 )
+  assert st.rttvar == pytest.approx( 0.005 )
+  assert st.rto    == pytest.approx( 0.030 )
+  st.done( 1, 0.018 )
+  assert st.rttvar == pytest.approx( 0.75*0.005 + 0.25*0.008 )
+  assert st.srtt   == pytest.approx( 0.875*0.010 + 0.125*0.018 )
+  assert st.rto    == pytest.approx( st.srtt + 4*st.rttvar )
+  # exponential back-off, capped
+  assert st.timeout( 1 ) == pytest.approx( 2*st.rto )
+  assert st.timeout( 10 ) == 1.0
+
+def test_rtoClamped():
+  st = EcurLinkStats( minRto = 0.002, maxRto = 0.5 )
+  for i in range( 100 ):
+    st.done( 1, 0.00001 )
+  assert st.rto == 0.002
+  st.done( 1, 10.0 )
+  assert st.rto == 0.5
+
+# Karn's rule: retried requests do not contribute RTT samples
+def test_karn():
+  st = EcurLinkStats()
+  st.done( 1, 0.010 )
+  srtt = st.srtt
+  st.sent( 0 )
+  st.sent( 1 )
+  st.done( 2, 0.500 )
+  st.sent( 0 )
+  st.done( 1, None )
+  assert st.srtt      == srtt
+  assert st.requests  == 3
+  assert st.recovered == 1
+  assert st.failed    == 1
+  assert st.lossRate  == pytest.approx( 1.0/3.0 )
+
+def test_lossyLink():
+  with EcurServer( reqLoss = 0.2, repLoss = 0.2, seed = 3 ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.05, retries = 20, minTimeout = 0.01 ) as e:
+      for i in range( 40 ):
+        e.write32( 0x100, i )
+      st = e.stats
+  assert st.requests  >= 40
+  assert st.retries   >  0
+  assert st.recovered >  0
+  assert st.failed    == 0
+  assert st.sends     == st.requests + st.retries
+  assert not st.srtt is None and st.rto >= 0.01
+
+def test_targetGone():
+  with EcurServer() as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.02, retries = 2, minTimeout = 0.01 ) as e:
+      srv.stop()
+      with pytest.raises( EcurError ):
+        e.write32( 0x100, 1 )
@@ -0,0 +1,75 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+import pytest
+from   ecur.Ecur         import Ecur
+from   ecur.EcurNetStats import EcurNetStats, EcurNetStatsWriter, readNetStats, NET_STATS_LABELS
+
+BASE = 0x1000
+N    = len( NET_STATS_LABELS )
+
+@pytest.fixture
+def ecur(server):
+  with Ecur( "127.0.0.1", server.port, timeout = 0.5 ) as e:
+    yield e
+
+def setCounters(server, vals):
+  for i in range( N ):
+    server.model.poke( BASE + 4*i, 4, vals[i] )
+
+def test_wrap(server, ecur):
+  st  = EcurNetStats( ecur, BASE, depth = 4 )
+  cur = numpy.arange( N ) * 100 + 8000
+  setCounters( server, cur )
+  assert st.poll() is None
+  # the 13-bit counters wrap; bits beyond are ignored
+  nxt = ( cur + numpy.arange( N ) * 10 + 300 ) & 0x1fff
+  setCounters( server, nxt | 0xffff0000 )
+  t, d, r = st.poll()
+  assert list( d ) == [ 10*i + 300 for i in range( N ) ]
+  assert list( st.totals ) == list( d )
+  assert numpy.all( r > 0 )
+
+def test_history(server, ecur):
+  st  = EcurNetStats( ecur, BASE, depth = 3 )
+  cur = numpy.zeros( N, dtype = numpy.int64 )
+  setCounters( server, cur )
+  st.poll()
+  for k in range( 1, 6 ):
+    cur = ( cur + k ) & 0x1fff
+    setCounters( server, cur )
+    st.poll()
+  t, d, r = st.history()
+  # the ring buffer keeps the last three polls in order
+  assert list( d[:, 0] ) == [ 3, 4, 5 ]
+  assert numpy.all( numpy.diff( t ) >= 0 )
+  assert st.totals[0] == 15
+  assert list( st.history( 2 )[1][:, 0] ) == [ 4, 5 ]
+
+def test_exports(server, ecur, tmp_path):
+  st  = EcurNetStats( ecur, BASE )
+  fn  = str( tmp_path / "stats.bin" )
+  wr  = EcurNetStatsWriter( fn, st )
+  setCounters( server, [ 0 ] * N )
+  st.poll()
+  setCounters( server, [ 5 ] * N )
+  st.poll()
+  setCounters( server, [ 7 ] * N )
+  st.poll()
+  wr.close()
+  labels, recs = readNetStats( fn )
+  assert labels == NET_STATS_LABELS
+  assert len( recs ) == 2
+  assert list( recs["deltas"][:, 0] ) == [ 5, 2 ]
+  txt = st.promText( target = "evr" )
+  assert 'ecur_net_mbxPkts_total{target="evr"} 7' in txt
+  assert "# TYPE ecur_net_nPktFwd_rate gauge" in txt
+  pn  = str( tmp_path / "stats.prom" )
+  st.writePrometheus( pn )
+  with open( pn ) as f:
+    assert f.read() == st.promText()
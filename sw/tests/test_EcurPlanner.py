@@ -0,0 +1,79 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+from   ecur.EcurServer  import EcurServer, EcurMemModel
+from   ecur.Ecur        import Ecur
+from   ecur.EcurPlanner import EcurPlanner
+
+# memory model logging the (byte-) addresses of all writes
+class LogModel(EcurMemModel):
+
+  def __init__(self):
+    super().__init__()
+    self.log = list()
+
+  def write(self, dwaddr, be, data):
+    self.log.append( 4*dwaddr )
+    super().write( dwaddr, be, data )
+
+@pytest.fixture
+def ecur(server):
+  with Ecur( "127.0.0.1", server.port, timeout = 0.5 ) as e:
+    yield e
+
+def test_bursts(server, ecur):
+  for i in range( 8 ):
+    server.model.poke( 0x1000 + 4*i, 4, 0x100 + i )
+  p  = EcurPlanner()
+  # out of order and duplicate reads
+  ops = [ p.read( 0x1000 + 4*i ) for i in ( 3, 1, 0, 2, 7, 5, 6, 4, 3 ) ]
+  server.target.stats.reset()
+  assert p.execute( ecur ) == 0
+  assert p.datagrams == 1
+  assert server.target.stats.xfers == 8
+  assert [ op.value for op in ops ] == [ 0x100 + i for i in ( 3, 1, 0, 2, 7, 5, 6, 4, 3 ) ]
+
+def test_readAfterWrite(server, ecur):
+  server.model.poke( 0x2000, 4, 0x11111111 )
+  p  = EcurPlanner()
+  r0 = p.read ( 0x2000 )
+  p.write( 0x2001, 1, 0xaa )
+  r1 = p.read ( 0x2000 )
+  assert p.execute( ecur ) == 0
+  assert r0.value == 0x11111111
+  assert r1.value == 0x1111aa11
+
+def test_barrier():
+  m = LogModel()
+  with EcurServer( m ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.5 ) as e:
+      # bursts are sorted by address within a phase
+      p = EcurPlanner()
+      p.write( 0x3008, 4, 1 )
+      p.write( 0x3000, 4, 2 )
+      assert p.execute( e ) == 0
+      assert m.log == [ 0x3000, 0x3008 ]
+      # the barrier preserves the order
+      del m.log[:]
+      p = EcurPlanner()
+      p.write( 0x3008, 4, 1 )
+      p.barrier()
+      p.write( 0x3000, 4, 2 )
+      assert p.execute( e ) == 0
+      assert p.datagrams == 1
+      assert m.log == [ 0x3008, 0x3000 ]
+
+def test_busError():
+  with EcurServer( EcurMemModel( [ ( 0x10, 0x10 ) ] ) ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.5 ) as e:
+      p   = EcurPlanner()
+      ops = [ p.write( 0x38 + 4*i, 4, i ) for i in range( 4 ) ]
+      assert p.execute( e ) == 1
+      assert [ op.ok for op in ops ] == [ True, True, False, True ]
+      assert p.failed == [ ops[2] ]
+      assert srv.model.peek( 0x44 ) == 3
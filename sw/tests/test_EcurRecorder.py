@@ -0,0 +1,72 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import os
+import asyncio
+from   ecur.Ecur         import Ecur
+from   ecur.EcurAsync    import EcurFleet
+from   ecur.EcurRecorder import EcurRecorder, EcurSession, sessionTransactions, replay
+
+def record(srv, fnam, val):
+  with EcurRecorder( fnam ) as rec:
+    e = Ecur( "127.0.0.1", srv.port, timeout = 0.5, recorder = rec )
+    e.write32( 0x1000, [ val ] )
+    e.read32( 0x1000 )
+    e.close()
+
+def numRecords(fnam):
+  with EcurSession( fnam ) as s:
+    return len( s )
+
+def test_recordAndReplay(server, tmp_path):
+  fnam = str( tmp_path / "s.ecr" )
+  record( server, fnam, 0x1234 )
+  with EcurSession( fnam ) as s:
+    # version check, write, read (request and reply each)
+    assert len( s ) == 6
+    assert len( sessionTransactions( s ) ) == 3
+    res = replay( s, lambda peer: Ecur( "127.0.0.1", server.port, timeout = 0.5 ), speed = 0 )
+  assert res.requests == 3 and res.matched == 3
+
+# index lacks the last record and the session ends with a torn record
+def test_appendAfterTornTail(server, tmp_path):
+  fnam = str( tmp_path / "s.ecr" )
+  record( server, fnam, 1 )
+  size = os.path.getsize( fnam )
+  os.truncate( fnam + ".idx", os.path.getsize( fnam + ".idx" ) - EcurRecorder.IENT.size )
+  with open( fnam, "ab" ) as f:
+    f.write( b"garbage" )
+  record( server, fnam, 2 )
+  assert numRecords( fnam ) == 12
+  with EcurSession( fnam ) as s:
+    assert s[6].t >= s[5].t
+    assert s[6].isRequest
+    assert EcurRecorder.FHDR.size + sum( [ EcurRecorder.RHDR.size + len( r.payload ) for r in s ] ) == os.path.getsize( fnam )
+  assert size < os.path.getsize( fnam )
+
+# complete index; torn tail only
+def test_truncateTornTail(server, tmp_path):
+  fnam = str( tmp_path / "s.ecr" )
+  record( server, fnam, 1 )
+  size = os.path.getsize( fnam )
+  with open( fnam, "ab" ) as f:
+    f.write( b"garbage" )
+  EcurRecorder( fnam ).close()
+  assert os.path.getsize( fnam ) == size
+  record( server, fnam, 2 )
+  assert numRecords( fnam ) == 12
+
+def test_asyncXferRaw(server, tmp_path):
+  fnam = str( tmp_path / "s.ecr" )
+  record( server, fnam, 0x55aa )
+  with EcurSession( fnam ) as s:
+    req, rec = sessionTransactions( s )[-1]
+  async def run():
+    async with EcurFleet( timeout = 0.5 ) as fleet:
+      return await fleet.device( "127.0.0.1", server.port ).xferRaw( req.payload )
+  rep = asyncio.run( run() )
+  assert rep[2:] == rec.payload[2:]
@@ -0,0 +1,108 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import time
+import struct
+import pytest
+from   ecur.EcurProto  import *
+from   ecur.EcurServer import EcurServer, EcurTarget, EcurMemModel
+from   ecur.Ecur       import Ecur, EcurReq
+
+# feed a request to the target and scatter the reply
+def run(tgt, req, seq):
+  req.setSeq( seq )
+  rep = tgt.process( bytes( req.request ) )
+  return req.processReply( rep, len( rep ) )
+
+def test_laneRotation():
+  tgt = EcurTarget()
+  req = EcurReq()
+  # 8-bit burst crossing a double-word boundary
+  req.qWrite8 ( 0x101, [ 0x11, 0x22, 0x33, 0x44, 0x55, 0x66 ] )
+  # 16-bit burst starting in the upper half
+  req.qWrite16( 0x206, [ 0xaaaa, 0xbbbb, 0xcccc ] )
+  assert run( tgt, req, 1 ) == 9
+  m = tgt.model
+  assert m.peek( 0x100 ) == 0x33221100
+  assert m.peek( 0x104 ) == 0x00665544
+  assert m.peek( 0x204 ) == 0xaaaa0000
+  assert m.peek( 0x208 ) == 0xccccbbbb
+  d8  = req.qRead8 ( 0x103, 3 )
+  d16 = req.qRead16( 0x206, 3 )
+  d32 = req.qRead32( 0x204, 2 )
+  assert run( tgt, req, 2 ) == 8
+  assert list( d8  ) == [ 0x33, 0x44, 0x55 ]
+  assert list( d16 ) == [ 0xaaaa, 0xbbbb, 0xcccc ]
+  assert list( d32 ) == [ 0xaaaa0000, 0xccccbbbb ]
+
+def test_replyCache():
+  tgt = EcurTarget()
+  req = EcurReq()
+  req.qWrite32( 0x100, [ 1 ] )
+  req.setSeq( 5 )
+  msg = bytes( req.request )
+  rep = tgt.process( msg )
+  tgt.model.poke( 0x100, 4, 2 )
+  # same signature: replayed, not executed
+  assert tgt.process( msg ) == rep
+  assert tgt.model.peek( 0x100 ) == 2
+  assert tgt.stats.replays == 1
+  assert tgt.stats.xfers   == 1
+  # a version check in between resets the signature
+  ver = EcurReq()
+  ver.begin( CMD_VER )
+  ver.setSeq( 5 )
+  assert tgt.process( bytes( ver.request ) )[0] & 0xf == PROTO_VERSION
+  tgt.process( bytes( ver.request ) )
+  tgt.process( msg )
+  assert tgt.model.peek( 0x100 ) == 1
+  assert tgt.stats.replays == 1
+
+def test_illegalCommand():
+  tgt = EcurTarget()
+  rep = tgt.process( struct.pack( "<H", mkHeader( 7, 3 ) ) )
+  assert ( rep[0] >> 4 ) & 0xf == CMD_NON
+  assert tgt.stats.errors == 1
+
+def test_busError():
+  tgt = EcurTarget( EcurMemModel( [ ( 0x41, 0x41 ) ] ) )
+  req = EcurReq()
+  req.qRead32( 0x100, 4 )
+  with pytest.raises( EcurTargetError ) as e:
+    run( tgt, req, 1 )
+  assert e.value.nelmsOK == 1
+
+def test_maxFrameSize():
+  tgt = EcurTarget( maxFrameSize = 64 )
+  req = EcurReq()
+  req.qWrite32( 0x100, list( range( 16 ) ) )
+  assert req.size > 64
+  assert tgt.process( bytes( req.request ) ) is None
+  assert tgt.stats.dropped == 1
+  req.clear()
+  # the reply is limited to 32 words (header, status and 15 double-words);
+  # the 16th transfer is executed but its data does not fit
+  req.qRead32( 0x100, 20 )
+  with pytest.raises( EcurTargetError ) as e:
+    run( tgt, req, 2 )
+  assert e.value.nelmsOK == 16
+  assert tgt.stats.errors == 1
+
+def test_latency():
+  with EcurServer( latency = 0.05 ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.5 ) as e:
+      t = time.monotonic()
+      e.read32( 0x100 )
+      assert time.monotonic() - t >= 0.05
+
+def test_requestLoss():
+  with EcurServer( reqLoss = 0.5, seed = 7 ) as srv:
+    with Ecur( "127.0.0.1", srv.port, timeout = 0.02, retries = 20, minTimeout = 0.005 ) as e:
+      for i in range( 20 ):
+        e.write32( 0x100, i )
+    assert srv.lost > 0
+    assert srv.model.peek( 0x100 ) == 19
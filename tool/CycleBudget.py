@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Cycle-time and bus-bandwidth budget of an EtherCAT segment:
+#
+#   b = CycleBudget( cycleNs = 100000 )
+#   b.add( SlaveBudget.fromEsi( loadEsi( "evr.xml" ), "evr1" ) )
+#   b.add( SlaveBudget( "io", txSize = 8, rxSize = 4, firmware = False ) )
+#   print( b )
+#   b.problems()
+#
+# Bus: the process data of all slaves are exchanged by LRW datagrams
+# (at most 1486 data bytes each; one datagram per frame). Inputs and
+# outputs occupy separate logical ranges (unless 'overlap': then each
+# slave occupies max(tx, rx) bytes). Per frame the wire carries
+#
+#   preamble/SFD (8) + Ethernet header (14) + EtherCAT header (2) +
+#   datagram header (10) + data + WKC (2) + FCS (4) + IFG (12)
+#
+# (with the Ethernet payload padded to at least 46 bytes). The cycle
+# must accommodate the wire time of all frames plus the forwarding
+# delay of every slave (in and out; 'fwdDelayNs' per slave).
+#
+# Slave (this firmware): the TxPDO is written into the ESC by 16-bit HBI
+# writes ('hbiWriteNs' each; by default as computed by HbiTimingModel for
+# the clock frequency, likewise 'hbiReadNs') in bursts of TXPDO_BURST_MAX + 1 writes
+# separated by TXPDO_BURST_GAP clock cycles; after the last write the
+# next update is held off for TXPDO_UPDATE_DECIMATION = clkHz / maxUpdHz
+# clock cycles (see ESCTxPDO.vhd, Lan9254ESC.vhd). The TxPDO update
+# latency is the transfer time; the minimal update period is transfer
+# plus decimation. The headroom is the cycle time minus that period; a
+# negative headroom means the master sees stale data in some cycles.
+
+import sys
+from   FirmwareConstants import FirmwareConstants
+from   HbiTimingModel    import HbiTiming
+from   ToolCore          import hd2int
+
+ETH_OVERHEAD     = 8 + 14 + 4 + 12
+ETH_MIN_PAYLOAD  = 46
+ECAT_HDR         = 2
+DGRAM_OVERHEAD   = 10 + 2
+DGRAM_MAX_DATA   = 1500 - ECAT_HDR - DGRAM_OVERHEAD
+
+# 100 Mbit/s
+BIT_NS           = 10.0
+
+# firmware defaults (Lan9254ESC.vhd)
+TXPDO_BURST_MAX  = 16
+TXPDO_BURST_GAP  = 8
+TXPDO_MAX_UPD_HZ = 5.0E3
+
+# RETURNS: wire time (ns) of a frame carrying a single datagram of
+#          'nbytes' data
+def frameWireNs(nbytes, bitNs = BIT_NS):
+  pl = max( ECAT_HDR + DGRAM_OVERHEAD + nbytes, ETH_MIN_PAYLOAD )
+  return 8 * ( ETH_OVERHEAD + pl ) * bitNs
+
+class SlaveBudget(object):
+
+  # 'firmware': False for slaves not running this firmware (only their
+  #             process-data sizes are accounted for)
+  def __init__(self, name, txSize, rxSize, firmware = True, clkHz = 100.0E6, maxUpdHz = TXPDO_MAX_UPD_HZ,
+               hbiWriteNs = None, hbiReadNs = None, burstMax = TXPDO_BURST_MAX, burstGap = TXPDO_BURST_GAP):
+    super().__init__()
+    self.name       = name
+    self.txSize     = txSize
+    self.rxSize     = rxSize
+    self.firmware   = firmware
+    self.clkHz      = clkHz
+    self.maxUpdHz   = maxUpdHz
+    hbi             = HbiTiming( clkHz )
+    # 16-bit accesses
+    self.hbiWriteNs = hbi.ns( hbi.cycles( False ) ) if hbiWriteNs is None else hbiWriteNs
+    self.hbiReadNs  = hbi.ns( hbi.cycles( True  ) ) if hbiReadNs  is None else hbiReadNs
+    self.burstMax   = burstMax
+    self.burstGap   = burstGap
+
+  # PDO sizes from the SM configuration of an ESI object
+  @classmethod
+  def fromEsi(clazz, esi, name = None, **kwargs):
+    tx = 0
+    rx = 0
+    for sm in esi.element.findall( ".//Device/Sm" ):
+      if   ( "Inputs"  == sm.text ):
+        tx = hd2int( sm.get( "DefaultSize" ) )
+      elif ( "Outputs" == sm.text ):
+        rx = hd2int( sm.get( "DefaultSize" ) )
+    if ( name is None ):
+      nam  = esi.element.find( ".//Device/Name" )
+      name = "" if nam is None else nam.text
+    return clazz( name, tx, rx, **kwargs )
+
+  @property
+  def decimation(self):
+    return int( round( self.clkHz / self.maxUpdHz ) )
+
+  # time (ns) to write the TxPDO into the ESC
+  @property
+  def txTransferNs(self):
+    if ( not self.firmware ):
+      return 0.0
+    nw = ( self.txSize + 1 ) // 2
+    nb = ( nw + self.burstMax ) // ( self.burstMax + 1 )
+    return nw * self.hbiWriteNs + max( nb - 1, 0 ) * self.burstGap * 1.0E9 / self.clkHz
+
+  # time (ns) to read the RxPDO from the ESC
+  @property
+  def rxTransferNs(self):
+    if ( not self.firmware ):
+      return 0.0
+    return ( ( self.rxSize + 1 ) // 2 ) * self.hbiReadNs
+
+  # minimal interval (ns) between TxPDO updates
+  @property
+  def txUpdatePeriodNs(self):
+    if ( not self.firmware ):
+      return 0.0
+    return self.txTransferNs + self.decimation * 1.0E9 / self.clkHz
+
+  def headroomNs(self, cycleNs):
+    return cycleNs - max( self.txUpdatePeriodNs, self.rxTransferNs )
+
+  def problems(self, cycleNs):
+    errs = []
+    for sz, sm, nam in ( ( self.txSize, FirmwareConstants.TXPDO_SM(), "TxPDO" ),
+                         ( self.rxSize, FirmwareConstants.RXPDO_SM(), "RxPDO" ) ):
+      if ( self.firmware and sz > FirmwareConstants.ESC_SM_MAX_LEN( sm ) ):
+        errs.append( "{}: {} too big ({:d} > {:d} bytes)".format( self.name, nam, sz, FirmwareConstants.ESC_SM_MAX_LEN( sm ) ) )
+    if ( self.txUpdatePeriodNs > cycleNs ):
+      errs.append( "{}: TxPDO update period {:.1f}us exceeds the cycle time (stale data)".format( self.name, self.txUpdatePeriodNs / 1000.0 ) )
+    if ( self.rxTransferNs > cycleNs ):
+      errs.append( "{}: RxPDO transfer {:.1f}us exceeds the cycle time".format( self.name, self.rxTransferNs / 1000.0 ) )
+    return errs
+
+class CycleBudget(object):
+
+  # 'cycleNs'   : master cycle time
+  # 'fwdDelayNs': forwarding delay per slave (incl. cable; both directions)
+  def __init__(self, cycleNs, fwdDelayNs = 1000.0, bitNs = BIT_NS, overlap = False):
+    super().__init__()
+    self.cycleNs    = cycleNs
+    self.fwdDelayNs = fwdDelayNs
+    self.bitNs      = bitNs
+    self.overlap    = overlap
+    self._slaves    = []
+
+  def add(self, slave):
+    self._slaves.append( slave )
+
+  @property
+  def slaves(self):
+    return self._slaves
+
+  # size of the logical process image (bytes)
+  @property
+  def imageBytes(self):
+    if ( self.overlap ):
+      return sum( [ max( s.txSize, s.rxSize ) for s in self._slaves ] )
+    return sum( [ s.txSize + s.rxSize for s in self._slaves ] )
+
+  # RETURNS: list of datagram data sizes (one frame each)
+  def frames(self):
+    n = self.imageBytes
+    l = [ DGRAM_MAX_DATA ] * ( n // DGRAM_MAX_DATA )
+    if ( n % DGRAM_MAX_DATA > 0 or 0 == n ):
+      l.append( n % DGRAM_MAX_DATA )
+    return l
+
+  # EtherCAT payload of all frames (bytes)
+  @property
+  def payloadBytes(self):
+    return sum( [ ECAT_HDR + DGRAM_OVERHEAD + n for n in self.frames() ] )
+
+  @property
+  def wireNs(self):
+    return sum( [ frameWireNs( n, self.bitNs ) for n in self.frames() ] )
+
+  # time from sending the first frame until the last one returns
+  @property
+  def roundTripNs(self):
+    return self.wireNs + len( self._slaves ) * self.fwdDelayNs
+
+  # fraction of the cycle used by the bus
+  @property
+  def load(self):
+    return self.roundTripNs / self.cycleNs
+
+  # RETURNS: list of problems (empty if the target rate can be met)
+  def problems(self):
+    errs = []
+    if ( self.roundTripNs > self.cycleNs ):
+      errs.append( "bus: round trip {:.1f}us exceeds the cycle time {:.1f}us".format( self.roundTripNs / 1000.0, self.cycleNs / 1000.0 ) )
+    for s in self._slaves:
+      errs.extend( s.problems( self.cycleNs ) )
+    return errs
+
+  def __str__(self):
+    l = []
+    l.append( "cycle {:.1f}us ({:.1f}Hz), {:d} slaves, process image {:d} bytes".format(
+                self.cycleNs / 1000.0, 1.0E9 / self.cycleNs, len( self._slaves ), self.imageBytes ) )
+    l.append( "frames {:d}, EtherCAT payload {:d} bytes, wire {:.2f}us, round trip {:.2f}us, load {:.1f}%".format(
+                len( self.frames() ), self.payloadBytes, self.wireNs / 1000.0, self.roundTripNs / 1000.0, 100.0 * self.load ) )
+    l.append( "{:<16s} {:>6s} {:>6s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+                "slave", "tx", "rx", "txlat/us", "txper/us", "rxlat/us", "head/us" ) )
+    for s in self._slaves:
+      l.append( "{:<16s} {:6d} {:6d} {:10.2f} {:10.2f} {:10.2f} {:10.2f}".format(
+                  s.name, s.txSize, s.rxSize, s.txTransferNs / 1000.0, s.txUpdatePeriodNs / 1000.0,
+                  s.rxTransferNs / 1000.0, s.headroomNs( self.cycleNs ) / 1000.0 ) )
+    return "\n".join( l )
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hc:d:f:u:w:r:x:O" )
+
+  cycleNs = None
+  fwdNs   = 1000.0
+  clkHz   = 100.0E6
+  updHz   = TXPDO_MAX_UPD_HZ
+  wrNs    = None
+  rdNs    = None
+  others  = []
+  overlap = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] -c cycle-us [-d fwd-ns] [-f clk-hz] [-u max-upd-hz] [-w hbi-wr-ns] [-r hbi-rd-ns] [-x name:tx:rx] [-O] esi-or-sii-file...".format( sys.argv[0] ))
+      print("  Cycle-time and bandwidth budget of a segment (one ESI per slave running this firmware)")
+      print("   -h   : print this message")
+      print("   -c   : master cycle time (us)")
+      print("   -d   : forwarding delay per slave, incl. cable (ns; default: {:g})".format( fwdNs ))
+      print("   -f   : firmware clock frequency (Hz; default: {:g})".format( clkHz ))
+      print("   -u   : TXPDO_MAX_UPDATE_FREQ_G (Hz; default: {:g})".format( updHz ))
+      hbi = HbiTiming( clkHz )
+      print("   -w   : duration of an HBI write (ns; default: from HbiTimingModel, {:g} at {:g} Hz)".format( hbi.ns( hbi.cycles( False ) ), clkHz ))
+      print("   -r   : duration of an HBI read (ns; default: from HbiTimingModel, {:g} at {:g} Hz)".format( hbi.ns( hbi.cycles( True ) ), clkHz ))
+      print("   -x   : other slave with 'tx'/'rx' bytes of process data; may be repeated")
+      print("   -O   : inputs and outputs share logical addresses")
+      sys.exit(0)
+    elif opt[0] in ('-c'):
+      cycleNs = float( opt[1] ) * 1000.0
+    elif opt[0] in ('-d'):
+      fwdNs   = float( opt[1] )
+    elif opt[0] in ('-f'):
+      clkHz   = float( opt[1] )
+    elif opt[0] in ('-u'):
+      updHz   = float( opt[1] )
+    elif opt[0] in ('-w'):
+      wrNs    = float( opt[1] )
+    elif opt[0] in ('-r'):
+      rdNs    = float( opt[1] )
+    elif opt[0] in ('-x'):
+      n, t, r = opt[1].split( ":" )
+      others.append( SlaveBudget( n, int( t, 0 ), int( r, 0 ), firmware = False ) )
+    elif opt[0] in ('-O'):
+      overlap = True
+
+  if ( cycleNs is None or ( len( args ) < 1 and len( others ) < 1 ) ):
+    print( "Error: cycle time and at least one slave required", file = sys.stderr )
+    sys.exit(1)
+
+  b = CycleBudget( cycleNs, fwdNs, overlap = overlap )
+  for fn in args:
+    b.add( SlaveBudget.fromEsi( loadEsi( fn ), fn, clkHz = clkHz, maxUpdHz = updHz, hbiWriteNs = wrNs, hbiReadNs = rdNs ) )
+  for s in others:
+    b.add( s )
+  print( b )
+  errs = b.problems()
+  for e in errs:
+    print( "PROBLEM: {}".format( e ) )
+  sys.exit( 1 if len( errs ) > 0 else 0 )
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Streaming reader for EtherCAT traffic (ethertype 0x88A4) captured in
+# pcap or pcapng files; extracts the process data of this device:
+#
+#   rdr = EcatPdoReader( "capture.pcapng", loadEsi( "evr.xml" ) )
+#   for kind, t, data in rdr.batches():
+#     if ( EcatPdoReader.TX == kind ):
+#       rec = decodeTxPdo( data, dt )     # see PdoDtype
+#
+# The physical location and size of the TxPDO (inputs) and RxPDO
+# (outputs) come from the SM configuration in the ESI. The logical
+# addresses are assigned by the master; unless they are given they are
+# found by watching the master write the FMMU registers (0x0600..0x06ff)
+# of a device with a matching physical start address (if there are
+# several such devices select one by its configured station address).
+# LRD/LRW/LWR datagrams covering the entire PDO then yield a sample:
+#
+#   - TxPDO : taken from frames on their way back to the master (the
+#             devices set the locally-administered bit of the source
+#             MAC address) with a non-zero working counter.
+#   - RxPDO : taken from frames sent by the master.
+#
+# The file is read in fixed-size chunks; frames and datagrams are
+# memoryviews into the chunk buffer and PDO samples are collected in
+# fixed-size batch buffers, i.e., memory use is bounded regardless of
+# the size of the capture. Views are only valid until the generator
+# is resumed.
+
+import sys
+import io
+import struct
+import numpy
+from   ToolCore import hd2int
+
+ETHERTYPE_ECAT = 0x88A4
+ETHERTYPE_VLAN = 0x8100
+
+LINKTYPE_ETHERNET = 1
+
+# datagram commands
+CMD_APWR = 2
+CMD_FPWR = 5
+CMD_BWR  = 8
+CMD_LRD  = 10
+CMD_LWR  = 11
+CMD_LRW  = 12
+
+FMMU_BASE = 0x0600
+FMMU_SIZE = 16
+FMMU_NUM  = 16
+
+class EcatCapture(object):
+
+  PCAP_MAGIC_US = 0xa1b2c3d4
+  PCAP_MAGIC_NS = 0xa1b23c4d
+  PCAPNG_SHB    = 0x0A0D0D0A
+  PCAPNG_BOM    = 0x1A2B3C4D
+
+  def __init__(self, fnam, chunkSize = 1 << 22):
+    super().__init__()
+    self._f     = io.open( fnam, "rb" ) if isinstance( fnam, str ) else fnam
+    self._buf   = bytearray( chunkSize )
+    self._pos   = 0
+    self._end   = 0
+
+  # make 'n' bytes available at the current position
+  # RETURNS: False at the end of the file
+  def _need(self, n):
+    if ( self._end - self._pos >= n ):
+      return True
+    rem = self._end - self._pos
+    if ( n > len( self._buf ) ):
+      nbuf = bytearray( max( n, 2 * len( self._buf ) ) )
+      nbuf[0:rem] = self._buf[self._pos:self._end]
+      self._buf = nbuf
+    else:
+      self._buf[0:rem] = self._buf[self._pos:self._end]
+    self._pos = 0
+    self._end = rem
+    mv = memoryview( self._buf )
+    while ( self._end < n ):
+      got = self._f.readinto( mv[self._end:] )
+      if ( not got ):
+        return False
+      self._end += got
+    return True
+
+  def _take(self, n):
+    mv = memoryview( self._buf )[self._pos:self._pos + n]
+    self._pos += n
+    return mv
+
+  # RETURNS: generator of (timestamp, frame) with the frame a memoryview
+  #          of the (Ethernet) frame
+  def frames(self):
+    if ( not self._need( 4 ) ):
+      return
+    m, = struct.unpack_from( "<I", self._buf, self._pos )
+    if ( self.PCAPNG_SHB == m ):
+      yield from self._pcapng()
+    else:
+      yield from self._pcap()
+
+  def _pcap(self):
+    if ( not self._need( 24 ) ):
+      return
+    for bo in ( "<", ">" ):
+      m, = struct.unpack_from( bo + "I", self._buf, self._pos )
+      if ( m in ( self.PCAP_MAGIC_US, self.PCAP_MAGIC_NS ) ):
+        break
+    else:
+      raise ValueError("not a pcap or pcapng file")
+    scl  = 1.0e-9 if self.PCAP_MAGIC_NS == m else 1.0e-6
+    lt,  = struct.unpack_from( bo + "I", self._buf, self._pos + 20 )
+    if ( ( lt & 0xffff ) != LINKTYPE_ETHERNET ):
+      raise ValueError("unsupported link type {:d}".format( lt ))
+    self._pos += 24
+    rh   = struct.Struct( bo + "IIII" )
+    while ( self._need( rh.size ) ):
+      sec, frac, incl, orig = rh.unpack_from( self._buf, self._pos )
+      self._pos += rh.size
+      if ( not self._need( incl ) ):
+        return
+      yield sec + frac * scl, self._take( incl )
+
+  def _pcapng(self):
+    bo   = "<"
+    ifs  = []  # per interface: (linktype, ts scale)
+    while ( self._need( 12 ) ):
+      typ, = struct.unpack_from( bo + "I", self._buf, self._pos )
+      if ( self.PCAPNG_SHB == typ ):
+        bom, = struct.unpack_from( "<I", self._buf, self._pos + 8 )
+        bo   = "<" if self.PCAPNG_BOM == bom else ">"
+        ifs  = []
+      typ, blen = struct.unpack_from( bo + "II", self._buf, self._pos )
+      if ( blen < 12 or not self._need( blen ) ):
+        return
+      blk = self._take( blen )
+      if   ( 1 == typ ):
+        lt,  = struct.unpack_from( bo + "H", blk, 8 )
+        ifs.append( ( lt, self._tsResol( blk[16:blen - 4], bo ) ) )
+      elif ( 6 == typ ):
+        ifc, hi, lo, incl, orig = struct.unpack_from( bo + "IIIII", blk, 8 )
+        if ( ifc >= len( ifs ) ):
+          raise ValueError("packet block refers to undescribed interface {:d}".format( ifc ))
+        lt, scl = ifs[ifc]
+        if ( LINKTYPE_ETHERNET == lt ):
+          yield ( ( hi << 32 ) | lo ) * scl, blk[28:28 + incl]
+      elif ( 3 == typ ):
+        # simple packet block; no timestamp
+        orig, = struct.unpack_from( bo + "I", blk, 8 )
+        if ( len( ifs ) > 0 and LINKTYPE_ETHERNET == ifs[0][0] ):
+          yield 0.0, blk[12:12 + min( orig, blen - 16 )]
+
+  @staticmethod
+  def _tsResol(opts, bo):
+    off = 0
+    while ( off + 4 <= len( opts ) ):
+      code, l = struct.unpack_from( bo + "HH", opts, off )
+      if ( 0 == code ):
+        break
+      if ( 9 == code and l >= 1 ):
+        v = opts[off + 4]
+        return 2.0 ** -( v & 0x7f ) if ( v & 0x80 ) else 10.0 ** -v
+      off += 4 + ( ( l + 3 ) & ~3 )
+    return 1.0e-6
+
+  def close(self):
+    self._f.close()
+
+# RETURNS: EtherCAT payload of an Ethernet frame (or None) and whether
+#          the frame was returned by the devices
+def ecatPayload(frame):
+  if ( len( frame ) < 16 ):
+    return None, False
+  off = 12
+  typ = ( frame[off] << 8 ) | frame[off + 1]
+  while ( ETHERTYPE_VLAN == typ and len( frame ) >= off + 6 ):
+    off += 4
+    typ  = ( frame[off] << 8 ) | frame[off + 1]
+  if ( ETHERTYPE_ECAT != typ ):
+    return None, False
+  return frame[off + 2:], 0 != ( frame[6] & 0x02 )
+
+# RETURNS: generator of (cmd, adp, ado, data, wkc) of the datagrams in an
+#          EtherCAT payload ('adp'/'ado' combine into the 32-bit logical
+#          address for logical commands); data is a memoryview
+def datagrams(payload):
+  if ( len( payload ) < 2 ):
+    return
+  h   = payload[0] | ( payload[1] << 8 )
+  if ( 1 != ( h >> 12 ) ):
+    return
+  end = min( 2 + ( h & 0x7ff ), len( payload ) )
+  off = 2
+  while ( off + 12 <= end ):
+    cmd, idx, adp, ado, lf, irq = struct.unpack_from( "<BBHHHH", payload, off )
+    l    = lf & 0x7ff
+    if ( off + 12 + l > end ):
+      return
+    data = payload[off + 10:off + 10 + l]
+    wkc  = payload[off + 10 + l] | ( payload[off + 11 + l] << 8 )
+    yield cmd, adp, ado, data, wkc
+    off += 12 + l
+    if ( 0 == ( lf & 0x8000 ) ):
+      return
+
+class EcatPdoReader(object):
+
+  TX = "tx"
+  RX = "rx"
+
+  # 'esi'          : ESI object (PDO locations/sizes from its SM elements)
+  # 'txLogical'/
+  # 'rxLogical'    : logical addresses (default: from the FMMU setup)
+  # 'station'      : configured station address of the device (needed
+  #                  if there are several devices of this type)
+  # 'batch'        : number of samples per batch
+  # 'anyDirection' : take TxPDOs from any frame (e.g., if the capture only
+  #                  contains the returning frames and the MACs are not
+  #                  modified)
+  def __init__(self, fnam, esi = None, txPhys = None, txSize = None, rxPhys = None, rxSize = None,
+               txLogical = None, rxLogical = None, station = None, batch = 4096, chunkSize = 1 << 22, anyDirection = False):
+    super().__init__()
+    if ( not esi is None ):
+      for sm in esi.element.findall( ".//Device/Sm" ):
+        if ( "Inputs"  == sm.text and txPhys is None ):
+          txPhys = hd2int( sm.get( "StartAddress" ) )
+          txSize = hd2int( sm.get( "DefaultSize" ) )
+        if ( "Outputs" == sm.text and rxPhys is None ):
+          rxPhys = hd2int( sm.get( "StartAddress" ) )
+          rxSize = hd2int( sm.get( "DefaultSize" ) )
+    self._cap     = EcatCapture( fnam, chunkSize )
+    self._phys    = { self.TX : txPhys, self.RX : rxPhys }
+    self._size    = { self.TX : txSize or 0, self.RX : rxSize or 0 }
+    self._log     = { self.TX : txLogical, self.RX : rxLogical }
+    self._station = station
+    self._anyDir  = anyDirection
+    self._batch   = batch
+    # FMMU setups seen: (cmd, adp, fmmu#) -> (logical, length, phys, type)
+    self.fmmus    = dict()
+    self.frames   = 0
+    self.ecatFrms = 0
+    self.counts   = { self.TX : 0, self.RX : 0 }
+
+  @property
+  def txLogical(self):
+    return self._log[self.TX]
+
+  @property
+  def rxLogical(self):
+    return self._log[self.RX]
+
+  def pdoSize(self, kind):
+    return self._size[kind]
+
+  # watch writes to the FMMU registers
+  def _fmmuWrite(self, cmd, adp, ado, data):
+    if ( ado + len( data ) <= FMMU_BASE or ado >= FMMU_BASE + FMMU_NUM * FMMU_SIZE ):
+      return
+    for n in range( FMMU_NUM ):
+      a = FMMU_BASE + n * FMMU_SIZE
+      if ( a < ado or a + 13 > ado + len( data ) ):
+        continue
+      log, ln, lsb, leb, phys, psb, typ, act = struct.unpack_from( "<IHBBHBBB", data, a - ado )
+      self.fmmus[ ( cmd, adp, n ) ] = ( log, ln, phys, typ )
+      if ( not act ):
+        continue
+      if ( not self._station is None and ( CMD_FPWR != cmd or adp != self._station ) ):
+        continue
+      for kind, t in ( ( self.TX, 1 ), ( self.RX, 2 ) ):
+        if ( self._log[kind] is None and phys == self._phys[kind] and ( typ & t ) ):
+          self._log[kind] = log - ( phys - self._phys[kind] )
+
+  # RETURNS: generator of (kind, timestamp, pdo) with 'pdo' a memoryview
+  #          into the read buffer
+  def pdos(self):
+    for t, frm in self._cap.frames():
+      self.frames += 1
+      pl, back = ecatPayload( frm )
+      if ( pl is None ):
+        continue
+      self.ecatFrms += 1
+      for cmd, adp, ado, data, wkc in datagrams( pl ):
+        if ( cmd in ( CMD_APWR, CMD_FPWR, CMD_BWR ) ):
+          if ( not back ):
+            self._fmmuWrite( cmd, adp, ado, data )
+          continue
+        if ( not cmd in ( CMD_LRD, CMD_LWR, CMD_LRW ) ):
+          continue
+        addr = ( ado << 16 ) | adp
+        for kind in ( self.TX, self.RX ):
+          log = self._log[kind]
+          sz  = self._size[kind]
+          if ( log is None or 0 == sz or log < addr or log + sz > addr + len( data ) ):
+            continue
+          if ( self.TX == kind ):
+            if ( CMD_LWR == cmd or not ( back or self._anyDir ) or 0 == wkc ):
+              continue
+          elif ( CMD_LRD == cmd or back ):
+            continue
+          self.counts[kind] += 1
+          yield kind, t, data[log - addr:log - addr + sz]
+
+  def __iter__(self):
+    return self.pdos()
+
+  # RETURNS: generator of (kind, timestamps, data) where 'timestamps' is a
+  #          numpy array and 'data' a memoryview of the PDOs (back-to-back;
+  #          see PdoDtype.decodeTxPdo) of up to 'batch' samples
+  def batches(self):
+    bufs = dict()
+    for kind in ( self.TX, self.RX ):
+      bufs[kind] = [ bytearray( self._batch * self._size[kind] ), numpy.zeros( self._batch ), 0 ]
+    for kind, t, pdo in self.pdos():
+      b   = bufs[kind]
+      sz  = self._size[kind]
+      n   = b[2]
+      b[0][n * sz:(n + 1) * sz] = pdo
+      b[1][n] = t
+      b[2]    = n + 1
+      if ( b[2] == self._batch ):
+        yield kind, b[1], memoryview( b[0] )
+        b[2] = 0
+    for kind in ( self.TX, self.RX ):
+      b = bufs[kind]
+      if ( b[2] > 0 ):
+        yield kind, b[1][0:b[2]], memoryview( b[0] )[0:b[2] * self._size[kind]]
+
+  def close(self):
+    self._cap.close()
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hs:T:R:o:t:a" )
+
+  station = None
+  txLog   = None
+  rxLog   = None
+  out     = None
+  tsOut   = None
+  anyDir  = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-ha] [-s station] [-T tx-logical] [-R rx-logical] [-o txpdo-file] [-t timestamp-file] esi-or-sii-file capture-file".format( sys.argv[0] ))
+      print("  Extract this device's process data from a pcap/pcapng capture")
+      print("   -h   : print this message")
+      print("   -s   : configured station address of the device")
+      print("   -T   : logical address of the TxPDO (default: from FMMU setup)")
+      print("   -R   : logical address of the RxPDO (default: from FMMU setup)")
+      print("   -o   : write TxPDO images (back-to-back) to this file")
+      print("   -t   : write TxPDO timestamps (float64) to this file")
+      print("   -a   : take TxPDOs from any frame (not just those returned by the devices)")
+      sys.exit(0)
+    elif opt[0] in ('-s'):
+      station = int( opt[1], 0 )
+    elif opt[0] in ('-T'):
+      txLog   = int( opt[1], 0 )
+    elif opt[0] in ('-R'):
+      rxLog   = int( opt[1], 0 )
+    elif opt[0] in ('-o'):
+      out     = opt[1]
+    elif opt[0] in ('-t'):
+      tsOut   = opt[1]
+    elif opt[0] in ('-a'):
+      anyDir  = True
+
+  if ( len( args ) < 2 ):
+    print( "Error: ESI (or SII) and capture file required", file = sys.stderr )
+    sys.exit(1)
+
+  rdr = EcatPdoReader( args[1], loadEsi( args[0] ), txLogical = txLog, rxLogical = rxLog, station = station, anyDirection = anyDir )
+  of  = None if out   is None else io.open( out,   "wb" )
+  tf  = None if tsOut is None else io.open( tsOut, "wb" )
+  for kind, t, data in rdr.batches():
+    if ( EcatPdoReader.TX == kind ):
+      if ( not of is None ):
+        of.write( data )
+      if ( not tf is None ):
+        tf.write( t.tobytes() )
+  for f in ( of, tf ):
+    if ( not f is None ):
+      f.close()
+  rdr.close()
+  print( "{:d} frames, {:d} EtherCAT frames".format( rdr.frames, rdr.ecatFrms ) )
+  for k, v in rdr.fmmus.items():
+    print( "FMMU setup (cmd {:d}, adp 0x{:04x}, #{:d}): logical 0x{:08x}, {:d} bytes, physical 0x{:04x}, type {:d}".format( *k, *v ) )
+  print( "TxPDO (logical {}): {:d} samples of {:d} bytes".format(
+           "?" if rdr.txLogical is None else "0x{:08x}".format( rdr.txLogical ), rdr.counts[EcatPdoReader.TX], rdr.pdoSize( EcatPdoReader.TX ) ) )
+  print( "RxPDO (logical {}): {:d} samples of {:d} bytes".format(
+           "?" if rdr.rxLogical is None else "0x{:08x}".format( rdr.rxLogical ), rdr.counts[EcatPdoReader.RX], rdr.pdoSize( EcatPdoReader.RX ) ) )
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Discrete-event model of UDP (Udp2Bus register access) over EoE through
+# the mailboxes; predicts round-trip latency and throughput for given
+# mailbox (SM0/SM1) sizes and recommends sizes:
+#
+#   cfg = EoeMbxConfig( sm0Len = 0x200, sm1Len = 0x50, pollNs = 1.0E6 )
+#   res = EoeMbxSim( cfg ).run( *udp2BusSizes( nReads = 64 ), nReq = 100 )
+#   print( res )
+#   best, all = recommend( cfg, reqBytes, repBytes )
+#   applyMbxSizes( esi, best.cfg.sm0Len, best.cfg.sm1Len )
+#
+# Fragmentation (ESCEoETx.vhd, ESCEoERx.vhd): a fragment carries the
+# mailbox header (6 bytes), the EoE header (4 bytes) and, except for the
+# last one, a multiple of 32 bytes of the Ethernet frame (the firmware
+# sends 32 * floor( ( SM1 length - 10 ) / 32 ) bytes; the master is
+# assumed to fragment the same way for SM0).
+#
+# Events per fragment:
+#
+#   master -> slave : the master writes the fragment in the first poll
+#                     cycle after the previous one was consumed; the
+#                     firmware reads it 'irqNs' later (32-bit HBI reads)
+#   slave  -> master: the firmware writes the fragment (32-bit HBI writes)
+#                     once the previous one was read by the master (plus
+#                     'irqNs'); the master reads it in the next poll cycle
+#
+# A request is processed ('procNs') once it has been reassembled; up to
+# 'window' requests are outstanding. The firmware accepts SM0 lengths up
+# to ESC_SM0_MXL_C (also published in the BootStrap mailbox); the SM1
+# length is fixed by the firmware (ESC_SM1_LEN_C; the TX fragment size
+# MAX_FRAGMENT_SIZE_G is derived from it) and is only varied on request.
+
+import sys
+import math
+from   FirmwareConstants import FirmwareConstants
+from   HbiTimingModel    import HbiTiming, LatencyStats
+from   ToolCore          import Sm, hd2int
+
+MBX_HDR       = 6
+EOE_HDR       = 4
+ETH_IP_UDP    = 14 + 20 + 8
+
+# Udp2Bus protocol (sw/ecur/EcurProto.py)
+U2B_HDR       = 2
+U2B_STATUS    = 2
+U2B_CMD       = 4
+
+# RETURNS: UDP payload sizes of a Udp2Bus request and its reply for
+#          'nReads'/'nWrites' 32-bit accesses (one command each)
+def udp2BusSizes(nReads = 1, nWrites = 0):
+  req = U2B_HDR + ( nReads + nWrites ) * U2B_CMD + nWrites * 4
+  rep = U2B_HDR + nReads * 4 + U2B_STATUS
+  return req, rep
+
+# RETURNS: Ethernet-frame bytes per (non-last) fragment for a mailbox
+#          of 'smLen' bytes
+def fragmentPayload(smLen):
+  return 32 * ( ( smLen - MBX_HDR - EOE_HDR ) // 32 )
+
+# RETURNS: list of the Ethernet-frame bytes carried by each fragment
+def fragments(frameBytes, smLen):
+  chunk = fragmentPayload( smLen )
+  if ( chunk <= 0 ):
+    raise ValueError("mailbox of {:d} bytes too small for EoE".format( smLen ))
+  l = [ chunk ] * ( ( frameBytes - 1 ) // chunk )
+  l.append( frameBytes - chunk * len( l ) )
+  return l
+
+class EoeMbxConfig(object):
+
+  # 'pollNs': period at which the master accesses the mailboxes
+  # 'irqNs' : latency of the firmware reacting to a mailbox event
+  # 'procNs': processing time of a request (UDP -> bus -> UDP)
+  def __init__(self, sm0Len = FirmwareConstants.ESC_SM_LEN( 0 ), sm1Len = FirmwareConstants.ESC_SM_LEN( 1 ),
+               pollNs = 1.0E6, irqNs = 2000.0, procNs = 20000.0, timing = None):
+    super().__init__()
+    self.sm0Len = sm0Len
+    self.sm1Len = sm1Len
+    self.pollNs = pollNs
+    self.irqNs  = irqNs
+    self.procNs = procNs
+    self.timing = HbiTiming() if timing is None else timing
+
+  def copy(self, sm0Len = None, sm1Len = None):
+    return EoeMbxConfig( self.sm0Len if sm0Len is None else sm0Len, self.sm1Len if sm1Len is None else sm1Len,
+                         self.pollNs, self.irqNs, self.procNs, self.timing )
+
+  # time (ns) for the firmware to read a fragment carrying 'nbytes'
+  def rxReadNs(self, nbytes):
+    n = ( MBX_HDR + EOE_HDR + nbytes + 3 ) // 4
+    return self.timing.ns( n * self.timing.cycles( True, 2 ) )
+
+  # time (ns) for the firmware to write a fragment carrying 'nbytes'
+  # (plus the last word of the mailbox which marks it full)
+  def txWriteNs(self, nbytes):
+    n = ( MBX_HDR + EOE_HDR + nbytes + 3 ) // 4 + 1
+    return self.timing.ns( n * self.timing.cycles( False, 2 ) )
+
+  def problems(self):
+    errs = []
+    if ( self.sm0Len > FirmwareConstants.ESC_SM_MAX_LEN( 0 ) ):
+      errs.append( "SM0 length {:d} exceeds the firmware limit {:d}".format( self.sm0Len, FirmwareConstants.ESC_SM_MAX_LEN( 0 ) ) )
+    if ( self.sm1Len != FirmwareConstants.ESC_SM_LEN( 1 ) ):
+      errs.append( "SM1 length {:d} requires firmware built with ESC_SM1_LEN_C = {:d}".format( self.sm1Len, self.sm1Len ) )
+    for i, l in ( ( 0, self.sm0Len ), ( 1, self.sm1Len ) ):
+      if ( fragmentPayload( l ) <= 0 ):
+        errs.append( "SM{:d} length {:d} too small for EoE".format( i, l ) )
+    return errs
+
+class EoeMbxResult(object):
+
+  def __init__(self, cfg, reqBytes, repBytes, nReq, window, rtt, totalNs, rxFrags, txFrags):
+    super().__init__()
+    self.cfg      = cfg
+    self.reqBytes = reqBytes
+    self.repBytes = repBytes
+    self.nReq     = nReq
+    self.window   = window
+    self.rtt      = rtt
+    self.totalNs  = totalNs
+    self.rxFrags  = rxFrags
+    self.txFrags  = txFrags
+
+  # requests per second
+  @property
+  def rate(self):
+    return self.nReq * 1.0E9 / self.totalNs
+
+  # UDP payload bytes per second (request, reply)
+  @property
+  def throughput(self):
+    return self.reqBytes * self.rate, self.repBytes * self.rate
+
+  def __str__(self):
+    l = []
+    l.append( "SM0 {:d} bytes ({:d} per fragment), SM1 {:d} bytes ({:d} per fragment), poll {:.1f}us".format(
+                self.cfg.sm0Len, fragmentPayload( self.cfg.sm0Len ), self.cfg.sm1Len, fragmentPayload( self.cfg.sm1Len ),
+                self.cfg.pollNs / 1000.0 ) )
+    l.append( "request {:d} bytes ({:d} fragments), reply {:d} bytes ({:d} fragments), window {:d}".format(
+                self.reqBytes, self.rxFrags, self.repBytes, self.txFrags, self.window ) )
+    l.append( "round trip mean {:.1f}us, p99 {:.1f}us, max {:.1f}us".format(
+                self.rtt.mean() / 1000.0, self.rtt.percentile( 99 ) / 1000.0, self.rtt.max() / 1000.0 ) )
+    tx, rx = self.throughput
+    l.append( "{:.1f} requests/s, {:.1f} kB/s out, {:.1f} kB/s in".format( self.rate, tx / 1000.0, rx / 1000.0 ) )
+    return "\n".join( l )
+
+class EoeMbxSim(object):
+
+  def __init__(self, cfg):
+    super().__init__()
+    self._cfg = cfg
+
+  # first poll cycle at or after 't'
+  def _poll(self, t):
+    p = self._cfg.pollNs
+    return math.ceil( t / p - 1.0E-9 ) * p
+
+  # simulate 'nReq' requests/replies of 'reqBytes'/'repBytes' UDP payload
+  # RETURNS: EoeMbxResult
+  def run(self, reqBytes, repBytes, nReq = 100, window = 1):
+    cfg     = self._cfg
+    rxFr    = fragments( ETH_IP_UDP + reqBytes, cfg.sm0Len )
+    txFr    = fragments( ETH_IP_UDP + repBytes, cfg.sm1Len )
+    rtt     = LatencyStats()
+    done    = []
+    rxFree  = 0.0    # SM0 consumed by the firmware
+    txFree  = 0.0    # SM1 consumed by the master
+    txPoll  = -1.0   # last poll cycle in which SM1 was read
+    rxPoll  = -1.0   # last poll cycle in which SM0 was written
+    busy    = 0.0    # request processing
+    for k in range( nReq ):
+      issue = 0.0 if k < window else done[k - window]
+      t     = issue
+      for n in rxFr:
+        # one mailbox write per poll cycle
+        w      = self._poll( max( t, rxFree ) )
+        if ( w <= rxPoll ):
+          w = rxPoll + cfg.pollNs
+        rxPoll = w
+        rxFree = w + cfg.irqNs + cfg.rxReadNs( n )
+        t      = rxFree
+      busy  = max( busy, t ) + cfg.procNs
+      t     = busy
+      for n in txFr:
+        s      = max( t, txFree + cfg.irqNs ) + cfg.txWriteNs( n )
+        r      = self._poll( s )
+        if ( r <= txPoll ):
+          r = txPoll + cfg.pollNs
+        txPoll = r
+        txFree = r
+        t      = s
+      done.append( txFree )
+      rtt.add( txFree - issue )
+    return EoeMbxResult( cfg, reqBytes, repBytes, nReq, window, rtt, done[-1], len( rxFr ), len( txFr ) )
+
+# Sweep SM0 (and optionally SM1) lengths.
+# RETURNS: the recommended result -- the smallest mailboxes within
+#          'tolerance' of the best mean round trip -- and all results
+def recommend(cfg, reqBytes, repBytes, sm0Lens = None, sm1Lens = None, nReq = 100, window = 1, tolerance = 0.01):
+  if ( sm0Lens is None ):
+    mn      = MBX_HDR + EOE_HDR + 32
+    sm0Lens = list( range( mn, FirmwareConstants.ESC_SM_MAX_LEN( 0 ) + 1, 32 ) )
+    if ( sm0Lens[-1] != FirmwareConstants.ESC_SM_MAX_LEN( 0 ) ):
+      sm0Lens.append( FirmwareConstants.ESC_SM_MAX_LEN( 0 ) )
+  if ( sm1Lens is None ):
+    sm1Lens = [ cfg.sm1Len ]
+  res = []
+  for l1 in sm1Lens:
+    for l0 in sm0Lens:
+      res.append( EoeMbxSim( cfg.copy( l0, l1 ) ).run( reqBytes, repBytes, nReq, window ) )
+  best = min( [ r.rtt.mean() for r in res ] )
+  ok   = [ r for r in res if r.rtt.mean() <= best * ( 1.0 + tolerance ) ]
+  return min( ok, key = lambda r: ( r.cfg.sm0Len + r.cfg.sm1Len, r.cfg.sm0Len ) ), res
+
+# Write mailbox sizes into the Sm elements of an ESI object (the SII
+# standard-mailbox configuration is generated from these)
+def applyMbxSizes(esi, sm0Len = None, sm1Len = None):
+  for el in esi.element.findall( ".//Device/Sm" ):
+    if   ( "MBoxOut" == el.text and not sm0Len is None ):
+      Sm.fromElement( el ).setSize( sm0Len )
+    elif ( "MBoxIn"  == el.text and not sm1Len is None ):
+      Sm.fromElement( el ).setSize( sm1Len )
+
+# Read the mailbox sizes of an ESI object into 'cfg'
+def readMbxSizes(esi, cfg):
+  for el in esi.element.findall( ".//Device/Sm" ):
+    if   ( "MBoxOut" == el.text ):
+      cfg.sm0Len = hd2int( el.get( "DefaultSize" ) )
+    elif ( "MBoxIn"  == el.text ):
+      cfg.sm1Len = hd2int( el.get( "DefaultSize" ) )
+  return cfg
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hr:w:q:Q:p:i:P:n:W:1:Ro:" )
+
+  nRd     = 64
+  nWr     = 0
+  reqB    = None
+  repB    = None
+  pollNs  = 1.0E6
+  irqNs   = 2000.0
+  procNs  = 20000.0
+  nReq    = 100
+  window  = 1
+  sm1Lens = None
+  doRec   = False
+  out     = None
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-r reads] [-w writes] [-q req-bytes] [-Q rep-bytes] [-p poll-us] [-i irq-us] [-P proc-us] [-n requests] [-W window] [-1 sm1-len[,sm1-len...]] [-R [-o out-file]] [esi-or-sii-file]".format( sys.argv[0] ))
+      print("  Model UDP (Udp2Bus) round trips over EoE for given mailbox sizes")
+      print("   -h   : print this message")
+      print("   -r   : 32-bit reads per request (default: {:d})".format( nRd ))
+      print("   -w   : 32-bit writes per request (default: {:d})".format( nWr ))
+      print("   -q   : UDP payload of a request (overrides -r/-w)")
+      print("   -Q   : UDP payload of a reply (overrides -r/-w)")
+      print("   -p   : master mailbox poll period (us; default: {:g})".format( pollNs / 1000.0 ))
+      print("   -i   : firmware mailbox-event latency (us; default: {:g})".format( irqNs / 1000.0 ))
+      print("   -P   : request processing time (us; default: {:g})".format( procNs / 1000.0 ))
+      print("   -n   : number of requests (default: {:d})".format( nReq ))
+      print("   -W   : outstanding requests (default: {:d})".format( window ))
+      print("   -1   : SM1 length(s) to consider (requires matching firmware; default: ESI/firmware value)")
+      print("   -R   : recommend mailbox sizes (and write them into the ESI if -o is given)")
+      print("   -o   : output file for the updated ESI ('.xml': XML, otherwise SII image)")
+      print("  SM0/SM1 lengths are taken from the ESI (firmware defaults if none is given)")
+      sys.exit(0)
+    elif opt[0] in ('-r'):
+      nRd     = int( opt[1], 0 )
+    elif opt[0] in ('-w'):
+      nWr     = int( opt[1], 0 )
+    elif opt[0] in ('-q'):
+      reqB    = int( opt[1], 0 )
+    elif opt[0] in ('-Q'):
+      repB    = int( opt[1], 0 )
+    elif opt[0] in ('-p'):
+      pollNs  = float( opt[1] ) * 1000.0
+    elif opt[0] in ('-i'):
+      irqNs   = float( opt[1] ) * 1000.0
+    elif opt[0] in ('-P'):
+      procNs  = float( opt[1] ) * 1000.0
+    elif opt[0] in ('-n'):
+      nReq    = int( opt[1], 0 )
+    elif opt[0] in ('-W'):
+      window  = int( opt[1], 0 )
+    elif opt[0] in ('-1'):
+      sm1Lens = [ int( x, 0 ) for x in opt[1].split(",") ]
+    elif opt[0] in ('-R'):
+      doRec   = True
+    elif opt[0] in ('-o'):
+      out     = opt[1]
+
+  r, q = udp2BusSizes( nRd, nWr )
+  reqB = r if reqB is None else reqB
+  repB = q if repB is None else repB
+
+  esi  = None
+  cfg  = EoeMbxConfig( pollNs = pollNs, irqNs = irqNs, procNs = procNs )
+  if ( len( args ) > 0 ):
+    esi = loadEsi( args[0] )
+    readMbxSizes( esi, cfg )
+
+  res = EoeMbxSim( cfg ).run( reqB, repB, nReq, window )
+  print( res )
+  for e in cfg.problems():
+    print( "PROBLEM: {}".format( e ) )
+  if ( not doRec ):
+    sys.exit(0)
+
+  best, allRes = recommend( cfg, reqB, repB, sm1Lens = sm1Lens, nReq = nReq, window = window )
+  print( "\n{:>6s} {:>6s} {:>12s} {:>12s} {:>10s}".format( "SM0", "SM1", "rtt/us", "rtt-p99/us", "req/s" ) )
+  for r in allRes:
+    print( "{:6d} {:6d} {:12.1f} {:12.1f} {:10.1f}".format(
+             r.cfg.sm0Len, r.cfg.sm1Len, r.rtt.mean() / 1000.0, r.rtt.percentile( 99 ) / 1000.0, r.rate ) )
+  print( "Recommended: SM0 {:d} bytes, SM1 {:d} bytes".format( best.cfg.sm0Len, best.cfg.sm1Len ) )
+  for e in best.cfg.problems():
+    print( "NOTE: {}".format( e ) )
+  if ( not out is None ):
+    if ( esi is None ):
+      print( "Error: an ESI (or SII) file is required to write the result", file = sys.stderr )
+      sys.exit(1)
+    applyMbxSizes( esi, best.cfg.sm0Len, best.cfg.sm1Len )
+    if ( out.endswith( ".xml" ) ):
+      esi.writeXML( out )
+    else:
+      esi.writeProm( out )
@@ -16,7 +16,7 @@ if __name__ == "__main__":
   import re
   from   ToolCore     import ESI
 
-  ( opts, args ) = getopt.getopt( sys.argv[1:], "hsPVDf", ["help", "prom", "vhdl", "default"] )
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hsPVDfI:", ["help", "prom", "vhdl", "default", "import="] )
 
   isGui     = True
   overwrite = False
@@ -24,10 +24,11 @@ if __name__ == "__main__":
   mkVhd     = False
   mkDfl     = False
   isSii     = False
+  imprt     = None
 
   for opt in opts:
     if opt[0] in ('-h', '--help'):
-      print("Usage: {} [-hsPVDf] [esi-xml-file]".format( sys.argv[0] ))
+      print("Usage: {} [-hsPVDf] [-I layout-file] [esi-xml-file]".format( sys.argv[0] ))
       print("  Tool to generate and/or edit XML ESI file for EtherCAT EVR")
       print("  Provide a file name to edit existing file; w/o file name a new")
       print("  XML can be generated from scratch.")
@@ -39,6 +40,9 @@ if __name__ == "__main__":
       print("   -D   : if no xml file is given - create a new one with default settings.")
       print("          This switch can also be used in combination with -V/-P")
       print("   -f   : overwrite existing PROM and/or VHDL file(s)")
+      print("   -I <layout-file>: non-GUI mode; import TxPDO segments and items from a")
+      print("          CSV or JSON file (see README). The resulting XML is printed to")
+      print("          stdout unless combined with -P/-V.")
       sys.exit(0)
     elif opt[0] in ('-P', '--prom'):
       isGui  = False
@@ -54,6 +58,9 @@ if __name__ == "__main__":
     elif opt[0] in ('-s' ):
       isSii = True
       isGui = False
+    elif opt[0] in ('-I', '--import'):
+      imprt = opt[1]
+      isGui = False
 
   if ( isSii ):
     mkDfl  = False
@@ -81,6 +88,12 @@ if __name__ == "__main__":
   if ( isGui ):
     from   PyQt5        import QtCore,QtGui,QtWidgets
     from   GuiAdapter   import ESIAdapter
+    from   GuiProfiler  import GuiProfiler, GuiProfilerDock
+
+    # must instrument before any objects are created
+    prof = GuiProfiler.fromEnv()
+    if ( not prof is None ):
+      prof.instrumentDefaults()
 
     style = (
              "QLabel#H2 { font: bold italic;"
@@ -97,15 +110,29 @@ if __name__ == "__main__":
 
 
     esi        = ESI( et )
-    guiAdapter = ESIAdapter( esi, fnam )
+    guiAdapter = ESIAdapter( esi, fnam, schema )
     window     = guiAdapter.makeGui()
+    if ( not prof is None ):
+      window.addDockWidget( QtCore.Qt.BottomDockWidgetArea, GuiProfilerDock( prof, window ) )
     window.show()
     app.exec()
   else:
     from ESIPromGenerator import ESIPromGenerator
+    from PdoImport        import PdoLayoutImport
+
+    def importLayout(esi, imprt):
+      try:
+        PdoLayoutImport.fromFile( imprt ).applyToEsi( esi )
+      except ( OSError, ValueError, KeyError ) as e:
+        print( "Error -- unable to import layout from '{}':".format( imprt ), file = sys.stderr )
+        print( str( e ), file = sys.stderr )
+        sys.exit(1)
+
     if ( et is None ):
        if ( mkDfl ):
          esi = ESI()
+         if ( not imprt is None ):
+           importLayout( esi, imprt )
          if ( not mkProm and not mkVhd ):
            esi.writeXML('-')
            exit(0)
@@ -114,6 +141,11 @@ if __name__ == "__main__":
          raise RuntimeError("Need {} file argument or '-D' option".format( "SII" if isSii else "xml" ))
     else:
        esi = ESI(et)
+       if ( not imprt is None ):
+         importLayout( esi, imprt )
+         if ( not mkProm and not mkVhd ):
+           esi.writeXML('-')
+           exit(0)
     prom = esi.makeProm()
     mode = "wb" if overwrite else "xb"
     m    = None
@@ -0,0 +1,120 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Background execution of (potentially slow) jobs which operate on a
+# snapshot of the ESI (see ESI.snapshot()): schema validation, writing
+# the XML and generating/writing the SII (EEPROM) image.
+#
+# A job is a list of steps; it may be cancelled at any time but
+# cancellation takes effect only between steps. Output files are
+# written to a temporary file which is renamed by the final step,
+# i.e., a cancelled or failed job never leaves a partially written
+# file behind.
+
+from   PyQt5 import QtCore
+import os
+import traceback
+
+class JobCancelled(Exception):
+  def __init__(self, msg = "Cancelled"):
+    super().__init__(msg)
+
+class EsiJobSignals(QtCore.QObject):
+  # percentage, description of the step being started
+  progress  = QtCore.pyqtSignal(int, str)
+  # description of the job
+  finished  = QtCore.pyqtSignal(str)
+  # error message
+  failed    = QtCore.pyqtSignal(str)
+  cancelled = QtCore.pyqtSignal()
+
+class EsiJob(QtCore.QRunnable):
+
+  def __init__(self, snapshot, name):
+    super().__init__()
+    self._snap      = snapshot
+    self._name      = name
+    self._steps     = list()
+    self._tmps      = list()
+    self._cancelled = False
+    self._signals   = EsiJobSignals()
+    # we keep a reference to the job
+    self.setAutoDelete( False )
+
+  @property
+  def name(self):
+    return self._name
+
+  @property
+  def signals(self):
+    return self._signals
+
+  # May be called from any thread
+  def cancel(self):
+    self._cancelled = True
+
+  @property
+  def isCancelled(self):
+    return self._cancelled
+
+  # Add a step; 'action' is called with the snapshot as an argument
+  # and may store intermediate results in the job (see 'result').
+  def addStep(self, desc, action):
+    self._steps.append( (desc, action) )
+    return self
+
+  def addValidate(self, schema):
+    def act(snap):
+      schema.assertValid( snap.element )
+    return self.addStep( "Validating XML", act )
+
+  def addWriteXML(self, fnam):
+    tmp = fnam + ".tmp"
+    def act(snap):
+      snap.writeXML( tmp )
+    self.addStep( "Writing XML", act )
+    return self.addCommit( tmp, fnam )
+
+  def addWriteProm(self, fnam):
+    tmp = fnam + ".tmp"
+    res = dict()
+    def mk(snap):
+      res["prom"] = snap.makeProm()
+    def act(snap):
+      snap.writeProm( tmp, overwrite = True, prom = res["prom"] )
+    self.addStep( "Generating SII image", mk )
+    self.addStep( "Writing SII file", act )
+    return self.addCommit( tmp, fnam )
+
+  def addCommit(self, tmp, fnam):
+    def act(snap):
+      os.replace( tmp, fnam )
+    # remove leftovers if we are cancelled or fail before the rename
+    self._tmps.append( tmp )
+    return self.addStep( "Renaming " + fnam, act )
+
+  def run(self):
+    try:
+      n = len( self._steps )
+      for i in range( n ):
+        desc, act = self._steps[i]
+        if ( self._cancelled ):
+          raise JobCancelled()
+        self._signals.progress.emit( int( 100 * i / n ), desc )
+        act( self._snap )
+      self._signals.progress.emit( 100, "Done" )
+      self._signals.finished.emit( self._name )
+    except JobCancelled:
+      self._signals.cancelled.emit()
+    except Exception as e:
+      self._signals.failed.emit( "Error: " + str(e) + "\n" + traceback.format_exc() )
+    finally:
+      for t in self._tmps:
+        try:
+          os.remove( t )
+        except OSError:
+          pass
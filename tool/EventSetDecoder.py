@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Decoder (requires numpy) for the EventSet of the fixed TxPDO part: an
+# array of TXPDO_NUM_EVENT_DWORDS() 32-bit words with bit (code % 32) of
+# word (code / 32) set if event 'code' was received since the previous
+# TxPDO.
+#
+#   st = EventSetStats()
+#   for chunk in ...:                      # e.g., decodeTxPdo( ... )["EventSet"]
+#     st.update( chunk )
+#   st.counts[0x7d], st.histogram( 0x7d ), st.missing
+#
+# Whole chunks are bit-unpacked at once (only the non-zero words);
+# statistics are accumulated across chunks (inter-arrival gaps spanning
+# chunk boundaries are accounted for). Inter-arrival times are measured
+# in TxPDO cycles (frames).
+#
+# Missing occurrences of expected events are also counted before the
+# first and after the last occurrence (or for the entire stream if the
+# event never shows up): for this purpose the start and the end of the
+# stream count as occurrences at frames -1 and 'frames', respectively.
+# The trailing part is (re-)computed whenever 'missed' or 'missing' is
+# read, i.e., it always refers to the frames seen so far.
+
+import sys
+import numpy
+from   FirmwareConstants import FirmwareConstants
+
+NUM_CODES = 32 * FirmwareConstants.TXPDO_NUM_EVENT_DWORDS()
+
+# RETURNS: (nframes, NUM_CODES) boolean array; column 'c' is set if
+#          event code 'c' was seen
+def eventBits(eventSets):
+  e = numpy.ascontiguousarray( eventSets, dtype = numpy.dtype( "<u4" ) )
+  if ( 1 == e.ndim ):
+    e = e.reshape( 1, -1 )
+  # little-endian bytes + little bit-order: bit index == event code
+  return numpy.unpackbits( e.view( numpy.uint8 ), axis = 1, bitorder = "little" ).view( bool )
+
+# RETURNS: event codes seen in a single EventSet
+def eventCodes(eventSet):
+  return numpy.flatnonzero( eventBits( eventSet )[0] )
+
+class EventSetStats(object):
+
+  # 'maxGap': inter-arrival histograms have bins 1..maxGap (bin 0 counts
+  # gaps > maxGap); at most 'maxReports' missing-event reports are kept
+  def __init__(self, maxGap = 64, maxReports = 1000):
+    super().__init__()
+    self._maxGap   = maxGap
+    self._maxRep   = maxReports
+    self._expect   = dict()
+    self.reset()
+
+  def reset(self):
+    self._frames   = 0
+    self._counts   = numpy.zeros( NUM_CODES, dtype = numpy.int64 )
+    # frame number of the last occurrence (-1: none yet)
+    self._last     = numpy.full( NUM_CODES, -1, dtype = numpy.int64 )
+    self._hist     = numpy.zeros( ( NUM_CODES, self._maxGap + 1 ), dtype = numpy.int64 )
+    self._missed   = numpy.zeros( NUM_CODES, dtype = numpy.int64 )
+    self._missing  = list()
+
+  # Declare that event 'code' is expected every 'period' frames; larger
+  # gaps are reported as missing events.
+  def expect(self, code, period = 1):
+    self._expect[code] = period
+
+  @property
+  def frames(self):
+    return self._frames
+
+  # occurrences per event code
+  @property
+  def counts(self):
+    return self._counts
+
+  # RETURNS: missed occurrences and reports of expected events since
+  #          their last occurrence (up to the end of the stream)
+  def _trailing(self):
+    missed = numpy.zeros( NUM_CODES, dtype = numpy.int64 )
+    reps   = list()
+    for c, p in self._expect.items():
+      g         = self._frames - self._last[c]
+      missed[c] = ( g + p - 1 ) // p - 1
+      if ( missed[c] > 0 ):
+        reps.append( ( self._frames, c, int( g ) ) )
+    return missed, reps
+
+  # number of missed occurrences of expected events, per code
+  @property
+  def missed(self):
+    return self._missed + self._trailing()[0]
+
+  # list of (frame, code, gap) for gaps exceeding the expected period;
+  # the gap ends at 'frame' ('frames' if the event stopped/never arrived)
+  @property
+  def missing(self):
+    reps = self._trailing()[1]
+    return self._missing + reps[0:max( 0, self._maxRep - len( self._missing ) )]
+
+  # inter-arrival histogram of 'code' (index: gap in frames; index 0:
+  # gaps larger than maxGap)
+  def histogram(self, code):
+    return self._hist[code]
+
+  # RETURNS: the most frequent inter-arrival gap of 'code' (0 if unknown)
+  def modalGap(self, code):
+    h = self._hist[code][1:]
+    return int( numpy.argmax( h ) ) + 1 if h.any() else 0
+
+  # RETURNS: number of gaps differing from the modal one
+  def irregular(self, code):
+    m = self.modalGap( code )
+    return int( self._hist[code].sum() - ( self._hist[code][m] if m > 0 else 0 ) )
+
+  # RETURNS: event codes and frame numbers (relative to the chunk) of
+  #          all occurrences, ordered by frame; only non-zero words are
+  #          unpacked (event sets are sparse)
+  @staticmethod
+  def occurrences(eventSets):
+    e        = numpy.ascontiguousarray( eventSets, dtype = numpy.dtype( "<u4" ) )
+    if ( 1 == e.ndim ):
+      e = e.reshape( 1, -1 )
+    frm, wrd = numpy.nonzero( e )
+    b        = numpy.unpackbits( e[frm, wrd].view( numpy.uint8 ).reshape( -1, 4 ), axis = 1, bitorder = "little" )
+    r, bit   = numpy.nonzero( b )
+    return wrd[r] * 32 + bit, frm[r]
+
+  def update(self, eventSets):
+    n             = len( eventSets )
+    code, frm     = self.occurrences( eventSets )
+    self._counts += numpy.bincount( code, minlength = NUM_CODES )
+    frm           = frm + self._frames
+    # expected events which show up for the first time: the stream start
+    # counts as an occurrence at frame -1
+    for c, p in self._expect.items():
+      if ( self._last[c] < 0 ):
+        f = frm[ code == c ]
+        if ( len( f ) > 0 and f[0] >= p ):
+          self._missed[c] += f[0] // p
+          if ( len( self._missing ) < self._maxRep ):
+            self._missing.append( ( int( f[0] ), c, int( f[0] ) + 1 ) )
+    # prepend the last occurrence (previous chunks) of every code seen
+    seen          = numpy.flatnonzero( self._last >= 0 )
+    code          = numpy.concatenate( ( seen, code ) )
+    frm           = numpy.concatenate( ( self._last[seen], frm ) )
+    # order by code, then frame (frames are already ordered)
+    o             = numpy.argsort( code, kind = "stable" )
+    code          = code[o]
+    frm           = frm[o]
+    same          = code[1:] == code[:-1]
+    gcode         = code[1:][same]
+    gap           = ( frm[1:] - frm[:-1] )[same]
+    gbin          = numpy.where( gap > self._maxGap, 0, gap )
+    numpy.add.at( self._hist, ( gcode, gbin ), 1 )
+    for c, p in self._expect.items():
+      sel  = ( gcode == c ) & ( gap > p )
+      self._missed[c] += ( ( gap[sel] + p - 1 ) // p - 1 ).sum()
+      k    = self._maxRep - len( self._missing )
+      for f, g in zip( frm[1:][same][sel][0:k], gap[sel][0:k] ):
+        self._missing.append( ( int( f ), c, int( g ) ) )
+    # last occurrence of every code
+    if ( len( code ) > 0 ):
+      lst = numpy.flatnonzero( numpy.append( code[1:] != code[:-1], True ) )
+      self._last[ code[lst] ] = frm[lst]
+    self._frames += n
+
+  def __str__(self):
+    l      = [ "{:d} frames".format( self._frames ) ]
+    missed = self.missed
+    codes  = numpy.union1d( numpy.flatnonzero( self._counts ), list( self._expect.keys() ) ).astype( numpy.int64 )
+    for c in codes:
+      l.append( "event 0x{:02x}: {:10d} ({:.4f}/frame), modal gap {:4d}, irregular {:d}{}".format(
+                  c, self._counts[c], self._counts[c] / max( self._frames, 1 ), self.modalGap( c ), self.irregular( c ),
+                  ", missed {:d}".format( missed[c] ) if c in self._expect else "" ) )
+    return "\n".join( l )
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi, txPdoDtype, decodeTxPdo
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hc:s:o:e:n:" )
+
+  chunk  = 100000
+  stride = None
+  offset = 0
+  expect = []
+  field  = "EventSet"
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-c chunk] [-o offset] [-s stride] [-n field] [-e code[:period]] esi-or-sii-file capture-file".format( sys.argv[0] ))
+      print("  Per-event-code statistics of the EventSets in raw TxPDO images")
+      print("   -h   : print this message")
+      print("   -c   : frames per chunk (default: {:d})".format( chunk ))
+      print("   -o   : byte offset of the first image (default: 0)")
+      print("   -s   : distance between images (default: TxPDO size)")
+      print("   -n   : name of the EventSet field (default: '{}')".format( field ))
+      print("   -e   : report missing occurrences of 'code' (expected every 'period' frames; default 1); may be repeated")
+      sys.exit(0)
+    elif opt[0] in ('-c'):
+      chunk  = int( opt[1], 0 )
+    elif opt[0] in ('-o'):
+      offset = int( opt[1], 0 )
+    elif opt[0] in ('-s'):
+      stride = int( opt[1], 0 )
+    elif opt[0] in ('-n'):
+      field  = opt[1]
+    elif opt[0] in ('-e'):
+      c = opt[1].split(":")
+      expect.append( ( int( c[0], 0 ), int( c[1], 0 ) if len( c ) > 1 else 1 ) )
+
+  if ( len( args ) < 2 ):
+    print( "Error: ESI (or SII) and capture file required", file = sys.stderr )
+    sys.exit(1)
+
+  dt  = txPdoDtype( loadEsi( args[0] ) )
+  rec = decodeTxPdo( numpy.memmap( args[1], dtype = numpy.uint8, mode = "r" ), dt, offset, stride )
+  st  = EventSetStats()
+  for c, p in expect:
+    st.expect( c, p )
+  for i in range( 0, len( rec ), chunk ):
+    st.update( rec[field][i:i+chunk] )
+  print( st )
+  for f, c, g in st.missing:
+    print( "frame {:d}: event 0x{:02x} after {:d} frames".format( f, c, g ) )
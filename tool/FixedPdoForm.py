@@ -66,6 +66,7 @@ class LineEditChecker(QtWidgets.QCheckBox):
 
   def __call__(self, onoff):
     self._pdoForm._modified = True
+    self._pdoForm.updateBudget()
     for l in self._ledt:
       self.setLineEditState( l )
 
@@ -82,6 +83,7 @@ class FixedPdoForm(object):
     self._frm.addRow( QtWidgets.QLabel("Name"), QtWidgets.QLabel("Index (hex)") )
     vb.addLayout( self._frm )
     self._groups = list()
+    self._budget = None
     if not pdoElementList is None:
       self.addGroup( pdoElementList )
     self._modified = False
@@ -109,6 +111,23 @@ class FixedPdoForm(object):
     else:
       raise ValueError("Only PdoElement or PdoElementGroup objects may be added to FixedPdoForm")
 
+  # Attach a 'PromBudget'; the checked entries are accounted for
+  def setBudget(self, budget):
+    self._budget = budget
+    self.updateBudget()
+
+  def updateBudget(self):
+    if self._budget is None:
+      return
+    for g in self._groups:
+      names = list()
+      nbyts = 0
+      if g[1].isChecked():
+        for e in g[0].elements:
+          names.extend( self._budget.entryNames( e.name, e.nelms, e.indexedName ) )
+          nbyts += e.byteSz * e.nelms
+      self._budget.setEntries( g[0], names, nbyts )
+
   def getGuiVals(self):
     l = list()
     m = 1
@@ -13,6 +13,9 @@ from   FixedPdoForm       import FixedPdoForm, PdoElementGroup
 # XML interface
 from   lxml               import etree as ET
 from   ToolCore           import VendorData, Pdo, NetConfig, ESI
+from   PdoImport          import PdoLayoutImport
+from   EsiWorker          import EsiJob
+from   PromBudget         import PromBudget
 import traceback
 
 class VendorDataAdapter(object):
@@ -157,17 +160,28 @@ class VendorDataAdapter(object):
       self.__gui.addGroup( self.makeFixedPdoEl( nidx, idx ), checked )
       nidx    += 1
       msk    <<= 1
+    # setting up the check-boxes marks the form modified
+    self.__gui.resetModified()
     return self.__gui.topLayout
 
+  @property
+  def fixedPdoGuiReady(self):
+    return not self.__gui is None
+
   def getGuiVals(self):
     return self.__gui.getGuiVals()
 
+  def setBudget(self, budget):
+    self.__gui.setBudget( budget )
+
+  # the form may not have been built yet (see LazySection)
   def modified(self):
-    return self.vendorData.modified or self.__gui.modified
+    return self.vendorData.modified or ( self.fixedPdoGuiReady and self.__gui.modified )
 
   def resetModified(self):
     self.vendorData.resetModified()
-    self.__gui.resetModified()
+    if ( self.fixedPdoGuiReady ):
+      self.__gui.resetModified()
 
   def makeEvrCfgGui(self):
     def mkCodGet(vd, ev):
@@ -268,9 +282,16 @@ class VendorDataAdapter(object):
 
 
 class PdoAdapter(object):
+
+  # number of items added per event-loop iteration while
+  # populating the table
+  FILL_CHUNK = 64
+
   def __init__(self, pdo):
-    self.__gui = None
-    self._pdo  = pdo
+    self.__gui    = None
+    self._pdo     = pdo
+    self._pdoGui  = None
+    self._pdoFill = None
 
   @property
   def pdo(self):
@@ -286,26 +307,76 @@ class PdoAdapter(object):
     self.__gui   = vb
     self._pdoGui = PdoListWidget( vendor.maxNumSegments, parent )
     vb.addWidget( self._pdoGui )
+    # populate the table asynchronously (from the event loop) so that
+    # the window can be painted first
+    self._pdoGui.setEnabled( False )
+    self._pdoFill = self.fillPdoGui( vendor )
+    QtCore.QTimer.singleShot( 0, self.fillPdoGuiStep )
+    return self.__gui
+
+  # generator; yields every FILL_CHUNK items
+  def fillPdoGui(self, vendor):
     for s in vendor.segments[1:]:
       # we don't want to hand over ownership so we make a copy
-      self._pdoGui.addSegment( s.clone() )
+      self._pdoGui.addSegment( s.clone(), disableRender = True )
     try:
+      n = 0
       for e in self._pdo[vendor.numEntries:]:
         self._pdoGui.add( PdoElement( e.name, e.index, e.byteSz, e.nelms, e.isSigned, e.typeName, e.indexedName ) )
+        n += 1
+        if ( 0 == n % self.FILL_CHUNK ):
+          yield n
     except Exception as e:
       print("WARNING -- unable to add all entries found in XML:")
       print( str(e) )
     self._pdoGui.render()
-    return self.__gui
+    self._pdoGui.resetModified()
+    self._pdoGui.setEnabled( True )
+
+  def fillPdoGuiStep(self):
+    if ( self._pdoFill is None ):
+      return
+    try:
+      next( self._pdoFill )
+      QtCore.QTimer.singleShot( 0, self.fillPdoGuiStep )
+    except StopIteration:
+      self._pdoFill = None
+      self.pdoGuiReady()
+
+  # complete populating the table synchronously
+  def finishPdoGui(self):
+    if ( self._pdoFill is None ):
+      return
+    for n in self._pdoFill:
+      pass
+    self._pdoFill = None
+    self.pdoGuiReady()
+
+  # called once the table has been populated
+  def pdoGuiReady(self):
+    pass
 
   def getGuiVals(self):
     return self._pdoGui.getGuiVals()
 
+  def setBudget(self, budget):
+    self._pdoGui.setBudget( budget )
+
+  # RETURNS: None or an error message
+  def importLayout(self, fnam):
+    try:
+      layout = PdoLayoutImport.fromFile( fnam )
+    except Exception as e:
+      return "ERROR -- unable to read layout from '{}'\n{}".format( fnam, str(e) )
+    return self._pdoGui.importLayout( layout )
+
+  # the table may not have been populated yet
   def modified(self):
-    return self._pdoGui.modified
+    return ( not self._pdoGui is None ) and self._pdoGui.modified
 
   def resetModified(self):
-    self._pdoGui.resetModified()
+    if ( not self._pdoGui is None ):
+      self._pdoGui.resetModified()
 
 class Ip4Validator(QtGui.QRegExpValidator):
   def __init__(self):
@@ -322,6 +393,78 @@ class Ip4Validator(QtGui.QRegExpValidator):
           return QtGui.QValidator.Invalid
     return st
 
+# A section of the main window which is built when it is first shown
+# (or when 'build' is called explicitly).
+class LazySection(QtWidgets.QWidget):
+  def __init__(self, builder, parent = None):
+    super().__init__( parent )
+    self._builder = builder
+    self._ready   = list()
+
+  @property
+  def isBuilt(self):
+    return self._builder is None
+
+  # 'callback' is executed (with the section as an argument) once built
+  def onBuilt(self, callback):
+    self._ready.append( callback )
+
+  def showEvent(self, event):
+    super().showEvent( event )
+    if ( not self.isBuilt ):
+      # let the window paint first
+      QtCore.QTimer.singleShot( 0, self.build )
+
+  def build(self):
+    if ( self.isBuilt ):
+      return
+    bld           = self._builder
+    self._builder = None
+    lay           = bld()
+    lay.setContentsMargins( 0, 0, 0, 0 )
+    self.setLayout( lay )
+    for cb in self._ready:
+      cb( self )
+
+# Status-bar gauges showing the resources used (see PromBudget)
+class BudgetGauges(object):
+  def __init__(self):
+    self._bars = dict()
+    for k, tip in [ ("SII",  "EEPROM (SII) bytes used"),
+                    ("Str",  "Number of SII strings used"),
+                    ("Maps", "Hardware TxPDO mappings used\n(8-byte swap uses TWO maps per dword)"),
+                    ("SM3",  "TxPDO (SM3) bytes used") ]:
+      b = QtWidgets.QProgressBar()
+      b.setMaximumWidth( 160 )
+      b.setToolTip( tip )
+      self._bars[k] = b
+    self._pal = self._bars["SII"].palette()
+    self._red = QtGui.QPalette( self._pal )
+    self._red.setColor( QtGui.QPalette.Highlight, QtCore.Qt.red )
+
+  def addTo(self, statusBar):
+    for b in self._bars.values():
+      statusBar.addPermanentWidget( b )
+
+  def setGauge(self, k, val, lim):
+    b = self._bars[k]
+    if val is None:
+      b.setMaximum( 1 )
+      b.setValue( 0 )
+      b.setFormat( "{}: n/a".format( k ) )
+      return
+    b.setMaximum( lim )
+    b.setValue( min( val, lim ) )
+    b.setFormat( "{}: {:d}/{:d}".format( k, val, lim ) )
+    b.setPalette( self._red if val > lim else self._pal )
+
+  # PromBudget listener
+  def __call__(self, budget):
+    self.setGauge( "SII",  budget.promBytes,  budget.maxPromBytes()  )
+    self.setGauge( "Str",  budget.numStrings, budget.maxStrings()    )
+    self.setGauge( "Maps", budget.hwSegs,     budget.maxHwSegs       )
+    self.setGauge( "SM3",  budget.txPdoBytes, budget.maxTxPdoBytes() )
+
 class QuitDialog(DialogBase):
   def __init__(self, *args, **kwargs):
     super().__init__(*args, hasDelete = False, **kwargs)
@@ -340,12 +483,25 @@ class MyMainWindow(QtWidgets.QMainWindow):
     self._gui.mkQuit( event.accept, event.ignore )()
 
 class ESIAdapter(VendorDataAdapter, PdoAdapter):
-  def __init__(self, esi, fnam = None):
+  def __init__(self, esi, fnam = None, schema = None):
     VendorDataAdapter.__init__(self, esi.vendorData)
     PdoAdapter.__init__(self, esi.txPdo)
-    self._esi  = esi
-    self._main = None
-    self._fnam = fnam
+    self._esi    = esi
+    self._main   = None
+    self._fnam   = fnam
+    self._schema = schema
+    # set when a background save fails or is cancelled; the
+    # GUI state was already marked 'unmodified' at that point.
+    self._dirty  = False
+    # saving and writing the SII is done by a worker thread; run
+    # one job at a time.
+    self._pool   = QtCore.QThreadPool()
+    self._pool.setMaxThreadCount( 1 )
+    self._jobs   = list()
+    self._poll   = None
+    self._prgBar = None
+    self._budget = PromBudget( esi.vendorData.maxNumSegments )
+    self._sections = list()
 
   @staticmethod
   def qopen(nam):
@@ -366,11 +522,18 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
     vlay   = QtWidgets.QVBoxLayout()
     layout.addLayout( hlay )
     hlay  .addLayout( vlay )
-    vlay.addLayout( VendorDataAdapter.makeNetCfgGui( self ) )
-    vlay.addLayout( VendorDataAdapter.makeClkCfgGui( self ) )
-    vlay.addLayout( VendorDataAdapter.makeEvrCfgGui( self ) )
-    vlay.addLayout( VendorDataAdapter.makeGui( self, self ) )
-    hlay.addLayout( PdoAdapter.makeGui( self, self )        )
+    # the sections are built on first display (after the window is painted)
+    self._sections = [
+      self.mkSection( lambda: VendorDataAdapter.makeNetCfgGui( self ) ),
+      self.mkSection( lambda: VendorDataAdapter.makeClkCfgGui( self ) ),
+      self.mkSection( lambda: VendorDataAdapter.makeEvrCfgGui( self ) ),
+      self.mkSection( lambda: VendorDataAdapter.makeGui( self, self ) ),
+      self.mkSection( lambda: PdoAdapter.makeGui( self, self )        )
+    ]
+    for sec in self._sections[:-1]:
+      vlay.addWidget( sec )
+    hlay.addWidget( self._sections[-1] )
+    self._sections[3].onBuilt( lambda sec: self.sectionBuilt() )
     window.setLayout( layout )
     main       = MyMainWindow( self )
     self._main = main
@@ -423,7 +586,7 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
         try:
           self.saveTo( self._fnam )
         except Exception as e:
-          DialogBase( hasDelete = False, parent = self._main, hasCancel = False ).setMsg( "Error: " + str(e) + "\n" + traceback.format_exc() ).show()
+          self.showError( "Error: " + str(e) + "\n" + traceback.format_exc() )
       return save
 
     def mkSaveAs(slf):
@@ -435,9 +598,23 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
         try:
           self.saveTo( fn[0] )
         except Exception as e:
-          DialogBase( hasDelete = False, parent = self._main, hasCancel = False ).setMsg( "Error: " + str(e) + "\n" + traceback.format_exc() ).show()
+          self.showError( "Error: " + str(e) + "\n" + traceback.format_exc() )
       return saveAs
 
+    def mkImport(slf):
+      def importLayout():
+        op  = QtWidgets.QFileDialog.Options()
+        op |= QtWidgets.QFileDialog.DontUseNativeDialog;
+        fn  = QtWidgets.QFileDialog.getOpenFileName(self._main, "Import PDO Layout", "", "Layout Files (*.csv *.json);;All Files (*)", options=op)
+        if ( 0 == len( fn[0] ) ):
+          # cancel
+          return
+        self.ensureGui()
+        msg = PdoAdapter.importLayout( self, fn[0] )
+        if not msg is None:
+          DialogBase( hasDelete = False, parent = self._main, hasCancel = False ).setMsg( msg ).show()
+      return importLayout
+
     def mkWriteSii(slf):
       def writeSii():
         if ( self.modified() ):
@@ -454,9 +631,10 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
           return
         try:
           self.update()
-          self._esi.writeProm( fn[0], overwrite=True )
+          job = EsiJob( self._esi.snapshot(), "SII file '{}'".format( fn[0] ) )
+          self.startJob( job.addWriteProm( fn[0] ) )
         except Exception as e:
-          DialogBase( hasDelete = False, parent = self._main, hasCancel = False ).setMsg( "Error: " + str(e) + "\n" + traceback.format_exc() ).show()
+          self.showError( "Error: " + str(e) + "\n" + traceback.format_exc() )
       return writeSii
 
     if ( not self._fnam is None ):
@@ -465,27 +643,154 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
         self._main.setWindowTitle( self._fnam )
     fileMenu.addAction( "Save As" ).triggered.connect( mkSaveAs( self ) )
     fileMenu.addAction( "Write SII (EEPROM) File" ).triggered.connect( mkWriteSii( self ) )
+    fileMenu.addAction( "Import PDO Layout (CSV/JSON)" ).triggered.connect( mkImport( self ) )
     fileMenu.addAction( "Quit" ).triggered.connect( self.mkQuit() )
     main.setMenuBar( menuBar )
+    self._prgBar = QtWidgets.QProgressBar()
+    self._prgBar.setMaximumWidth( 200 )
+    self._prgBar.hide()
+    main.statusBar().addPermanentWidget( self._prgBar )
+    gauges = BudgetGauges()
+    gauges.addTo( main.statusBar() )
+    self._budget.addListener( gauges )
+    gauges( self._budget )
     return main
 
+  # Setting up the widgets of a section may touch the settings; this
+  # does not count as a modification.
+  def mkSection(self, builder):
+    def bld():
+      mod = self.modified()
+      lay = builder()
+      if ( not mod ):
+        self.resetModified()
+      return lay
+    return LazySection( bld )
+
+  # Build all sections and populate the TxPDO table now (rather than
+  # waiting for them to be displayed); required before accessing the
+  # GUI state.
+  def ensureGui(self):
+    for sec in self._sections:
+      sec.build()
+    self.finishPdoGui()
+
+  def sectionBuilt(self):
+    # TxPDO table not populated yet?
+    if ( self._pdoGui is None or not self._pdoFill is None ):
+      return
+    self.guiReady()
+
+  def pdoGuiReady(self):
+    if ( self.fixedPdoGuiReady ):
+      self.guiReady()
+
+  # all the sections the budget depends on are available
+  def guiReady(self):
+    VendorDataAdapter.setBudget( self, self._budget )
+    PdoAdapter.setBudget( self, self._budget )
+    self.calibrateBudget()
+    if ( not self._main is None ):
+      self._main.adjustSize()
+
+  # Generate the SII image once to calibrate the budget
+  # (which is then updated incrementally).
+  def calibrateBudget(self):
+    try:
+      self.update()
+      self._budget.calibrate( self._esi.snapshot().makeProm() )
+    except Exception as e:
+      print("WARNING -- unable to compute SII size: " + str(e))
+
   def mkQuit( self, accept = lambda : sys.exit(0), ignore = lambda : None ):
     def quit():
       if ( self.modified() ):
         QuitDialog( parent = self._main ).show()
         ignore()
       else:
-        accept()
+        # let a pending save complete (and process its signals)
+        self._pool.waitForDone()
+        QtCore.QCoreApplication.processEvents()
+        if ( self.modified() ):
+          # it failed
+          ignore()
+        else:
+          accept()
     return quit
 
+  def showError(self, msg):
+    DialogBase( hasDelete = False, parent = self._main, hasCancel = False ).setMsg( msg ).show()
+
+  def showStatus(self, msg, tmo = 0):
+    if ( not self._main is None ):
+      self._main.statusBar().showMessage( msg, tmo )
+
+  # Run a job in the background; jobs are executed in order. Edits
+  # made while a job is pending cancel the job (the result would
+  # be stale).
+  def startJob(self, job):
+    def prg(pct, desc):
+      if ( not self._prgBar is None ):
+        self._prgBar.setValue( pct )
+        self.showStatus( desc + "..." )
+    def fin(name):
+      self.jobDone( job )
+      self.showStatus( "Wrote " + name, 5000 )
+    def err(msg):
+      self.jobDone( job )
+      self.showStatus( "" )
+      self.showError( msg )
+    def cnc():
+      self.jobDone( job )
+      self.showStatus( "Writing {} cancelled (edits made while writing)".format( job.name ), 5000 )
+    self._jobs.append( job )
+    job.signals.progress.connect( prg )
+    job.signals.finished.connect( fin )
+    job.signals.failed.connect( err )
+    job.signals.cancelled.connect( cnc )
+    if ( self._poll is None ):
+      self._poll = QtCore.QTimer()
+      self._poll.setInterval( 100 )
+      self._poll.timeout.connect( self.checkEdits )
+    self._poll.start()
+    if ( not self._prgBar is None ):
+      self._prgBar.setValue( 0 )
+      self._prgBar.show()
+    self._pool.start( job )
+
+  def checkEdits(self):
+    # jobs are only started on unmodified state (save resets the
+    # modified state when the snapshot is taken)
+    if ( self.modified() ):
+      for j in self._jobs:
+        j.cancel()
+
+  def jobDone(self, job):
+    self._jobs.remove( job )
+    if ( 0 == len( self._jobs ) ):
+      self._poll.stop()
+      if ( not self._prgBar is None ):
+        self._prgBar.hide()
+
   def saveTo(self, fnam):
     self.update()
     if ( self.modified() ):
       self._esi.bumpRevision()
-    self._esi.writeXML( fnam )
+    job = EsiJob( self._esi.snapshot(), "'{}'".format( fnam ) )
+    if ( not self._schema is None ):
+      job.addValidate( self._schema )
+    job.addWriteXML( fnam )
+    # the snapshot reflects the current state; edits made from
+    # now on mark the GUI modified again (and cancel the job).
     self.resetModified()
+    def undo():
+      self._dirty = True
+    job.signals.failed.connect( undo )
+    job.signals.cancelled.connect( undo )
+    self.startJob( job )
 
   def update(self):
+    self.ensureGui()
     segments, elements   = PdoAdapter.getGuiVals(self)
     flags, fixedElements = VendorDataAdapter.getGuiVals(self)
     self._vendorData.update( flags, segments )
@@ -493,8 +798,9 @@ class ESIAdapter(VendorDataAdapter, PdoAdapter):
     self._esi.update()
 
   def modified(self):
-    return PdoAdapter.modified(self) or VendorDataAdapter.modified(self)
+    return PdoAdapter.modified(self) or VendorDataAdapter.modified(self) or self._dirty
 
   def resetModified(self):
     PdoAdapter.resetModified(self)
     VendorDataAdapter.resetModified(self)
+    self._dirty = False
@@ -0,0 +1,160 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Opt-in timing of GUI hot-paths. Enabled by setting the environment
+# variable ESITOOL_PROFILE; if its value is not '1' it is used as the
+# name of the file the trace is written to on exit (default:
+# 'esitool-trace.json'). The trace uses the 'trace event' format and
+# can be loaded into chrome://tracing or https://ui.perfetto.dev.
+#
+# Instrumented methods are replaced by a timing wrapper; this must
+# be done before the objects are created (Qt slots are bound when
+# connected).
+
+from   PyQt5       import QtCore, QtWidgets
+from   collections import deque, OrderedDict
+import os
+import sys
+import time
+import json
+import atexit
+import functools
+
+class GuiProfiler(object):
+
+  ENV_VAR     = "ESITOOL_PROFILE"
+  DFLT_TRACE  = "esitool-trace.json"
+  # samples used for the rolling percentiles
+  WINDOW      = 200
+  # bound the size of the trace
+  MAX_TRACE   = 200000
+  PERCENTILES = [ 50, 90, 99 ]
+
+  def __init__(self, traceFile = None):
+    super().__init__()
+    self._samples   = OrderedDict()
+    self._counts    = dict()
+    self._trace     = deque( maxlen = self.MAX_TRACE )
+    self._t0        = time.perf_counter()
+    self._traceFile = traceFile
+
+  # RETURNS: a profiler (with the trace dumped at exit) or None if
+  #          profiling is not enabled
+  @classmethod
+  def fromEnv(clazz):
+    val = os.environ.get( clazz.ENV_VAR )
+    if val is None or 0 == len(val) or "0" == val:
+      return None
+    if "1" == val:
+      val = clazz.DFLT_TRACE
+    prof = clazz( val )
+    atexit.register( prof.dump )
+    return prof
+
+  def instrument(self, clazz, method, label = None):
+    if label is None:
+      label = "{}.{}".format( clazz.__name__, method )
+    fn = getattr( clazz, method )
+    @functools.wraps( fn )
+    def timed(*args, **kwargs):
+      t = time.perf_counter()
+      try:
+        return fn( *args, **kwargs )
+      finally:
+        self.record( label, t, time.perf_counter() )
+    setattr( clazz, method, timed )
+    self._samples[label] = deque( maxlen = self.WINDOW )
+    self._counts [label] = 0
+
+  def instrumentDefaults(self):
+    from PdoElement import PdoListWidget
+    from ToolCore   import ESI, VendorData
+    for m in [ "render", "renderSegments", "on_selection_changed", "moveItems" ]:
+      self.instrument( PdoListWidget, m )
+    self.instrument( ESI,        "syncElms" )
+    self.instrument( VendorData, "syncElms" )
+    return self
+
+  def record(self, label, t0, t1):
+    self._samples[label].append( t1 - t0 )
+    self._counts [label] += 1
+    self._trace.append( (label, t0, t1) )
+
+  @property
+  def labels(self):
+    return self._samples.keys()
+
+  # RETURNS: count, last, percentiles..., max (in seconds); None
+  #          values if there are no samples yet
+  def stats(self, label):
+    s = sorted( self._samples[label] )
+    n = len(s)
+    if 0 == n:
+      return [ self._counts[label] ] + [ None for i in range( len( self.PERCENTILES ) + 2 ) ]
+    rv = [ self._counts[label], self._samples[label][-1] ]
+    for p in self.PERCENTILES:
+      rv.append( s[ int( round( p/100.0 * (n - 1) ) ) ] )
+    rv.append( s[-1] )
+    return rv
+
+  def dump(self, fnam = None):
+    if fnam is None:
+      fnam = self._traceFile
+    if fnam is None:
+      return
+    evs = list()
+    for ev in self._trace:
+      evs.append( { "name" : ev[0], "ph" : "X", "pid" : 0, "tid" : 0,
+                    "ts"   : 1.0e6 * (ev[1] - self._t0),
+                    "dur"  : 1.0e6 * (ev[2] - ev[1]) } )
+    summary = dict()
+    for l in self.labels:
+      summary[l] = dict( zip( [ "count", "last" ] + [ "p{:d}".format(p) for p in self.PERCENTILES ] + [ "max" ],
+                              self.stats( l ) ) )
+    try:
+      with open( fnam, "w" ) as f:
+        json.dump( { "traceEvents" : evs, "displayTimeUnit" : "ms", "summary" : summary }, f )
+      print( "Profiling trace written to '{}'".format( fnam ), file = sys.stderr )
+    except OSError as e:
+      print( "WARNING -- unable to write profiling trace: {}".format( e ), file = sys.stderr )
+
+# Dock widget showing the rolling percentiles
+class GuiProfilerDock(QtWidgets.QDockWidget):
+
+  def __init__(self, profiler, parent = None, period_ms = 500):
+    super().__init__( "Profiling (ms)", parent )
+    self._prof = profiler
+    hdrs       = [ "Count", "Last" ] + [ "p{:d}".format(p) for p in profiler.PERCENTILES ] + [ "Max" ]
+    self._tbl  = QtWidgets.QTableWidget( len( profiler.labels ), len( hdrs ) )
+    self._tbl.setHorizontalHeaderLabels( hdrs )
+    self._tbl.setVerticalHeaderLabels( list( profiler.labels ) )
+    self._tbl.setEditTriggers( QtWidgets.QAbstractItemView.NoEditTriggers )
+    self._tbl.horizontalHeader().setSectionResizeMode( QtWidgets.QHeaderView.ResizeToContents )
+    self.setWidget( self._tbl )
+    self._tmr  = QtCore.QTimer( self )
+    self._tmr.timeout.connect( self.refresh )
+    self._tmr.start( period_ms )
+    self.refresh()
+
+  def refresh(self):
+    r = 0
+    for l in self._prof.labels:
+      st = self._prof.stats( l )
+      for c in range( len( st ) ):
+        if   st[c] is None:
+          txt = "-"
+        elif 0 == c:
+          txt = "{:d}".format( st[c] )
+        else:
+          txt = "{:.3f}".format( 1000.0 * st[c] )
+        it = self._tbl.item( r, c )
+        if it is None:
+          it = QtWidgets.QTableWidgetItem()
+          it.setTextAlignment( QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter )
+          self._tbl.setItem( r, c, it )
+        it.setText( txt )
+      r += 1
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Transaction-level timing model of the HBI bus (in clock cycles) for
+# tuning the TxPDO burst generics:
+#
+#   tim = HbiTiming( clkHz = 100.0E6 )
+#   txp = TxPdoWriter( pdoBytes = 1024, burstMax = 16, burstGap = 8, updateHz = 5.0E3 )
+#   mbx = MailboxLoad( "EoE", PRIO_ESC, bytesPerSec = 2.0E6, frameBytes = 1500 )
+#   res = HbiModel( tim, [ txp, mbx ] ).run()
+#   print( res )
+#
+#   best, all = sweep( tim, 1024, [4, 8, 16, 32], [0, 8, 32], loads = ... )
+#
+# Access timing (Lan9254HbiImpl.vhd): every delay constant is
+# initCnt( t * clkHz ) = ceil( t * clkHz ) - 1 extra cycles; a 16-bit
+# access takes
+#
+#   IDLE + ADDR + TWALE + AWAIT + TADRH + AWAIT + { TWR   + WRITE-ack + TDWRH + WRITE
+#                                                 | TRDWA + READ-ack }        + HSHK
+#
+# cycles. The ack cycles depend on the chip: the wait-ack signal is
+# released 'wrAckNs' ('rdAckNs') after WR (RD) is asserted and passes
+# SYNC_STAGES synchronizer flip-flops (the wait is capped by the
+# wait-ack timeout). A 32-bit access repeats the address/data phase
+# for the second half after TRDAL cycles.
+#
+# Arbitration (Lan9254ESC.vhd): when the bus is idle the requester with
+# the highest priority (TxPDO > RxPDO > RX mailbox > ESC > external)
+# among those with a valid request wins; accesses are never preempted.
+# After an access completes a requester needs a few cycles before it
+# asserts its next request; ESCTxPDO needs 2 cycles within a burst,
+# 3 + TXPDO_BURST_GAP_G after a burst of TXPDO_BURST_MAX_G + 1 writes
+# and 3 + TXPDO_UPDATE_DECIMATION_G after the last word. Note that a
+# waiting requester therefore gets the bus between any two TxPDO writes,
+# i.e., the burst length mostly determines how often the gap is paid.
+
+import sys
+import math
+import random
+
+SYNC_STAGES = 2
+# (seconds; as in Lan9254HbiImpl so the counts come out identical)
+MARGIN      = 5.0E-9
+
+# arbitration priorities (lower wins)
+PRIO_TXPDO  = 0
+PRIO_RXPDO  = 1
+PRIO_RXMBX  = 2
+PRIO_ESC    = 3
+PRIO_EXT    = 4
+
+class HbiTiming(object):
+
+  def __init__(self, clkHz = 100.0E6, wrAckNs = 45.0, rdAckNs = 180.0):
+    super().__init__()
+    self.clkHz   = clkHz
+    self.twale   = self.initCnt( 10.0E-9 + MARGIN )
+    self.tadrh   = self.initCnt(  5.0E-9 + MARGIN )
+    self.trdal   = self.initCnt( 13.0E-9 + MARGIN )
+    self.trdwa   = self.initCnt( 10.0E-9 + MARGIN ) + SYNC_STAGES
+    self.twr     = self.initCnt( 32.0E-9 + MARGIN )
+    self.tdwrh   = self.initCnt(  5.0E-9 + MARGIN )
+    self.timeo   = self.initCnt( 600.0E-9 )
+    self.wrAck   = self.ackCycles( wrAckNs, self.twr )
+    self.rdAck   = self.ackCycles( rdAckNs, self.trdwa )
+    self._cache  = dict()
+
+  # VHDL initCnt (ESCBasicTypesPkg) of 't' (seconds) times the clock
+  def initCnt(self, t):
+    return int( math.ceil( t * self.clkHz ) ) - 1
+
+  # cycles spent in the READ/WRITE state waiting for the (synchronized)
+  # wait-ack after the strobe delay 'dly' expired
+  def ackCycles(self, ackNs, dly):
+    c = int( math.ceil( ackNs * 1.0E-9 * self.clkHz ) ) + SYNC_STAGES - dly
+    return min( max( c, 1 ), self.timeo + 1 )
+
+  def ns(self, cycles):
+    return cycles * 1.0E9 / self.clkHz
+
+  # RETURNS: clock cycles the HBI is occupied by an access (16-bit:
+  #          halves = 1, 32-bit: halves = 2)
+  def cycles(self, read = False, halves = 1):
+    k = ( read, halves )
+    if ( not k in self._cache ):
+      addr = 1 + self.twale + 1 + self.tadrh + 1
+      if ( read ):
+        half = addr + self.trdwa + self.rdAck
+      else:
+        half = addr + self.twr   + self.wrAck
+      c = 1 + halves * half + ( halves - 1 ) * self.trdal + 1
+      if ( not read ):
+        c += self.tdwrh + 1
+      self._cache[k] = c
+    return self._cache[k]
+
+# Percentiles etc. of a list of values (cycles)
+class LatencyStats(object):
+
+  def __init__(self):
+    super().__init__()
+    self.values = []
+
+  def add(self, v):
+    self.values.append( v )
+
+  def __len__(self):
+    return len( self.values )
+
+  def mean(self):
+    return sum( self.values ) / len( self.values ) if len( self.values ) > 0 else 0.0
+
+  def percentile(self, p):
+    if ( 0 == len( self.values ) ):
+      return 0
+    s = sorted( self.values )
+    return s[ min( int( p / 100.0 * len( s ) ), len( s ) - 1 ) ]
+
+  def max(self):
+    return max( self.values ) if len( self.values ) > 0 else 0
+
+# Requesters: 'request()' RETURNS the cycle at which the next request is
+# asserted (None if there are no more), 'granted(g, c)' is called when
+# the access is granted in cycle 'g' and completes (rep.valid) in cycle
+# 'c'. 'finite' requesters determine the end of the simulation.
+class HbiRequester(object):
+
+  def __init__(self, name, prio, finite = False):
+    super().__init__()
+    self.name    = name
+    self.prio    = prio
+    self.finite  = finite
+    self.busy    = 0
+    self.waits   = LatencyStats()
+
+  def accessCycles(self, timing):
+    return timing.cycles()
+
+  def request(self):
+    raise NotImplementedError()
+
+  def granted(self, g, c):
+    raise NotImplementedError()
+
+class TxPdoWriter(HbiRequester):
+
+  # 'updateHz': rate at which new TxPDO data are available (None: always)
+  def __init__(self, pdoBytes, burstMax = 16, burstGap = 8, maxUpdHz = 5.0E3, updateHz = None, nUpdates = 200):
+    super().__init__( "TxPDO", PRIO_TXPDO, finite = True )
+    self.pdoBytes  = pdoBytes
+    self.burstMax  = burstMax
+    self.burstGap  = burstGap
+    self.maxUpdHz  = maxUpdHz
+    self.updateHz  = updateHz
+    self.nUpdates  = nUpdates
+    self.latency   = LatencyStats()
+    self._timing   = None
+
+  def setup(self, timing):
+    self._timing  = timing
+    self._decim   = int( round( timing.clkHz / self.maxUpdHz ) )
+    self._bmax    = min( self.burstMax, self._decim )
+    self._words   = ( self.pdoBytes + 1 ) // 2
+    self._period  = None if self.updateHz is None else timing.clkHz / self.updateHz
+    self._upd     = 0
+    self._word    = 0
+    self._bst     = self._bmax
+    self._ready   = 0
+    self._start   = 0
+    self._first   = None
+    self._last    = None
+
+  def _dataAt(self, k):
+    return 0 if self._period is None else int( math.ceil( k * self._period ) )
+
+  def request(self):
+    if ( self._upd >= self.nUpdates ):
+      return None
+    if ( 0 == self._word ):
+      # IDLE -> PROC once the decimation expired and data are available
+      self._start = max( self._ready, self._dataAt( self._upd ) )
+      return self._start
+    return self._ready
+
+  def granted(self, g, c):
+    self.waits.add( g - self._ready if self._word > 0 else g - self._start )
+    self._word += 1
+    if ( self._word >= self._words ):
+      self.latency.add( c - self._start )
+      if ( self._first is None ):
+        self._first = self._start
+      self._last  = c
+      self._upd  += 1
+      self._word  = 0
+      self._bst   = self._bmax
+      self._ready = c + 3 + self._decim
+    elif ( 0 == self._bst ):
+      self._bst   = self._bmax
+      self._ready = c + 3 + self.burstGap
+    else:
+      self._bst  -= 1
+      self._ready = c + 2
+
+  # RETURNS: achieved update rate (Hz)
+  def updateRate(self):
+    if ( self._upd < 2 ):
+      return 0.0
+    return ( self._upd - 1 ) * self._timing.clkHz / ( self._last - self._first )
+
+# Competing traffic: frames of 'frameBytes' arriving at 'bytesPerSec'
+# (periodically or, if 'seed' is given, Poisson-distributed), each
+# transferred by back-to-back 32-bit accesses
+class MailboxLoad(HbiRequester):
+
+  def __init__(self, name, prio, bytesPerSec, frameBytes = 1500, read = False, turnCycles = 2, seed = None):
+    super().__init__( name, prio )
+    self.bytesPerSec = bytesPerSec
+    self.frameBytes  = frameBytes
+    self.read        = read
+    self.turnCycles  = turnCycles
+    self.seed        = seed
+    self.latency     = LatencyStats()
+
+  def accessCycles(self, timing):
+    return timing.cycles( self.read, 2 )
+
+  def setup(self, timing):
+    self._accs   = ( self.frameBytes + 3 ) // 4
+    self._period = timing.clkHz * self.frameBytes / self.bytesPerSec
+    self._rnd    = None if self.seed is None else random.Random( self.seed )
+    self._arr    = 0.0
+    self._nxtArr = self._nextArrival()
+    self._acc    = 0
+    self._ready  = int( math.ceil( self._nxtArr ) )
+    self._frmArr = self._ready
+
+  def _nextArrival(self):
+    if ( self._rnd is None ):
+      self._arr += self._period
+    else:
+      self._arr += self._rnd.expovariate( 1.0 / self._period )
+    return self._arr
+
+  def request(self):
+    return self._ready
+
+  def granted(self, g, c):
+    self.waits.add( g - self._ready )
+    self._acc += 1
+    if ( self._acc >= self._accs ):
+      self.latency.add( c - self._frmArr )
+      self._acc    = 0
+      self._frmArr = int( math.ceil( self._nextArrival() ) )
+      self._ready  = max( c + self.turnCycles, self._frmArr )
+    else:
+      self._ready  = c + self.turnCycles
+
+class HbiModelResult(object):
+
+  def __init__(self, timing, requesters, cycles, busy):
+    super().__init__()
+    self.timing     = timing
+    self.requesters = requesters
+    self.cycles     = cycles
+    self.busy       = busy
+
+  @property
+  def utilisation(self):
+    return self.busy / self.cycles if self.cycles > 0 else 0.0
+
+  def txPdo(self):
+    for r in self.requesters:
+      if ( isinstance( r, TxPdoWriter ) ):
+        return r
+    return None
+
+  def __str__(self):
+    ns = self.timing.ns
+    l  = []
+    l.append( "clock {:.1f}MHz, 16-bit write {:d} cycles ({:.0f}ns), 32-bit write {:d}, 16-bit read {:d}, 32-bit read {:d}".format(
+                self.timing.clkHz / 1.0E6, self.timing.cycles(), ns( self.timing.cycles() ),
+                self.timing.cycles( False, 2 ), self.timing.cycles( True ), self.timing.cycles( True, 2 ) ) )
+    l.append( "simulated {:.1f}us, HBI utilisation {:.1f}%".format( ns( self.cycles ) / 1000.0, 100.0 * self.utilisation ) )
+    for r in self.requesters:
+      l.append( "{:<8s}: share {:5.1f}%, arbitration wait mean {:.0f}ns max {:.0f}ns".format(
+                  r.name, 100.0 * r.busy / self.cycles, ns( r.waits.mean() ), ns( r.waits.max() ) ) )
+      if ( len( r.latency ) > 0 ):
+        l.append( "          latency mean {:.2f}us p99 {:.2f}us max {:.2f}us ({:d} {})".format(
+                    ns( r.latency.mean() ) / 1000.0, ns( r.latency.percentile( 99 ) ) / 1000.0,
+                    ns( r.latency.max() ) / 1000.0, len( r.latency ),
+                    "updates" if isinstance( r, TxPdoWriter ) else "frames" ) )
+      if ( isinstance( r, TxPdoWriter ) ):
+        l.append( "          update rate {:.1f}Hz".format( r.updateRate() ) )
+    return "\n".join( l )
+
+class HbiModel(object):
+
+  def __init__(self, timing, requesters):
+    super().__init__()
+    self._timing = timing
+    self._reqs   = sorted( requesters, key = lambda r: r.prio )
+
+  # RETURNS: HbiModelResult
+  def run(self):
+    tim   = self._timing
+    for r in self._reqs:
+      r.setup( tim )
+    dur   = [ r.accessCycles( tim ) for r in self._reqs ]
+    rdy   = [ r.request() for r in self._reqs ]
+    fin   = [ i for i in range( len( self._reqs ) ) if self._reqs[i].finite ]
+    t     = 0
+    busy  = 0
+    while ( any( [ not rdy[i] is None for i in fin ] ) ):
+      # bus idle at 't'; grant to the highest priority among the
+      # requests asserted first
+      tmin = min( [ x for x in rdy if not x is None ] )
+      g    = max( t, tmin )
+      # requesters are sorted by priority
+      for i in range( len( rdy ) ):
+        if ( not rdy[i] is None and rdy[i] <= g ):
+          break
+      d    = dur[i]
+      self._reqs[i].granted( g, g + d - 1 )
+      self._reqs[i].busy += d
+      rdy[i] = self._reqs[i].request()
+      busy  += d
+      t      = g + d
+    return HbiModelResult( tim, self._reqs, t, busy )
+
+# Sweep the burst generics. 'loads' is a function returning a (fresh)
+# list of competing requesters.
+# RETURNS: the recommended (burstMax, burstGap, result) -- lowest p99
+#          TxPDO latency among the settings which keep the competitors'
+#          p99 frame latency below 'maxCompLatNs' (if given) -- and the
+#          list of all (burstMax, burstGap, result)
+def sweep(timing, pdoBytes, bursts, gaps, loads = lambda: [], maxUpdHz = 5.0E3, updateHz = None,
+          nUpdates = 200, maxCompLatNs = None):
+  res  = []
+  for b in bursts:
+    for gp in gaps:
+      txp = TxPdoWriter( pdoBytes, b, gp, maxUpdHz, updateHz, nUpdates )
+      res.append( ( b, gp, HbiModel( timing, [ txp ] + loads() ).run() ) )
+  best = None
+  for b, gp, r in res:
+    ok = True
+    if ( not maxCompLatNs is None ):
+      for q in r.requesters:
+        if ( not isinstance( q, TxPdoWriter ) and timing.ns( q.latency.percentile( 99 ) ) > maxCompLatNs ):
+          ok = False
+    if ( ok and ( best is None or r.txPdo().latency.percentile( 99 ) < best[2].txPdo().latency.percentile( 99 ) ) ):
+      best = ( b, gp, r )
+  return best, res
+
+if __name__ == '__main__':
+
+  import getopt
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hf:p:b:g:u:U:m:n:W:R:L:S" )
+
+  clkHz   = 100.0E6
+  pdoSz   = None
+  bursts  = [ 16 ]
+  gaps    = [ 8 ]
+  maxUpd  = 5.0E3
+  updHz   = None
+  loads   = []
+  nUpd    = 200
+  wrAck   = 45.0
+  rdAck   = 180.0
+  maxLat  = None
+  doSweep = False
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] -p pdo-bytes [-f clk-hz] [-b burst[,burst...]] [-g gap[,gap...]] [-u max-upd-hz] [-U upd-hz] [-m name:prio:bytes-per-s[:frame-bytes[:r]]] [-n updates] [-W wr-ack-ns] [-R rd-ack-ns] [-L max-lat-us] [-S]".format( sys.argv[0] ))
+      print("  Transaction-level HBI model: TxPDO write latency and HBI utilisation")
+      print("   -h   : print this message")
+      print("   -p   : TxPDO size (bytes)")
+      print("   -f   : clock frequency (Hz; default {:g})".format( clkHz ))
+      print("   -b   : TXPDO_BURST_MAX_G value(s) (default: 16)")
+      print("   -g   : TXPDO_BURST_GAP_G value(s) (default: 8)")
+      print("   -u   : TXPDO_MAX_UPDATE_FREQ_G (Hz; default {:g})".format( maxUpd ))
+      print("   -U   : rate of new TxPDO data (Hz; default: always available)")
+      print("   -m   : competing traffic (prio: 1 rxpdo, 2 rx-mailbox, 3 esc, 4 ext; 'r': reads); may be repeated")
+      print("   -n   : number of TxPDO updates to simulate (default {:d})".format( nUpd ))
+      print("   -W   : wait-ack delay of writes (ns; default {:g})".format( wrAck ))
+      print("   -R   : wait-ack delay of reads (ns; default {:g})".format( rdAck ))
+      print("   -L   : max. p99 frame latency of the competing traffic (us) for the recommendation")
+      print("   -S   : sweep all combinations of -b/-g and recommend a setting")
+      sys.exit(0)
+    elif opt[0] in ('-f'):
+      clkHz   = float( opt[1] )
+    elif opt[0] in ('-p'):
+      pdoSz   = int( opt[1], 0 )
+    elif opt[0] in ('-b'):
+      bursts  = [ int( x, 0 ) for x in opt[1].split(",") ]
+    elif opt[0] in ('-g'):
+      gaps    = [ int( x, 0 ) for x in opt[1].split(",") ]
+    elif opt[0] in ('-u'):
+      maxUpd  = float( opt[1] )
+    elif opt[0] in ('-U'):
+      updHz   = float( opt[1] )
+    elif opt[0] in ('-m'):
+      f = opt[1].split(":")
+      loads.append( ( f[0], int( f[1], 0 ), float( f[2] ), int( f[3], 0 ) if len( f ) > 3 else 1500, len( f ) > 4 and "r" == f[4] ) )
+    elif opt[0] in ('-n'):
+      nUpd    = int( opt[1], 0 )
+    elif opt[0] in ('-W'):
+      wrAck   = float( opt[1] )
+    elif opt[0] in ('-R'):
+      rdAck   = float( opt[1] )
+    elif opt[0] in ('-L'):
+      maxLat  = float( opt[1] ) * 1000.0
+    elif opt[0] in ('-S'):
+      doSweep = True
+
+  if ( pdoSz is None ):
+    print( "Error: TxPDO size (-p) required", file = sys.stderr )
+    sys.exit(1)
+
+  tim = HbiTiming( clkHz, wrAck, rdAck )
+  mk  = lambda: [ MailboxLoad( n, p, bps, fb, rd ) for n, p, bps, fb, rd in loads ]
+  if ( not doSweep ):
+    print( HbiModel( tim, [ TxPdoWriter( pdoSz, bursts[0], gaps[0], maxUpd, updHz, nUpd ) ] + mk() ).run() )
+    sys.exit(0)
+
+  best, res = sweep( tim, pdoSz, bursts, gaps, mk, maxUpd, updHz, nUpd, maxLat )
+  print( "{:>6s} {:>6s} {:>12s} {:>12s} {:>8s} {:>14s}".format( "burst", "gap", "txlat-p99/us", "txlat-max/us", "util/%", "comp-p99/us" ) )
+  for b, gp, r in res:
+    comp = max( [ 0 ] + [ q.latency.percentile( 99 ) for q in r.requesters if not isinstance( q, TxPdoWriter ) ] )
+    print( "{:6d} {:6d} {:12.2f} {:12.2f} {:8.1f} {:14.2f}".format(
+             b, gp, tim.ns( r.txPdo().latency.percentile( 99 ) ) / 1000.0, tim.ns( r.txPdo().latency.max() ) / 1000.0,
+             100.0 * r.utilisation, tim.ns( comp ) / 1000.0 ) )
+  if ( best is None ):
+    print( "No setting meets the constraints" )
+  else:
+    print( "Recommended: TXPDO_BURST_MAX_G => {:d}, TXPDO_BURST_GAP_G => {:d}".format( best[0], best[1] ) )
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Append-only archive (requires numpy) of decoded TxPDO records for
+# long-term diagnostics:
+#
+#   w = PdoCaptureWriter( "archive", txPdoDtype( esi ) )
+#   w.append( rec )                     # e.g., decodeTxPdo( ... )
+#   w.close()
+#
+#   r = PdoCaptureReader( "archive", txPdoDtype( esi ) )
+#   for v in r.range( t0ns, t1ns ):     # numpy views (read-only, no copy)
+#     ta.update( v )
+#
+# The archive is a directory of segment files ('000000.pdocap', ...);
+# a new segment is started when the current one holds 'segmentRecords'
+# records. A segment file has a fixed size and is memory-mapped:
+#
+#   header : magic, version, record size, capacity, number of records,
+#            index stride, EVR tick, sha256 of the record layout and
+#            the layout (JSON) itself
+#   index  : EVR time (ns) of every 'indexStride'-th record
+#   data   : records (layout: the dtype compiled from the ESI)
+#
+# The number of records is updated after the records have been written,
+# i.e., readers (also concurrent ones; see 'refresh') only see complete
+# records. A reader opened with a dtype refuses an archive written with
+# a different layout (hash mismatch).
+#
+# The EVR timestamps must not decrease (the writer rejects records older
+# than the last one in the archive); time ranges are then located by
+# bisecting the segments, the sparse index and finally a single block
+# of 'indexStride' records, i.e., in O(log n).
+
+import sys
+import os
+import io
+import mmap
+import json
+import struct
+import hashlib
+import numpy
+from   TimestampAnalysis import evrTimeNs
+
+# RETURNS: JSON-compatible description of a (structured) dtype
+def layoutDescr(dtype):
+  names   = []
+  formats = []
+  offsets = []
+  for n in dtype.names:
+    f, off = dtype.fields[n][0:2]
+    names.append( n )
+    if ( f.subdtype is None ):
+      formats.append( [ f.str, [] ] )
+    else:
+      formats.append( [ f.subdtype[0].str, list( f.subdtype[1] ) ] )
+    offsets.append( off )
+  return { "names" : names, "formats" : formats, "offsets" : offsets, "itemsize" : dtype.itemsize }
+
+def layoutDtype(descr):
+  fmts = [ f if 0 == len( s ) else ( f, tuple( s ) ) for f, s in descr["formats"] ]
+  return numpy.dtype( { "names"    : descr["names"],
+                        "formats"  : fmts,
+                        "offsets"  : descr["offsets"],
+                        "itemsize" : descr["itemsize"] } )
+
+# RETURNS: sha256 digest of the record layout
+def layoutHash(dtype):
+  return hashlib.sha256( json.dumps( layoutDescr( dtype ), sort_keys = True ).encode( "ascii" ) ).digest()
+
+class PdoCaptureSegment(object):
+
+  MAGIC   = b"PDCS"
+  VERSION = 1
+  HDR     = struct.Struct( "<4sHHIQQQd32sI" )
+  HDRSZ   = 4096
+  # header offset of the number of records
+  CNTOFF  = 20
+  SUFFIX  = ".pdocap"
+
+  # create a new segment (if 'dtype' is given) or open an existing one
+  def __init__(self, fnam, dtype = None, capacity = 0, indexStride = 256, tickNs = 1.0,
+               hi = "TimestampHi", lo = "TimestampLo", writable = False):
+    super().__init__()
+    self._fnam = fnam
+    if ( not dtype is None ):
+      descr = { "layout" : layoutDescr( dtype ), "hi" : hi, "lo" : lo }
+      txt   = json.dumps( descr, sort_keys = True ).encode( "ascii" )
+      if ( self.HDR.size + len( txt ) > self.HDRSZ ):
+        raise ValueError("record layout too big for the segment header")
+      hdr   = self.HDR.pack( self.MAGIC, self.VERSION, 0, dtype.itemsize, capacity, 0, indexStride,
+                             tickNs, layoutHash( dtype ), len( txt ) ) + txt
+      with io.open( fnam, "xb" ) as f:
+        f.write( hdr )
+        f.truncate( self._layout( dtype.itemsize, capacity, indexStride )[2] )
+      writable = True
+    self._open( writable )
+
+  @classmethod
+  def _layout(clazz, itemsize, capacity, stride):
+    nidx = ( capacity + stride - 1 ) // stride
+    doff = clazz.HDRSZ + ( ( 8 * nidx + mmap.PAGESIZE - 1 ) // mmap.PAGESIZE ) * mmap.PAGESIZE
+    return nidx, doff, doff + itemsize * capacity
+
+  def _open(self, writable):
+    with io.open( self._fnam, "r+b" if writable else "rb" ) as f:
+      self._mm = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ )
+    ( magic, vers, flg, isz, cap, cnt, strd, tick, hsh, dlen ) = self.HDR.unpack_from( self._mm, 0 )
+    if ( magic != self.MAGIC or vers != self.VERSION ):
+      raise ValueError("{}: not a PDO capture segment".format( self._fnam ))
+    descr           = json.loads( bytes( self._mm[self.HDR.size:self.HDR.size + dlen] ).decode( "ascii" ) )
+    self.dtype      = layoutDtype( descr["layout"] )
+    self.hash       = hsh
+    self.capacity   = cap
+    self.stride     = strd
+    self.tickNs     = tick
+    self._hi        = descr["hi"]
+    self._lo        = descr["lo"]
+    nidx, doff, end = self._layout( isz, cap, strd )
+    if ( len( self._mm ) < end or self.dtype.itemsize != isz ):
+      raise ValueError("{}: truncated or corrupt segment".format( self._fnam ))
+    self._idx       = numpy.frombuffer( self._mm, dtype = numpy.int64, count = nidx, offset = self.HDRSZ )
+    self._data      = numpy.frombuffer( self._mm, dtype = self.dtype, count = cap, offset = doff )
+
+  @property
+  def fnam(self):
+    return self._fnam
+
+  # number of (complete) records; read from the header every time
+  def __len__(self):
+    return struct.unpack_from( "<Q", self._mm, self.CNTOFF )[0]
+
+  def _setLen(self, n):
+    struct.pack_into( "<Q", self._mm, self.CNTOFF, n )
+
+  # EVR time (ns) of records
+  def keys(self, rec):
+    return evrTimeNs( rec, self.tickNs, self._hi, self._lo )
+
+  # RETURNS: view of records 'start'..'stop'
+  def records(self, start = 0, stop = None):
+    n = len( self )
+    if ( stop is None or stop > n ):
+      stop = n
+    return self._data[start:stop]
+
+  # RETURNS: index of the first record with a time >= 't' (ns)
+  def locate(self, t):
+    n = len( self )
+    if ( 0 == n ):
+      return 0
+    nidx = ( n + self.stride - 1 ) // self.stride
+    b    = int( numpy.searchsorted( self._idx[0:nidx], t, side = "left" ) )
+    if ( 0 == b ):
+      return 0
+    # first record with t is in block b - 1 (or the first one of block b)
+    s    = ( b - 1 ) * self.stride
+    blk  = self.keys( self._data[s:min( s + self.stride, n )] )
+    return s + int( numpy.searchsorted( blk, t, side = "left" ) )
+
+  def firstKey(self):
+    return int( self._idx[0] )
+
+  def lastKey(self):
+    n = len( self )
+    return int( self.keys( self._data[n-1:n] )[0] )
+
+  # RETURNS: number of records appended (limited by the capacity)
+  def append(self, rec):
+    n    = len( self )
+    m    = min( len( rec ), self.capacity - n )
+    if ( m <= 0 ):
+      return 0
+    rec  = rec[0:m]
+    k    = self.keys( rec )
+    if ( ( k[1:] < k[:-1] ).any() or ( n > 0 and k[0] < self.lastKey() ) ):
+      raise ValueError("EVR timestamps must not decrease")
+    self._data[n:n + m] = rec
+    # index entries for the records at multiples of the stride
+    i0   = ( n + self.stride - 1 ) // self.stride
+    i1   = ( n + m + self.stride - 1 ) // self.stride
+    self._idx[i0:i1] = k[ i0 * self.stride - n : i1 * self.stride - n : self.stride ]
+    self._setLen( n + m )
+    return m
+
+  def flush(self):
+    self._mm.flush()
+
+  def close(self):
+    # views must be gone before the map can be closed
+    self._idx  = None
+    self._data = None
+    try:
+      self._mm.close()
+    except BufferError:
+      # still referenced by a reader's view; unmapped once released
+      pass
+
+class PdoCaptureWriter(object):
+
+  # 'dtype'         : record layout (e.g., PdoDtype.txPdoDtype)
+  # 'segmentRecords': capacity of a segment file
+  # 'indexStride'   : records per index entry
+  # 'tickNs'        : period of the TimestampLo counter (ns)
+  # An existing archive is continued (its layout must match).
+  def __init__(self, path, dtype, segmentRecords = 1 << 20, indexStride = 256, tickNs = 1.0,
+               hi = "TimestampHi", lo = "TimestampLo"):
+    super().__init__()
+    self._path  = path
+    self._dtype = dtype
+    self._cap   = segmentRecords
+    self._strd  = indexStride
+    self._tick  = tickNs
+    self._hi    = hi
+    self._lo    = lo
+    self._seg   = None
+    # EVR time of the last record (segments must not overlap in time)
+    self._last  = None
+    os.makedirs( path, exist_ok = True )
+    segs        = segmentFiles( path )
+    self._num   = len( segs )
+    if ( len( segs ) > 0 ):
+      self._seg = PdoCaptureSegment( os.path.join( path, segs[-1] ), writable = True )
+      if ( self._seg.hash != layoutHash( dtype ) ):
+        self.close()
+        raise ValueError("{}: archive has a different record layout".format( path ))
+      self._last = self._lastKey( segs )
+
+  # RETURNS: EVR time of the last record in the archive (None if empty)
+  def _lastKey(self, segs):
+    if ( len( self._seg ) > 0 ):
+      return self._seg.lastKey()
+    # the last segment may be empty; look at the previous ones
+    for f in reversed( segs[:-1] ):
+      s = PdoCaptureSegment( os.path.join( self._path, f ) )
+      try:
+        if ( len( s ) > 0 ):
+          return s.lastKey()
+      finally:
+        s.close()
+    return None
+
+  def _rotate(self):
+    if ( not self._seg is None ):
+      self._seg.flush()
+      self._seg.close()
+    fnam       = os.path.join( self._path, "{:06d}{}".format( self._num, PdoCaptureSegment.SUFFIX ) )
+    self._seg  = PdoCaptureSegment( fnam, self._dtype, self._cap, self._strd, self._tick, self._hi, self._lo )
+    self._num += 1
+
+  # Append records; a structured array of the archive's dtype or raw
+  # TxPDO images (bytes-like)
+  def append(self, rec):
+    if ( not isinstance( rec, numpy.ndarray ) or rec.dtype != self._dtype ):
+      rec = numpy.frombuffer( rec, dtype = self._dtype )
+    if ( 0 == len( rec ) ):
+      return
+    # check all records up-front (also across segment boundaries)
+    k   = evrTimeNs( rec, self._tick, self._hi, self._lo )
+    if ( ( k[1:] < k[:-1] ).any() or ( not self._last is None and k[0] < self._last ) ):
+      raise ValueError("EVR timestamps must not decrease")
+    while ( len( rec ) > 0 ):
+      if ( self._seg is None or len( self._seg ) >= self._seg.capacity ):
+        self._rotate()
+      rec = rec[ self._seg.append( rec ): ]
+    self._last = int( k[-1] )
+
+  def flush(self):
+    if ( not self._seg is None ):
+      self._seg.flush()
+
+  def close(self):
+    if ( not self._seg is None ):
+      self._seg.flush()
+      self._seg.close()
+      self._seg = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+# RETURNS: sorted list of the segment files in an archive directory
+def segmentFiles(path):
+  return sorted( [ f for f in os.listdir( path ) if f.endswith( PdoCaptureSegment.SUFFIX ) ] )
+
+class PdoCaptureReader(object):
+
+  # if 'dtype' is given the archive must have been written with the
+  # same layout
+  def __init__(self, path, dtype = None):
+    super().__init__()
+    self._path  = path
+    self._segs  = []
+    self._hash  = None if dtype is None else layoutHash( dtype )
+    self.refresh()
+
+  # pick up records/segments appended since the archive was opened
+  def refresh(self):
+    for f in segmentFiles( self._path )[ len( self._segs ): ]:
+      s = PdoCaptureSegment( os.path.join( self._path, f ) )
+      if ( self._hash is None ):
+        self._hash = s.hash
+      elif ( s.hash != self._hash ):
+        raise ValueError("{}: record layout does not match".format( s.fnam ))
+      self._segs.append( s )
+
+  @property
+  def segments(self):
+    return self._segs
+
+  @property
+  def dtype(self):
+    return self._segs[0].dtype if len( self._segs ) > 0 else None
+
+  def __len__(self):
+    return sum( [ len( s ) for s in self._segs ] )
+
+  # iterate over the records of every segment (one view per segment)
+  def __iter__(self):
+    for s in self._segs:
+      if ( len( s ) > 0 ):
+        yield s.records()
+
+  # RETURNS: list of views (one per segment touched) of the records
+  #          with global record numbers 'start'..'stop'
+  def records(self, start = 0, stop = None):
+    l   = []
+    off = 0
+    for s in self._segs:
+      n = len( s )
+      if ( ( stop is None or stop > off ) and start < off + n ):
+        l.append( s.records( max( start - off, 0 ), None if stop is None else stop - off ) )
+      off += n
+    return l
+
+  # RETURNS: list of views of the records with 't0' <= EVR time < 't1' (ns)
+  def range(self, t0 = None, t1 = None):
+    segs = [ s for s in self._segs if len( s ) > 0 ]
+    l    = []
+    # first segment that may hold records >= t0 (records == t0 may end
+    # the segment preceding the first one starting with t0), first one
+    # beyond t1
+    i0   = 0 if t0 is None else max( numpy.searchsorted( [ s.firstKey() for s in segs ], t0, side = "left" ) - 1, 0 )
+    i1   = len( segs ) if t1 is None else numpy.searchsorted( [ s.firstKey() for s in segs ], t1, side = "left" )
+    for s in segs[i0:i1]:
+      a = 0    if t0 is None else s.locate( t0 )
+      b = None if t1 is None else s.locate( t1 )
+      v = s.records( a, b )
+      if ( len( v ) > 0 ):
+        l.append( v )
+    return l
+
+  def close(self):
+    for s in self._segs:
+      s.close()
+    self._segs = []
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi, txPdoDtype, decodeTxPdo
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hi:o:s:S:x:t:f:u:" )
+
+  imp    = None
+  out    = None
+  stride = None
+  segRec = 1 << 20
+  idxStr = 256
+  tickNs = 1.0
+  t0     = None
+  t1     = None
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-i capture-file [-s stride] [-S records] [-x stride] [-t tick]] [-f t0] [-u t1] [-o file] archive-dir esi-or-sii-file".format( sys.argv[0] ))
+      print("  Append raw TxPDO images to an archive and/or extract a time range")
+      print("   -h   : print this message")
+      print("   -i   : import raw TxPDO images from this file")
+      print("   -s   : distance between images in the capture file (default: TxPDO size)")
+      print("   -S   : records per segment file (new archives; default: {:d})".format( segRec ))
+      print("   -x   : records per index entry (new archives; default: {:d})".format( idxStr ))
+      print("   -t   : period of the TimestampLo counter in ns (new archives; default: {:g})".format( tickNs ))
+      print("   -f   : start of the time range (EVR time, ns)")
+      print("   -u   : end of the time range (EVR time, ns)")
+      print("   -o   : write the (raw) records of the time range to this file")
+      sys.exit(0)
+    elif opt[0] in ('-i'):
+      imp    = opt[1]
+    elif opt[0] in ('-o'):
+      out    = opt[1]
+    elif opt[0] in ('-s'):
+      stride = int( opt[1], 0 )
+    elif opt[0] in ('-S'):
+      segRec = int( opt[1], 0 )
+    elif opt[0] in ('-x'):
+      idxStr = int( opt[1], 0 )
+    elif opt[0] in ('-t'):
+      tickNs = float( opt[1] )
+    elif opt[0] in ('-f'):
+      t0     = int( opt[1], 0 )
+    elif opt[0] in ('-u'):
+      t1     = int( opt[1], 0 )
+
+  if ( len( args ) < 2 ):
+    print( "Error: archive directory and ESI (or SII) file required", file = sys.stderr )
+    sys.exit(1)
+
+  dt = txPdoDtype( loadEsi( args[1] ) )
+  if ( not imp is None ):
+    rec = decodeTxPdo( numpy.memmap( imp, dtype = numpy.uint8, mode = "r" ), dt, 0, stride )
+    with PdoCaptureWriter( args[0], dt, segRec, idxStr, tickNs ) as w:
+      w.append( rec if stride is None else numpy.array( rec, dtype = dt ) )
+
+  r = PdoCaptureReader( args[0], dt )
+  for s in r.segments:
+    if ( len( s ) > 0 ):
+      print( "{}: {:d} records, EVR time {:d} .. {:d}".format( s.fnam, len( s ), s.firstKey(), s.lastKey() ) )
+  sel = r.range( t0, t1 )
+  print( "{:d} records in range".format( sum( [ len( v ) for v in sel ] ) ) )
+  if ( not out is None ):
+    with io.open( out, "wb" ) as f:
+      for v in sel:
+        f.write( v.tobytes() )
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Compile the TxPDO (or RxPDO) layout of an ESI file (or SII image) into
+# a numpy structured dtype (requires numpy):
+#
+#   esi = loadEsi( "evr.xml" )          # or an SII image ('.sii', '.bin')
+#   dt  = txPdoDtype( esi )
+#   rec = decodeTxPdo( capturedImages, dt )
+#   rec["EventSet"]                     # shape (nframes, 8)
+#
+# Every PDO 'Entry' becomes a field at its byte offset; entries sharing
+# an index (consecutive sub-indices) become a sub-array. Padding entries
+# (index 0) occupy space but produce no field. The itemsize is the size
+# of the TxPDO (sum of all segments) which may be larger than the space
+# covered by entries. EtherCAT data are little-endian.
+
+import sys
+import re
+import io
+import numpy
+from   lxml             import etree as ET
+from   ToolCore         import ESI, hd2int
+from   ESIPromGenerator import ESIPromGenerator
+
+class PdoField(object):
+
+  def __init__(self, name, index, nelms, offset, bitLen, typeName):
+    super().__init__()
+    self.name     = name
+    self.index    = index
+    self.nelms    = nelms
+    self.offset   = offset
+    self.bitLen   = bitLen
+    self.typeName = typeName
+
+  @property
+  def byteSz(self):
+    return self.bitLen // 8
+
+  @property
+  def isPadding(self):
+    return 0 == self.index
+
+  @property
+  def isSigned(self):
+    return entryIsSigned( self.typeName )
+
+  def format(self, byteorder = '<'):
+    return entryFormat( self.bitLen, self.typeName, byteorder )
+
+  def __str__(self):
+    return "0x{:04x} {:4d} {:<24s} {:<10s} x{:d}".format( self.index, self.offset, self.name, self.typeName, self.nelms )
+
+# CoE base-type codes (names as in ESIPromGenerator.BASE_TYPE_MAP; the
+# SII uses the CoE names)
+SIGNED_CODES = [ 0x02, 0x03, 0x10, 0x04, 0x12, 0x13, 0x14, 0x15 ]
+FLOAT_CODES  = { 0x08 : 32, 0x11 : 64 }
+
+def _typeCode(typeName):
+  if ( typeName is None ):
+    return None
+  return ESIPromGenerator.BASE_TYPE_MAP.get( typeName.upper() )
+
+def entryIsSigned(typeName):
+  c = _typeCode( typeName )
+  if ( c is None ):
+    # same convention as Pdo.fromElement
+    return not typeName is None and len( typeName ) > 0 and typeName[0].upper() != "U"
+  return c in SIGNED_CODES
+
+# RETURNS: numpy type string for an entry
+def entryFormat(bitLen, typeName = None, byteorder = '<'):
+  if ( bitLen % 8 != 0 ):
+    raise ValueError("only entries with a multiple of 8 bits are supported")
+  n = bitLen // 8
+  if ( FLOAT_CODES.get( _typeCode( typeName ) ) == bitLen ):
+    return "{}f{:d}".format( byteorder, n )
+  if ( n in ( 1, 2, 4, 8 ) ):
+    return "{}{}{:d}".format( byteorder, "i" if entryIsSigned( typeName ) else "u", n )
+  # odd sizes; raw bytes
+  return "V{:d}".format( n )
+
+def _findPdo(src, tag = "TxPdo"):
+  if ( isinstance( src, str ) ):
+    src = loadEsi( src )
+  if ( isinstance( src, ESI ) ):
+    if ( "TxPdo" == tag ):
+      return src.txPdo.element, src.vendorData.byteSz
+    src = src.element
+  if ( src.tag != tag ):
+    el = src.find( ".//" + tag )
+    if ( el is None ):
+      raise ValueError("no {} found".format( tag ))
+    src = el
+  return src, 0
+
+# RETURNS: list of PdoField (in PDO order, including padding) and the
+#          size of the TxPDO
+def txPdoFields(src):
+  return pdoFields( src, "TxPdo" )
+
+def rxPdoFields(src):
+  return pdoFields( src, "RxPdo" )
+
+# 'tag': "TxPdo" or "RxPdo"
+def pdoFields(src, tag):
+  pdoEl, sz = _findPdo( src, tag )
+  fields    = []
+  off       = 0
+  for e in pdoEl.findall( "Entry" ):
+    idx = hd2int( e.find( "Index" ).text )
+    sub = e.find( "SubIndex" )
+    sub = 1 if sub is None else hd2int( sub.text )
+    bl  = int( e.find( "BitLen" ).text )
+    nam = e.find( "Name" )
+    nam = "" if nam is None or nam.text is None else nam.text
+    typ = e.find( "DataType" )
+    typ = "" if typ is None or typ.text is None else typ.text
+    if ( sub > 1 and len( fields ) > 0 and fields[-1].index == idx and 0 != idx ):
+      fields[-1].nelms += 1
+    else:
+      # strip the element index of array names
+      fields.append( PdoField( re.sub(r'\[[^]]*[]]', '', nam), idx, 1, off, bl, typ ) )
+    off += bl // 8
+  return fields, max( sz, off )
+
+# RETURNS: numpy dtype with one field per (non-padding) PDO item
+def txPdoDtype(src, byteorder = '<', itemsize = None):
+  return pdoDtype( src, "TxPdo", byteorder, itemsize )
+
+def rxPdoDtype(src, byteorder = '<', itemsize = None):
+  return pdoDtype( src, "RxPdo", byteorder, itemsize )
+
+def pdoDtype(src, tag, byteorder = '<', itemsize = None):
+  fields, sz = pdoFields( src, tag )
+  if ( itemsize is None ):
+    itemsize = sz
+  names   = []
+  formats = []
+  offsets = []
+  for f in fields:
+    if ( f.isPadding ):
+      continue
+    nam = f.name if len( f.name ) > 0 else "idx_{:04x}".format( f.index )
+    if ( nam in names ):
+      nam = "{}_{:04x}".format( nam, f.index )
+    names.append( nam )
+    fmt = f.format( byteorder )
+    formats.append( fmt if 1 == f.nelms else ( fmt, ( f.nelms, ) ) )
+    offsets.append( f.offset )
+  return numpy.dtype( { "names" : names, "formats" : formats, "offsets" : offsets, "itemsize" : itemsize } )
+
+# Decode a buffer of TxPDO images; 'stride' is the distance between
+# images (default: the TxPDO size), 'offset' the position of the first one.
+# RETURNS: numpy structured array (a view of 'buf')
+def decodeTxPdo(buf, dtype, offset = 0, stride = None, count = -1):
+  if ( not stride is None and stride != dtype.itemsize ):
+    if ( stride < dtype.itemsize ):
+      raise ValueError("stride smaller than the TxPDO")
+    dtype = numpy.dtype( { "names"    : dtype.names,
+                           "formats"  : [ dtype.fields[n][0] for n in dtype.names ],
+                           "offsets"  : [ dtype.fields[n][1] for n in dtype.names ],
+                           "itemsize" : stride } )
+  if ( count < 0 ):
+    # frombuffer insists on a multiple of the itemsize
+    count = ( len( buf ) - offset ) // dtype.itemsize
+  return numpy.frombuffer( buf, dtype = dtype, count = count, offset = offset )
+
+# Load an ESI file (XML) or an SII image
+def loadEsi(fnam):
+  with io.open( fnam, "rb" ) as f:
+    head = f.read( 64 )
+  if ( head.lstrip().startswith( b"<" ) ):
+    parser = ET.XMLParser( remove_blank_text = True )
+    return ESI( ET.parse( fnam, parser ).getroot() )
+  return ESI( ESI.fromProm( fnam ) )
+
+if __name__ == '__main__':
+
+  import getopt
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hd:o:s:n:" )
+
+  capt   = None
+  offset = 0
+  stride = None
+  count  = 10
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-d capture-file] [-o offset] [-s stride] [-n count] esi-or-sii-file".format( sys.argv[0] ))
+      print("  Print the TxPDO layout/dtype; optionally decode raw TxPDO images")
+      print("   -h   : print this message")
+      print("   -d   : decode raw TxPDO images from this file")
+      print("   -o   : byte offset of the first image (default: 0)")
+      print("   -s   : distance between images (default: TxPDO size)")
+      print("   -n   : number of images to print (default: {:d})".format( count ))
+      sys.exit(0)
+    elif opt[0] in ('-d'):
+      capt   = opt[1]
+    elif opt[0] in ('-o'):
+      offset = int( opt[1], 0 )
+    elif opt[0] in ('-s'):
+      stride = int( opt[1], 0 )
+    elif opt[0] in ('-n'):
+      count  = int( opt[1], 0 )
+
+  if ( len( args ) < 1 ):
+    print( "Error: ESI or SII file required", file = sys.stderr )
+    sys.exit(1)
+
+  esi        = loadEsi( args[0] )
+  fields, sz = txPdoFields( esi )
+  dt         = txPdoDtype( esi )
+  if ( capt is None ):
+    for f in fields:
+      print( f )
+    print( "TxPDO size: {:d} bytes".format( sz ) )
+    print( dt )
+  else:
+    with io.open( capt, "rb" ) as f:
+      buf = f.read()
+    rec = decodeTxPdo( buf, dt, offset, stride )
+    print( "{:d} images".format( len( rec ) ) )
+    for r in rec[0:count]:
+      print( r )
@@ -200,6 +200,9 @@ class ActAction(QtWidgets.QAction):
 
 class MenuButton(QtWidgets.QPushButton):
 
+  # emitted when a different label is selected from the menu
+  textChanged = QtCore.pyqtSignal(str)
+
   def __init__(self, lbls, parent = None):
     super().__init__(parent)
     menu = QtWidgets.QMenu()
@@ -216,7 +219,9 @@ class MenuButton(QtWidgets.QPushButton):
     self.setMenu( menu )
 
   def activated(self, act):
-    self.setText(act.text())
+    if ( act.text() != self.text() ):
+      self.setText(act.text())
+      self.textChanged.emit(act.text())
 
 
 class DialogBase(QtWidgets.QDialog):
@@ -325,8 +330,22 @@ class SegmentEditor(DialogBase):
         swpChoice.append( PdoSegment.swp2str( bs ) )
 
     self.swapEdt   = self.addRow( "Byte-swap", swpChoice )
+    # live update of the resource budget while typing
+    self.key       = self if seg is None else seg
+    self.nameEdt.textEdited.connect( self.preview )
+    self.nelmsEdt.textEdited.connect( self.preview )
+    self.swapEdt.textChanged.connect( self.preview )
+    self.finished.connect( lambda res: self.tbl.budgetRevert( self.key ) )
     self.show()
 
+  def preview(self, txt):
+    swap = PdoSegment.str2swp( self.swapEdt.text() )
+    try:
+      nelms = int( self.nelmsEdt.text(), 0 )
+    except ValueError:
+      return
+    self.tbl.budgetSegment( self.key, self.nameEdt.text(), nelms, swap )
+
   def delete(self):
     return self.dialogError( self.tbl.deleteSegment( self.seg ) )
 
@@ -386,8 +405,21 @@ class ItemEditor(DialogBase):
         bsChoice.append( PdoElement.bs2str( isS, bs ) )
 
     self.byteSzEdt = self.addRow( "Type", bsChoice )
+    # live update of the resource budget while typing
+    self.key       = self if itm is None else itm
+    self.nameEdt.textEdited.connect( self.preview )
+    self.nelmsEdt.textEdited.connect( self.preview )
+    self.finished.connect( lambda res: self.tbl.budgetRevert( self.key ) )
     self.show()
 
+  def preview(self, txt):
+    try:
+      nelms = int( self.nelmsEdt.text(), 0 )
+    except ValueError:
+      return
+    indexedName = True if self.itm is None else self.itm.indexedName
+    self.tbl.budgetItem( self.key, self.nameEdt.text(), nelms, indexedName )
+
   def delete(self):
     return self.dialogError( self.tbl.deleteItem( self.itm ) )
 
@@ -487,6 +519,7 @@ class PdoListWidget(TableWidgetDnD):
     self._botR            = (-1,-1)
     self._maxHwSegs       = maxHwSegs
     self._modified        = False
+    self._budget          = None
     self.selectionModel().selectionChanged.connect( self.on_selection_changed )
     self.clearSelection()
     self.setCurrentCell( 0, 0, QtCore.QItemSelectionModel.Clear )
@@ -667,6 +700,7 @@ class PdoListWidget(TableWidgetDnD):
         seg.nDWords     = nelms
         seg.swap        = swap
         self._totsz     = wouldHave
+        self.budgetSegment( seg, name, nelms, swap )
 
       self._segs.remove( seg )
       self._segs.insert( pos, seg )
@@ -721,6 +755,7 @@ class PdoListWidget(TableWidgetDnD):
       it.nelms       = nelms
       it.isSigned    = isSigned
       self._used     = wouldUse
+      self.budgetItem( it, it.name, it.nelms, it.indexedName )
       self._modified = True
       self.selectItemRange( self._items.index( it ) )
       self.render()
@@ -736,6 +771,7 @@ class PdoListWidget(TableWidgetDnD):
     try:
       self._items.remove( it )
       self._used    -= it.byteSz * it.nelms
+      self.budgetDrop( it )
       self._modified = True
       # make sure selection is within valid bounds
       self.selectItemRange( -1 )
@@ -835,6 +871,7 @@ class PdoListWidget(TableWidgetDnD):
         pos += 1
       if not disableRender:
         self.render()
+      return
     else:
       if ( not isinstance( el, PdoElement ) ):
         raise ValueError("may only add a PdoElement object")
@@ -843,6 +880,7 @@ class PdoListWidget(TableWidgetDnD):
       raise RuntimeError("cannot add element - not enough space (add rows)")
     self._used += need
     self._items.insert( pos, el )
+    self.budgetItem( el, el.name, el.nelms, el.indexedName )
     if (disableRender):
       self.needRender()
     else:
@@ -1116,7 +1154,7 @@ class PdoListWidget(TableWidgetDnD):
         rv += 1
     return rv
 
-  def addSegment(self, seg):
+  def addSegment(self, seg, disableRender = False):
     if not isinstance(seg, PdoSegment):
       raise ValueError("addSegment requres a 'PdoSegment' object'")
     # 8-byte swap is emulated by using two mappings per dword!
@@ -1127,8 +1165,32 @@ class PdoListWidget(TableWidgetDnD):
                        "      per dword!")
     self._segs.append( seg )
     self._totsz += seg.nDWords * self.NCOLS
+    self.budgetSegment( seg, seg.name, seg.nDWords, seg.swap )
     self.setRowCount( self.rowCount() + seg.nDWords )
+    if ( disableRender ):
+      self.needRender()
+    else:
+      self.render()
+
+  # Bulk-import segments and items (a 'PdoLayoutImport' object).
+  # Everything is validated up-front so that the import is atomic;
+  # the table is rendered once at the end.
+  # RETURNS: None or an error message
+  def importLayout(self, layout):
+    # the budget (if any) also accounts for the fixed entries
+    fixd = 0 if self._budget is None else self._budget.txPdoBytes - self._totsz
+    errs = layout.validate( self._maxHwSegs, self.hwSegmentsUsed(), self._totsz, self._used, fixd )
+    if ( len( errs ) > 0 ):
+      return "ERROR -- unable to import layout\n" + "\n".join( errs )
+    pos  = len( self._items )
+    for s in layout.segments:
+      self.addSegment( s.clone(), disableRender = True )
+    self.insert( None, [ e.clone() for e in layout.items ], disableRender = True )
+    self._modified = True
+    if ( len( layout.items ) > 0 ):
+      self.selectItemRange( pos, len( self._items ) - 1 )
     self.render()
+    return None
 
   def deleteSegment(self, seg):
     try:
@@ -1142,6 +1204,7 @@ class PdoListWidget(TableWidgetDnD):
 
       self._segs.remove(seg)
       self._totsz = newTotal
+      self.budgetDrop( seg )
       r = int(off / self.NCOLS)
       self.setRowCount( r )
       self.renderSegments()
@@ -1164,5 +1227,35 @@ class PdoListWidget(TableWidgetDnD):
         self.setVerticalHeaderItem(r, eitm)
         r += 1
 
+  # Attach a 'PromBudget' which is kept up-to-date with every change
+  def setBudget(self, budget):
+    self._budget = budget
+    for s in self._segs:
+      self.budgetSegment( s, s.name, s.nDWords, s.swap )
+    for e in self._items:
+      self.budgetItem( e, e.name, e.nelms, e.indexedName )
+
+  # The editor dialogs use their own key to preview new items/segments
+  def budgetItem(self, key, name, nelms, indexedName = True):
+    if not self._budget is None:
+      self._budget.setEntries( key, self._budget.entryNames( name, nelms, indexedName ) )
+
+  def budgetSegment(self, key, name, nDWords, swap):
+    if not self._budget is None:
+      self._budget.setSegment( key, name, nDWords, swap )
+
+  def budgetDrop(self, key):
+    if not self._budget is None:
+      self._budget.remove( key )
+
+  # Undo a preview; restore the state of 'key' if it is (still) ours
+  def budgetRevert(self, key):
+    if   key in self._items:
+      self.budgetItem( key, key.name, key.nelms, key.indexedName )
+    elif key in self._segs:
+      self.budgetSegment( key, key.name, key.nDWords, key.swap )
+    else:
+      self.budgetDrop( key )
+
   def getGuiVals(self):
     return self._segs, self._items
@@ -0,0 +1,250 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Bulk import of TxPDO segments and items from a CSV or JSON description.
+#
+# JSON:
+#
+#   { "segments" : [ { "name" : "PulseID", "byteOffset" : "0x40", "nDWords" : 2, "swap" : 8 }, ... ],
+#     "items"    : [ { "name" : "PulseID", "index" : "0x5000", "type" : "U64", "nelms" : 1 }, ... ] }
+#
+# CSV (header line required; one record per line, 'kind' is 'segment' or 'item'):
+#
+#   kind,name,byteOffset,nDWords,swap,index,type,nelms
+#   segment,PulseID,0x40,2,8,,,
+#   item,PulseID,,,,0x5000,U64,1
+#
+# Segments are appended after the existing ones and items are packed
+# (in order) after the existing items. The entire description is
+# validated before anything is modified; either all segments and items
+# are imported or none.
+
+import io
+import re
+import csv
+import json
+from   ToolCore          import PdoSegment, hd2int
+from   PdoElement        import PdoElement
+from   FirmwareConstants import FirmwareConstants
+
+class PdoImportError(ValueError):
+  def __init__(self, msgs):
+    if isinstance(msgs, str):
+      msgs = [ msgs ]
+    self._msgs = msgs
+    super().__init__( "\n".join( msgs ) )
+
+  @property
+  def messages(self):
+    return self._msgs
+
+class PdoLayoutImport(object):
+
+  SEG_KEYS = [ "name", "byteOffset", "nDWords", "swap" ]
+  ITM_KEYS = [ "name", "index", "type", "nelms" ]
+
+  def __init__(self, segments = [], items = []):
+    super().__init__()
+    self._segs  = list( segments )
+    self._items = list( items )
+
+  @property
+  def segments(self):
+    return self._segs
+
+  @property
+  def items(self):
+    return self._items
+
+  # accept python ints, "0x..", "#x.." (ESI notation) or decimal strings
+  @staticmethod
+  def toInt(val):
+    if isinstance(val, int):
+      return val
+    val = str(val).strip()
+    if val[0:2] in [ "#x", "#X" ]:
+      return hd2int( "#x" + val[2:] )
+    return int(val, 0)
+
+  @staticmethod
+  def toSwap(val):
+    if val is None or ( isinstance(val, str) and 0 == len(val.strip()) ):
+      return 1
+    if isinstance(val, str) and not val.strip().isdigit():
+      return PdoSegment.str2swp( val.strip() )
+    return PdoLayoutImport.toInt( val )
+
+  @staticmethod
+  def _get(rec, key, dflt = None):
+    val = rec.get( key )
+    if val is None or ( isinstance(val, str) and 0 == len(val.strip()) ):
+      if dflt is None:
+        raise KeyError("missing '{}'".format( key ))
+      return dflt
+    return val
+
+  @classmethod
+  def mkSegment(clazz, rec):
+    return PdoSegment( str( clazz._get( rec, "name" ) ).strip(),
+                       clazz.toInt( clazz._get( rec, "byteOffset" ) ),
+                       clazz.toInt( clazz._get( rec, "nDWords"    ) ),
+                       clazz.toSwap( rec.get( "swap" ) ) )
+
+  @classmethod
+  def mkItem(clazz, rec):
+    byteSz, isSigned = PdoElement.str2bs( str( clazz._get( rec, "type" ) ).strip() )
+    if ( byteSz is None or isSigned is None ):
+      raise ValueError("invalid type '{}' (expected U8..U64 or S8..S64)".format( rec.get("type") ))
+    return PdoElement( str( clazz._get( rec, "name" ) ).strip(),
+                       clazz.toInt( clazz._get( rec, "index" ) ),
+                       byteSz,
+                       clazz.toInt( clazz._get( rec, "nelms", 1 ) ),
+                       isSigned )
+
+  # Convert all records; errors are collected (rather than raised at the
+  # first one) so the user gets to see all the problems at once.
+  @classmethod
+  def fromRecords(clazz, segRecs, itmRecs):
+    errs  = []
+    segs  = []
+    items = []
+    for i in range( len( segRecs ) ):
+      try:
+        segs.append( clazz.mkSegment( segRecs[i] ) )
+      except Exception as e:
+        errs.append( "segment #{:d}: {}".format( i, e.args[0] ) )
+    for i in range( len( itmRecs ) ):
+      try:
+        items.append( clazz.mkItem( itmRecs[i] ) )
+      except Exception as e:
+        errs.append( "item #{:d}: {}".format( i, e.args[0] ) )
+    if ( len( errs ) > 0 ):
+      raise PdoImportError( errs )
+    return clazz( segs, items )
+
+  @classmethod
+  def fromJSON(clazz, f):
+    try:
+      d = json.load( f )
+    except ValueError as e:
+      raise PdoImportError( "invalid JSON: {}".format( e ) )
+    if not isinstance(d, dict):
+      raise PdoImportError( "JSON: top-level object with 'segments' and/or 'items' expected" )
+    return clazz.fromRecords( d.get( "segments", [] ), d.get( "items", [] ) )
+
+  @classmethod
+  def fromCSV(clazz, f):
+    segRecs = []
+    itmRecs = []
+    rdr     = csv.DictReader( f, skipinitialspace = True )
+    if rdr.fieldnames is None or not "kind" in rdr.fieldnames:
+      raise PdoImportError( "CSV: header line with a 'kind' column expected" )
+    for rec in rdr:
+      kind = ( rec.get( "kind" ) or "" ).strip().lower()
+      if   ( kind == "segment" ):
+        segRecs.append( rec )
+      elif ( kind == "item" ):
+        itmRecs.append( rec )
+      elif ( kind == "" or kind.startswith("#") ):
+        # blank line or comment
+        continue
+      else:
+        raise PdoImportError( "CSV line {:d}: unknown kind '{}'".format( rdr.line_num, kind ) )
+    return clazz.fromRecords( segRecs, itmRecs )
+
+  @classmethod
+  def fromFile(clazz, fnam):
+    with io.open( fnam, "r", newline = "" ) as f:
+      if fnam.lower().endswith(".json"):
+        return clazz.fromJSON( f )
+      elif fnam.lower().endswith(".csv"):
+        return clazz.fromCSV( f )
+      # guess from the content
+      txt = f.read()
+    if txt.lstrip().startswith("{"):
+      return clazz.fromJSON( io.StringIO( txt ) )
+    return clazz.fromCSV( io.StringIO( txt, newline = "" ) )
+
+  @staticmethod
+  def hwSegments(seg):
+    # 8-byte swap is emulated by using two mappings per dword!
+    return seg.nDWords if 8 == seg.swap else 1
+
+  # Check the imported layout against the current state of the layout:
+  #   maxHwSegs  : firmware limit on the number of (hardware) mappings
+  #   hwSegs     : number of hardware mappings already in use
+  #   segBytes   : size of the existing (user) segments
+  #   usedBytes  : space used by the existing (user) items
+  #   fixedBytes : size of the fixed entries (they count towards the
+  #                TXPDO size but not towards the space for user items)
+  # Returns a list of error messages (empty if the import may proceed).
+  def validate(self, maxHwSegs, hwSegs = 0, segBytes = 0, usedBytes = 0, fixedBytes = 0):
+    errs  = []
+    for s in self._segs:
+      hwSegs   += self.hwSegments( s )
+      segBytes += s.byteSz
+    if ( hwSegs > maxHwSegs ):
+      errs.append( "too many segments: need {:d} hardware maps (max. {:d}); NOTE: 8-byte swap uses TWO maps per dword".format( hwSegs, maxHwSegs ) )
+    maxBytes = FirmwareConstants.ESC_SM_MAX_LEN( FirmwareConstants.TXPDO_SM() )
+    if ( fixedBytes + segBytes > maxBytes ):
+      errs.append( "segments would exceed firmware TXPDO size limit ({:d} > {:d} bytes, incl. {:d} fixed bytes)".format( fixedBytes + segBytes, maxBytes, fixedBytes ) )
+    for it in self._items:
+      usedBytes += it.byteSz * it.nelms
+    if ( usedBytes > segBytes ):
+      errs.append( "items do not fit into segments ({:d} bytes needed, {:d} available)".format( usedBytes, segBytes ) )
+    return errs
+
+  # Split the TxPdo entries into the fixed ones (as selected by the
+  # FixedPdoPart.F_WITH_XXX flags; they are recognized by name) and
+  # the managed (user) ones.
+  # RETURNS: tuple (fixed, managed)
+  @staticmethod
+  def splitEntries(vd, pdo):
+    msks    = [ vd.F_WITH_TSTAMP, vd.F_WITH_TSTAMP, vd.F_WITH_EVENTS,
+                vd.F_WITH_LTCH0R, vd.F_WITH_LTCH0F, vd.F_WITH_LTCH1R, vd.F_WITH_LTCH1F ]
+    props   = vd.fixedProperties
+    names   = [ props[i]["name"] for i in range( len( props ) ) if ( vd.flags & msks[i] ) ]
+    fixed   = []
+    managed = []
+    i       = 0
+    while True:
+      try:
+        e = pdo[i]
+      except IndexError:
+        break
+      i += 1
+      if ( len( fixed ) < len( names ) and re.sub( '\\[[^]]*[]]', '', e.name ) == names[ len( fixed ) ] ):
+        fixed.append( e )
+      else:
+        managed.append( e )
+    if ( len( fixed ) != len( names ) ):
+      raise PdoImportError( "TxPdo: fixed entries not found ({})".format( ", ".join( names[ len( fixed ): ] ) ) )
+    return fixed, managed
+
+  # Import into an ESI object (non-GUI)
+  def applyToEsi(self, esi):
+    vd              = esi.vendorData
+    pdo             = esi.txPdo
+    segs            = [ s.clone() for s in vd.segments[1:] ]
+    fixed, managed  = self.splitEntries( vd, pdo )
+    hwSegs          = 0
+    segBytes        = 0
+    used            = 0
+    for s in segs:
+      hwSegs   += self.hwSegments( s )
+      segBytes += s.byteSz
+    for e in managed:
+      used     += e.byteSz * e.nelms
+    # vd.segments[0] is the 'Fixed' segment
+    errs = self.validate( vd.maxNumSegments, hwSegs, segBytes, used, vd.segments[0].byteSz )
+    if ( len( errs ) > 0 ):
+      raise PdoImportError( errs )
+    segs.extend( [ s.clone() for s in self._segs ] )
+    managed.extend( self._items )
+    vd.update( vd.flags, segs )
+    pdo.update( segs, fixed, managed )
+    esi.update()
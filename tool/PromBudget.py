@@ -0,0 +1,193 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Incremental model of the resources consumed by the TxPDO layout:
+# SII (EEPROM) bytes, SII strings, hardware mappings and TXPDO (SM3)
+# bytes. Generating the SII image (makeProm) is too slow to be done
+# on every edit; the model is calibrated once against an actual image
+# and then only tracks the parts which depend on PDO entries, segments
+# and their names:
+#
+#   - strings category : count byte + (1 + length) per distinct string
+#   - TxPDO category   : 8 bytes per PDO entry
+#   - device-specific  : 4 bytes per hardware mapping
+#   - segment names    : 2 bytes per segment (vendor category)
+#
+# Contributions are registered under a key (the object which owns them,
+# e.g., a PdoElement or PdoSegment); registering again under the same
+# key replaces the previous contribution. Updates cost O(#names).
+
+import re
+from   ESIPromGenerator  import Cat
+from   AppConstants      import HardwareConstants
+from   FirmwareConstants import FirmwareConstants
+
+class PromBudget(object):
+
+  HEADER_BYTES  = 128
+  STRINGS_CAT   = 10
+  CAT_HDR_BYTES = 4
+  ENTRY_BYTES   = 8
+  HWSEG_BYTES   = 4
+  SEGNAM_BYTES  = 2
+
+  def __init__(self, maxHwSegs = FirmwareConstants.TXPDO_MAX_NUM_SEGMENTS()):
+    super().__init__()
+    self._maxHwSegs  = maxHwSegs
+    # key -> (names, nEntries, hwSegs, nSegs, txPdoBytes)
+    self._contrib    = dict()
+    # reference counts of the strings we track
+    self._refs       = dict()
+    # strings found in the SII image which we do not track
+    self._untracked  = set()
+    self._nStrs      = 0
+    self._strBytes   = 0
+    self._nEntries   = 0
+    self._hwSegs     = 0
+    self._nSegs      = 0
+    self._txPdoBytes = 0
+    # SII bytes not covered by the model; None if not calibrated
+    self._base       = None
+    self._listeners  = list()
+
+  @staticmethod
+  def maxStrings():
+    return 255
+
+  @staticmethod
+  def maxPromBytes():
+    return HardwareConstants.EEPROM_SIZE_BYTES()
+
+  @staticmethod
+  def maxTxPdoBytes():
+    return FirmwareConstants.ESC_SM_MAX_LEN( FirmwareConstants.TXPDO_SM() )
+
+  @property
+  def maxHwSegs(self):
+    return self._maxHwSegs
+
+  # entry names as generated by PdoEntry
+  @staticmethod
+  def entryNames(name, nelms, indexedName = True):
+    if ( indexedName and nelms > 1 ):
+      name = re.sub(r'\[[^]]*[]]','', name)
+      return [ "{}[{:d}]".format(name, i) for i in range(1, nelms + 1) ]
+    return [ name for i in range( nelms ) ]
+
+  @staticmethod
+  def hwSegments(nDWords, swap):
+    # 8-byte swap is emulated by using two mappings per dword!
+    return nDWords if 8 == swap else 1
+
+  def addListener(self, listener):
+    self._listeners.append( listener )
+
+  def _notify(self):
+    for l in self._listeners:
+      l( self )
+
+  def _addStr(self, s):
+    if s is None or 0 == len(s):
+      return
+    n = self._refs.get( s, 0 )
+    self._refs[s] = n + 1
+    if ( 0 == n and not s in self._untracked ):
+      self._nStrs    += 1
+      self._strBytes += 1 + len(s)
+
+  def _delStr(self, s):
+    if s is None or 0 == len(s):
+      return
+    n = self._refs[s] - 1
+    if ( 0 == n ):
+      del self._refs[s]
+      if ( not s in self._untracked ):
+        self._nStrs    -= 1
+        self._strBytes -= 1 + len(s)
+    else:
+      self._refs[s] = n
+
+  def _set(self, key, names, nEntries, hwSegs, nSegs, txPdoBytes):
+    old = self._contrib.pop( key, None )
+    if not old is None:
+      for s in old[0]:
+        self._delStr( s )
+      self._nEntries   -= old[1]
+      self._hwSegs     -= old[2]
+      self._nSegs      -= old[3]
+      self._txPdoBytes -= old[4]
+    if not names is None:
+      for s in names:
+        self._addStr( s )
+      self._nEntries   += nEntries
+      self._hwSegs     += hwSegs
+      self._nSegs      += nSegs
+      self._txPdoBytes += txPdoBytes
+      self._contrib[key] = (names, nEntries, hwSegs, nSegs, txPdoBytes)
+    self._notify()
+
+  # Register PDO entries (one per name); 'txPdoBytes' is only nonzero
+  # for the fixed entries (user entries live in segments).
+  def setEntries(self, key, names, txPdoBytes = 0):
+    self._set( key, names, len(names), 0, 0, txPdoBytes )
+
+  def setSegment(self, key, name, nDWords, swap):
+    self._set( key, [ name ], 0, self.hwSegments( nDWords, swap ), 1, 4*nDWords )
+
+  def remove(self, key):
+    if key in self._contrib:
+      self._set( key, None, 0, 0, 0, 0 )
+
+  def _stringsCatBytes(self):
+    sz = 1 + self._strBytes
+    return self.CAT_HDR_BYTES + sz + (sz % 2)
+
+  def _modelBytes(self):
+    return (   self._stringsCatBytes()
+             + self.ENTRY_BYTES  * self._nEntries
+             + self.HWSEG_BYTES  * self._hwSegs
+             + self.SEGNAM_BYTES * self._nSegs )
+
+  # Calibrate against an SII image ('prom') which must correspond to
+  # the current state of the model.
+  def calibrate(self, prom):
+    cat  = Cat( prom[self.HEADER_BYTES:], self.STRINGS_CAT )
+    strs = set()
+    for i in range( cat.getUInt8() ):
+      strs.add( cat.getBytes( cat.getUInt8() ).decode() )
+    self._untracked = strs - set( self._refs.keys() )
+    self._nStrs     = len( self._untracked ) + len( self._refs )
+    self._strBytes  = 0
+    for s in self._untracked:
+      self._strBytes += 1 + len(s)
+    for s in self._refs.keys():
+      self._strBytes += 1 + len(s)
+    self._base      = len(prom) - self._modelBytes()
+    self._notify()
+
+  @property
+  def calibrated(self):
+    return not self._base is None
+
+  # None if not calibrated
+  @property
+  def promBytes(self):
+    if self._base is None:
+      return None
+    return self._base + self._modelBytes()
+
+  @property
+  def numStrings(self):
+    return self._nStrs
+
+  @property
+  def hwSegs(self):
+    return self._hwSegs
+
+  @property
+  def txPdoBytes(self):
+    return self._txPdoBytes
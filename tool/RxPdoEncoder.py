@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Encoder (requires numpy) for RxPDO images, compiled from the RxPdo
+# entries of an ESI file (or SII image); packs per-field values into
+# images in bulk and generates test patterns:
+#
+#   enc = RxPdoEncoder( loadEsi( "evr.xml" ) )
+#   img = enc.encode( { "LED" : leds } )  # (n, 3) array -> (n, size) uint8
+#   img = enc.walkingOnes( 100000 )
+#   img = enc.counter( 100000 )
+#   for wrdAddr, data, ben in enc.wordWrites( img[0] ): ...
+#
+# Patterns only touch the bits covered by (non-padding) entries:
+#
+#   walking ones/zeros : one bit set (clear) per image, advancing by one
+#                        bit from image to image
+#   counter            : every field (array element) holds a counter
+#                        (plus the element number) incremented from image
+#                        to image; truncated to the field width
+#
+# 'wordWrites' splits an image into the 16-bit word writes (word address,
+# data, byte-enables) the firmware hands to the application (see
+# Lan9254PDOMstType, RxPDOSoft.vhd).
+
+import sys
+import io
+import numpy
+from   PdoDtype import rxPdoFields, rxPdoDtype
+
+class RxPdoEncoder(object):
+
+  def __init__(self, src):
+    super().__init__()
+    self._fields, self._size = rxPdoFields( src )
+    self._dtype  = rxPdoDtype( src )
+    # byte offset and size of every element
+    self._elms   = []
+    for f in self._fields:
+      if ( not f.isPadding ):
+        for i in range( f.nelms ):
+          self._elms.append( ( f.offset + i * f.byteSz, f.byteSz ) )
+    self._bits   = numpy.array( [ 8*o + b for o, s in self._elms for b in range( 8*s ) ], dtype = numpy.int64 )
+
+  @property
+  def dtype(self):
+    return self._dtype
+
+  @property
+  def size(self):
+    return self._size
+
+  @property
+  def fields(self):
+    return self._fields
+
+  # RETURNS: (n, size) uint8 array of zeroed images
+  def zeros(self, n):
+    return numpy.zeros( ( n, self._size ), dtype = numpy.uint8 )
+
+  # RETURNS: structured view of images
+  def records(self, images):
+    return images.reshape( -1 ).view( self._dtype )
+
+  # Pack values into images; 'values' is a dict (field name -> values,
+  # broadcast over the images) or a structured array. The number of
+  # images is that of the longest value array unless 'n' is given.
+  # RETURNS: (n, size) uint8 array
+  def encode(self, values, n = None):
+    if ( isinstance( values, numpy.ndarray ) and not values.dtype.names is None ):
+      values = { k : values[k] for k in values.dtype.names }
+    if ( n is None ):
+      n = 1
+      for k, v in values.items():
+        v = numpy.asarray( v )
+        f = self._dtype.fields[k][0]
+        if ( v.ndim > len( f.shape ) ):
+          n = max( n, v.shape[0] )
+    img = self.zeros( n )
+    rec = self.records( img )
+    for k, v in values.items():
+      rec[k] = v
+    return img
+
+  # RETURNS: (n, size) uint8 array with a walking one (zero if 'invert')
+  def walkingOnes(self, n, start = 0, invert = False):
+    img = self.zeros( n )
+    if ( len( self._bits ) > 0 ):
+      b   = self._bits[ ( start + numpy.arange( n ) ) % len( self._bits ) ]
+      img[ numpy.arange( n ), b // 8 ] = numpy.left_shift( 1, b % 8 ).astype( numpy.uint8 )
+    if ( invert ):
+      img ^= self._usedMask()
+    return img
+
+  def walkingZeros(self, n, start = 0):
+    return self.walkingOnes( n, start, invert = True )
+
+  def _usedMask(self):
+    m = numpy.zeros( self._size, dtype = numpy.uint8 )
+    for o, s in self._elms:
+      m[o:o + s] = 0xff
+    return m
+
+  # RETURNS: (n, size) uint8 array with counters (little-endian)
+  def counter(self, n, start = 0, step = 1):
+    img = self.zeros( n )
+    c   = start + step * numpy.arange( n, dtype = numpy.uint64 )
+    for i in range( len( self._elms ) ):
+      o, s = self._elms[i]
+      b    = ( c + numpy.uint64( i ) ).astype( "<u8" ).view( numpy.uint8 ).reshape( n, 8 )
+      for j in range( 0, s, 8 ):
+        k = min( 8, s - j )
+        img[:, o + j:o + j + k] = b[:, 0:k]
+    return img
+
+  # RETURNS: list of (wrdAddr, data, ben) 16-bit word writes of an image
+  def wordWrites(self, image):
+    image = numpy.asarray( image, dtype = numpy.uint8 ).reshape( -1 )
+    l     = []
+    for a in range( 0, len( image ), 2 ):
+      if ( a + 1 < len( image ) ):
+        l.append( ( a // 2, int( image[a] ) | ( int( image[a + 1] ) << 8 ), 3 ) )
+      else:
+        l.append( ( a // 2, int( image[a] ), 1 ) )
+    return l
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hp:n:s:o:wf:" )
+
+  pat    = "walk1"
+  count  = 16
+  start  = 0
+  out    = None
+  words  = False
+  values = dict()
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-p pattern] [-n count] [-s start] [-f field=value] [-o file] [-w] esi-or-sii-file".format( sys.argv[0] ))
+      print("  Generate RxPDO images (test patterns)")
+      print("   -h   : print this message")
+      print("   -p   : pattern: 'walk1', 'walk0', 'count', 'const' (default: '{}')".format( pat ))
+      print("   -n   : number of images (default: {:d})".format( count ))
+      print("   -s   : start value (bit number or counter; default: 0)")
+      print("   -f   : field value for the 'const' pattern (arrays: comma-separated); may be repeated")
+      print("   -o   : write raw images to this file (default: print)")
+      print("   -w   : print 16-bit word writes (word address, data, byte-enables)")
+      sys.exit(0)
+    elif opt[0] in ('-p'):
+      pat    = opt[1]
+    elif opt[0] in ('-n'):
+      count  = int( opt[1], 0 )
+    elif opt[0] in ('-s'):
+      start  = int( opt[1], 0 )
+    elif opt[0] in ('-o'):
+      out    = opt[1]
+    elif opt[0] in ('-w'):
+      words  = True
+    elif opt[0] in ('-f'):
+      k, v      = opt[1].split( "=" )
+      values[k] = [ int( x, 0 ) for x in v.split( "," ) ]
+
+  if ( len( args ) < 1 ):
+    print( "Error: ESI or SII file required", file = sys.stderr )
+    sys.exit(1)
+
+  enc = RxPdoEncoder( loadEsi( args[0] ) )
+  if   ( "walk1" == pat ):
+    img = enc.walkingOnes( count, start )
+  elif ( "walk0" == pat ):
+    img = enc.walkingZeros( count, start )
+  elif ( "count" == pat ):
+    img = enc.counter( count, start )
+  elif ( "const" == pat ):
+    img = enc.encode( values, count )
+  else:
+    print( "Error: unknown pattern '{}'".format( pat ), file = sys.stderr )
+    sys.exit(1)
+
+  if ( not out is None ):
+    with io.open( out, "wb" ) as f:
+      f.write( img.tobytes() )
+  elif ( words ):
+    for i in range( len( img ) ):
+      for a, d, b in enc.wordWrites( img[i] ):
+        print( "{:d} 0x{:04x} 0x{:04x} {:d}".format( i, a, d, b ) )
+  else:
+    for i in range( len( img ) ):
+      print( " ".join( [ "{:02x}".format( x ) for x in img[i] ] ) )
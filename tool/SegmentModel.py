@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Golden model (requires numpy) of the TxPDO segment mapping: the firmware
+# copies EVR data-buffer dwords into the TxPDO (after the fixed part)
+# according to the hardware maps in the SII (PdoSegment.promData):
+#
+#   map    : nDWords (10 bits), swap (0x10: 2-byte, 0x20: 4-byte), byte offset
+#   8-byte : emulated by one 4-byte swapped map per dword; the maps
+#            read the dwords at byte offsets base+4, base, base+12,
+#            base+8, ... (i.e., the dwords of each pair are exchanged)
+#
+# The model is compiled from the very same map encoding into a byte
+# permutation, i.e., an index array 'src' with
+#
+#   txpdo[ fixedBytes + k ] = dbuf[ src[k] ]
+#
+# so a batch of data buffers is mapped (or a batch of captured TxPDOs
+# mapped back) with a single fancy-indexing operation:
+#
+#   m   = SegmentModel.fromVendorData( esi.vendorData )
+#   exp = m.apply( dbufs )              # (nframes, pdoSize) uint8
+#   bad = m.verify( dbufs, txpdos )     # mismatching bytes per frame
+#   dbf, valid = m.inverse( txpdos )
+
+import sys
+import numpy
+from   ToolCore          import PdoSegment
+from   FirmwareConstants import FirmwareConstants
+
+class SegmentModel(object):
+
+  # byte order within a dword for the swap modes of a hardware map
+  PERM = { 1 : [0, 1, 2, 3], 2 : [1, 0, 3, 2], 4 : [3, 2, 1, 0] }
+
+  # 'segments': list of PdoSegment (user segments only); 'fixedBytes':
+  # size of the fixed TxPDO part preceding the segments
+  def __init__(self, segments, fixedBytes = 0):
+    super().__init__()
+    prom = bytearray()
+    for s in segments:
+      if ( s.nDWords > 0 ):
+        prom.extend( s.promData() )
+    self._init( prom, fixedBytes )
+    # (name, byteOffset, nDWords) of the data-buffer areas which must be mapped
+    self._spans = [ ( s.name, s.byteOffset, s.nDWords ) for s in segments if s.nDWords > 0 ]
+
+  def _init(self, prom, fixedBytes):
+    self._fixed = fixedBytes
+    self._maps  = []
+    src         = []
+    for i in range( 0, len( prom ), 4 ):
+      m = PdoSegment.fromPromData( bytearray( prom[i:i+4] ) )
+      self._maps.append( ( m.byteOffset, m.nDWords, m.swap ) )
+      perm = self.PERM[ m.swap ]
+      for w in range( m.nDWords ):
+        base = m.byteOffset + 4*w
+        src.extend( [ base + p for p in perm ] )
+    self._src   = numpy.array( src, dtype = numpy.int64 )
+
+  # Compile from the hardware maps (as stored in the SII)
+  @classmethod
+  def fromPromData(clazz, prom, fixedBytes = 0):
+    m = clazz( [], fixedBytes )
+    m._init( prom, fixedBytes )
+    m._spans = [ ( "map #{:d}".format( i ), m._maps[i][0], m._maps[i][1] ) for i in range( len( m._maps ) ) ]
+    return m
+
+  @classmethod
+  def fromVendorData(clazz, vendorData):
+    segs = vendorData.segments
+    return clazz( segs[1:], segs[0].byteSz )
+
+  # list of (byteOffset, nDWords, swap) hardware maps
+  @property
+  def hwMaps(self):
+    return self._maps
+
+  @property
+  def fixedBytes(self):
+    return self._fixed
+
+  @property
+  def pdoSize(self):
+    return self._fixed + len( self._src )
+
+  # data-buffer byte index for every byte of the user part
+  @property
+  def sourceIndex(self):
+    return self._src
+
+  # minimal size of the data buffer
+  @property
+  def dbufExtent(self):
+    return int( self._src.max() ) + 1 if len( self._src ) > 0 else 0
+
+  # RETURNS: boolean mask of the data-buffer bytes which are mapped
+  def coverage(self, dbufSize = None):
+    if ( dbufSize is None ):
+      dbufSize = self.dbufExtent
+    cov = numpy.zeros( dbufSize, dtype = bool )
+    cov[ self._src[ self._src < dbufSize ] ] = True
+    return cov
+
+  # Check a (hand-made) layout.
+  # RETURNS: list of problems (empty if OK)
+  def problems(self, dbufSize = None, maxMaps = FirmwareConstants.TXPDO_MAX_NUM_SEGMENTS()):
+    errs = []
+    if ( len( self._maps ) > maxMaps ):
+      errs.append( "too many hardware maps ({:d} > {:d})".format( len( self._maps ), maxMaps ) )
+    maxLen = FirmwareConstants.ESC_SM_MAX_LEN( FirmwareConstants.TXPDO_SM() )
+    if ( self.pdoSize > maxLen ):
+      errs.append( "TxPDO too big ({:d} > {:d} bytes)".format( self.pdoSize, maxLen ) )
+    if ( not dbufSize is None ):
+      for i in range( len( self._maps ) ):
+        off, n, swp = self._maps[i]
+        if ( off + 4*n > dbufSize ):
+          errs.append( "map #{:d} (offset 0x{:x}, {:d} dwords) exceeds the data buffer ({:d} bytes)".format( i, off, n, dbufSize ) )
+    # data-buffer dword of every TxPDO dword
+    dws = self._src[0::4] // 4
+    dup = numpy.flatnonzero( numpy.bincount( dws ) > 1 ) if len( dws ) > 0 else dws
+    if ( len( dup ) > 0 ):
+      errs.append( "data-buffer dword(s) mapped more than once: {}".format( self._fmtDWords( dup ) ) )
+    for nam, off, n in self._spans:
+      mis = numpy.setdiff1d( numpy.arange( off // 4, off // 4 + n ), dws )
+      if ( len( mis ) > 0 ):
+        errs.append( "'{}': data-buffer dword(s) not mapped: {}".format( nam, self._fmtDWords( mis ) ) )
+    return errs
+
+  # byte offsets of (a few) dwords
+  @staticmethod
+  def _fmtDWords(dws, nmax = 8):
+    s = ", ".join( [ "0x{:x}".format( 4*int( d ) ) for d in dws[0:nmax] ] )
+    if ( len( dws ) > nmax ):
+      s += ", ... ({:d} total)".format( len( dws ) )
+    return s
+
+  # view as a 2-D array of bytes (one row per frame)
+  @staticmethod
+  def _asRows(a):
+    if ( isinstance( a, (bytes, bytearray, memoryview) ) ):
+      a = numpy.frombuffer( a, dtype = numpy.uint8 )
+    a = numpy.ascontiguousarray( a )
+    if ( a.dtype != numpy.uint8 ):
+      a = a.view( numpy.uint8 ).reshape( a.shape[:-1] + ( -1, ) if a.ndim > 0 else ( -1, ) )
+    if ( 1 == a.ndim ):
+      a = a.reshape( 1, -1 )
+    return a
+
+  # Map a batch of data buffers into TxPDO images; the fixed part is
+  # taken from 'fixed' (broadcast; zeros if None)
+  # RETURNS: (nframes, pdoSize) uint8 array
+  def apply(self, dbufs, fixed = None):
+    d = self._asRows( dbufs )
+    if ( d.shape[1] < self.dbufExtent ):
+      raise ValueError("data buffers too small (need {:d} bytes)".format( self.dbufExtent ))
+    out = numpy.zeros( ( d.shape[0], self.pdoSize ), dtype = numpy.uint8 )
+    if ( not fixed is None ):
+      out[:, 0:self._fixed] = self._asRows( fixed )
+    out[:, self._fixed:] = d[:, self._src]
+    return out
+
+  # Reconstruct data-buffer contents from a batch of TxPDO images.
+  # Bytes which are mapped more than once are taken from the last map
+  # (see 'conflicts').
+  # RETURNS: (nframes, dbufSize) uint8 array and a mask of the bytes
+  #          that could be reconstructed
+  def inverse(self, txpdos, dbufSize = None):
+    t = self._asRows( txpdos )
+    if ( t.shape[1] < self.pdoSize ):
+      raise ValueError("TxPDO images too small (need {:d} bytes)".format( self.pdoSize ))
+    if ( dbufSize is None ):
+      dbufSize = self.dbufExtent
+    out = numpy.zeros( ( t.shape[0], dbufSize ), dtype = numpy.uint8 )
+    ok  = self._src < dbufSize
+    out[:, self._src[ok]] = t[:, self._fixed:self.pdoSize][:, ok]
+    return out, self.coverage( dbufSize )
+
+  # RETURNS: number of data-buffer bytes per frame for which multiply
+  #          mapped copies in the TxPDO disagree
+  def conflicts(self, txpdos):
+    t   = self._asRows( txpdos )[:, self._fixed:self.pdoSize]
+    rec, valid = self.inverse( txpdos )
+    return ( rec[:, self._src] != t ).sum( axis = 1 )
+
+  # Compare captured TxPDO images against the model (user part only)
+  # RETURNS: number of mismatching bytes per frame
+  def verify(self, dbufs, txpdos):
+    t = self._asRows( txpdos )
+    return ( self.apply( dbufs )[:, self._fixed:] != t[:, self._fixed:self.pdoSize] ).sum( axis = 1 )
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hd:s:t:" )
+
+  dbfn   = None
+  dbsz   = None
+  txfn   = None
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-h] [-d dbuf-file -s dbuf-size [-t txpdo-file]] esi-or-sii-file".format( sys.argv[0] ))
+      print("  Print the TxPDO segment maps; map EVR data buffers into TxPDOs or verify captured TxPDOs")
+      print("   -h   : print this message")
+      print("   -d   : file with (back-to-back) EVR data buffers")
+      print("   -s   : size of a data buffer (bytes)")
+      print("   -t   : file with (back-to-back) TxPDO images to verify (default: write expected images to stdout)")
+      sys.exit(0)
+    elif opt[0] in ('-d'):
+      dbfn   = opt[1]
+    elif opt[0] in ('-s'):
+      dbsz   = int( opt[1], 0 )
+    elif opt[0] in ('-t'):
+      txfn   = opt[1]
+
+  if ( len( args ) < 1 ):
+    print( "Error: ESI or SII file required", file = sys.stderr )
+    sys.exit(1)
+
+  m = SegmentModel.fromVendorData( loadEsi( args[0] ).vendorData )
+  if ( dbfn is None ):
+    for i in range( len( m.hwMaps ) ):
+      print( "map #{:2d}: offset 0x{:03x}, {:4d} dwords, swap {:d}".format( i, *m.hwMaps[i] ) )
+    print( "TxPDO: {:d} bytes ({:d} fixed)".format( m.pdoSize, m.fixedBytes ) )
+    for p in m.problems( dbsz ):
+      print( "PROBLEM: {}".format( p ) )
+    sys.exit(0)
+
+  if ( dbsz is None ):
+    print( "Error: data-buffer size (-s) required", file = sys.stderr )
+    sys.exit(1)
+  dbufs = numpy.fromfile( dbfn, dtype = numpy.uint8 )
+  dbufs = dbufs[ 0 : len( dbufs ) - len( dbufs ) % dbsz ].reshape( -1, dbsz )
+  if ( txfn is None ):
+    sys.stdout.buffer.write( m.apply( dbufs ).tobytes() )
+  else:
+    txpdos = numpy.fromfile( txfn, dtype = numpy.uint8 )
+    txpdos = txpdos[ 0 : len( txpdos ) - len( txpdos ) % m.pdoSize ].reshape( -1, m.pdoSize )
+    n      = min( len( dbufs ), len( txpdos ) )
+    bad    = m.verify( dbufs[0:n], txpdos[0:n] )
+    for i in numpy.flatnonzero( bad ):
+      print( "frame #{:d}: {:d} bytes differ".format( i, bad[i] ) )
+    print( "{:d} frames verified, {:d} mismatches".format( n, numpy.count_nonzero( bad ) ) )
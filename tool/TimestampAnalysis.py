@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# Jitter analysis (requires numpy) of the timestamps in the fixed TxPDO
+# part: the EVR timestamp (TimestampHi: seconds, TimestampLo: ns or EVR
+# clock ticks) and the EtherCAT DC times (ns) at which LATCH0/LATCH1 were
+# asserted/deasserted (the firmware toggles the LATCH signals on EVR events).
+#
+#   ta = TimestampAnalysis()
+#   for chunk in ...:                   # decodeTxPdo( ... )[i:i+n]
+#     ta.update( chunk )
+#   print( ta )
+#
+# A latch value is only considered if it changed since the previous
+# TxPDO (a new edge). For every edge the offset 'DC time - EVR time' is
+# computed. Per latch signal/edge:
+#
+#  - drift   : slope of the offset (least-squares over the entire
+#              capture), i.e., the rate difference of the EVR and DC
+#              clocks (ppm)
+#  - jitter  : percentiles of the offset after removing a linear trend
+#              (fitted per chunk, so slow wander is removed as well)
+#  - period  : percentiles of the deviation of the interval between
+#              consecutive edges from the nominal one (the median of
+#              the first chunk)
+#  - outliers: edges with a (detrended) offset further than 'k' robust
+#              standard deviations (estimated from the first MIN_EDGES
+#              edges; edges are held back until that many are seen)
+#
+# Captures are processed in chunks of arbitrary size (e.g., slices of a
+# memory-mapped capture); percentiles come from fixed-resolution
+# histograms so memory does not grow with the size of the capture.
+# Comparing captures taken with different EVR delay-compensation targets
+# (EvrDCTargetNS) helps finding the smallest target which keeps the
+# jitter down.
+
+import sys
+import numpy
+
+# EtherCAT DC time starts 2000-01-01 (POSIX: 1970-01-01)
+DC_EPOCH_POSIX_NS = 946684800 * 1000000000
+
+LATCH_FIELDS = [ "TimestampLatch0Rising",
+                 "TimestampLatch0Falling",
+                 "TimestampLatch1Rising",
+                 "TimestampLatch1Falling" ]
+
+# RETURNS: EVR time in ns (int64); 'tickNs' is the period of the
+#          TimestampLo counter
+def evrTimeNs(rec, tickNs = 1.0, hi = "TimestampHi", lo = "TimestampLo"):
+  s = rec[hi].astype( numpy.int64 ) * 1000000000
+  if ( 1.0 == tickNs ):
+    return s + rec[lo].astype( numpy.int64 )
+  return s + numpy.round( rec[lo] * tickNs ).astype( numpy.int64 )
+
+# RETURNS: mask of the frames where 'dc' holds a new (non-zero) value;
+#          'prev' is the last value of the previous chunk
+def newEdges(dc, prev = None):
+  chg      = numpy.empty( len( dc ), dtype = bool )
+  if ( len( dc ) > 0 ):
+    chg[0]  = ( prev is None or dc[0] != prev )
+    chg[1:] = dc[1:] != dc[:-1]
+  return chg & ( dc != 0 )
+
+# Histogram with fixed resolution; values outside of +/- rangeNs are
+# counted (and tracked by min/max) but not binned.
+class JitterHistogram(object):
+
+  def __init__(self, binNs = 1.0, rangeNs = 100000.0):
+    super().__init__()
+    self._bin   = binNs
+    self._nb    = int( numpy.ceil( rangeNs / binNs ) )
+    self.reset()
+
+  def reset(self):
+    self._h     = numpy.zeros( 2 * self._nb, dtype = numpy.int64 )
+    self.under  = 0
+    self.over   = 0
+    self.count  = 0
+    self.min    = numpy.inf
+    self.max    = -numpy.inf
+    self._s1    = 0.0
+    self._s2    = 0.0
+
+  def add(self, v):
+    if ( 0 == len( v ) ):
+      return
+    b           = numpy.floor( v / self._bin ).astype( numpy.int64 ) + self._nb
+    self.under += numpy.count_nonzero( b < 0 )
+    self.over  += numpy.count_nonzero( b >= len( self._h ) )
+    ok          = ( b >= 0 ) & ( b < len( self._h ) )
+    self._h    += numpy.bincount( b[ok], minlength = len( self._h ) )
+    self.count += len( v )
+    self.min    = min( self.min, float( v.min() ) )
+    self.max    = max( self.max, float( v.max() ) )
+    self._s1   += float( v.sum() )
+    self._s2   += float( ( v * v ).sum() )
+
+  @property
+  def mean(self):
+    return self._s1 / self.count if self.count > 0 else numpy.nan
+
+  @property
+  def std(self):
+    if ( self.count < 2 ):
+      return numpy.nan
+    m = self.mean
+    return numpy.sqrt( max( self._s2 / self.count - m * m, 0.0 ) )
+
+  # RETURNS: q-th percentile (center of the bin; -/+inf if it falls
+  #          below/above the range)
+  def percentile(self, q):
+    if ( 0 == self.count ):
+      return numpy.nan
+    k = q / 100.0 * ( self.count - 1 )
+    if ( k < self.under ):
+      return -numpy.inf
+    c = numpy.cumsum( self._h ) + self.under
+    i = int( numpy.searchsorted( c, k, side = "right" ) )
+    if ( i >= len( self._h ) ):
+      return numpy.inf
+    return ( i - self._nb + 0.5 ) * self._bin
+
+class EdgeStats(object):
+
+  PERCENTILES = [ 0.1, 1, 50, 99, 99.9 ]
+  # edges needed for estimating the outlier threshold
+  MIN_EDGES   = 32
+
+  def __init__(self, name, binNs = 1.0, rangeNs = 100000.0, k = 6.0, maxOutliers = 1000, dcEpochNs = 0):
+    super().__init__()
+    self.name      = name
+    self._epoch    = dcEpochNs
+    self._k        = k
+    self._maxOut   = maxOutliers
+    self.jitter    = JitterHistogram( binNs, rangeNs )
+    self.period    = JitterHistogram( binNs, rangeNs )
+    self._out      = list()  # (frame, detrended offset ns)
+    self._pend     = list()  # (frames, offsets) until the threshold is known
+    self._npend    = 0
+    self._minSig   = binNs
+    self._ref      = None    # (t0, offset0)
+    self._sums     = numpy.zeros( 5 )  # n, x, y, xx, xy
+    self._lastDc   = None
+    self._nominal  = None
+    self._thresh   = None
+    self.count     = 0
+
+  # 'frm': frame numbers, 'evr'/'dc': times (ns) of new edges
+  def update(self, frm, evr, dc):
+    if ( 0 == len( dc ) ):
+      return
+    off = dc.astype( numpy.int64 ) + self._epoch - evr
+    if ( self._ref is None ):
+      self._ref = ( int( evr[0] ), int( off[0] ) )
+    x   = ( evr - self._ref[0] ) / 1.0e9
+    y   = ( off - self._ref[1] ).astype( numpy.float64 )
+    self._sums += [ len( x ), x.sum(), y.sum(), ( x * x ).sum(), ( x * y ).sum() ]
+    # detrend (per chunk)
+    if ( len( x ) > 2 and x[-1] > x[0] ):
+      p = numpy.polyfit( x - x[0], y, 1 )
+      r = y - numpy.polyval( p, x - x[0] )
+    else:
+      r = y - self.slope * x - self._intercept()
+    self.jitter.add( r )
+    if ( self._thresh is None ):
+      self._pend.append( ( frm, r ) )
+      self._npend += len( r )
+      if ( self._npend >= self.MIN_EDGES ):
+        self._setThreshold()
+    else:
+      self._flag( frm, r )
+    # intervals between consecutive edges
+    d = dc.astype( numpy.int64 )
+    if ( not self._lastDc is None ):
+      d = numpy.concatenate( ( [ self._lastDc ], d ) )
+    per = numpy.diff( d )
+    if ( self._nominal is None and len( per ) > 0 ):
+      self._nominal = int( numpy.median( per ) )
+    if ( not self._nominal is None ):
+      self.period.add( ( per - self._nominal ).astype( numpy.float64 ) )
+    self._lastDc = int( dc[-1] )
+    self.count  += len( dc )
+
+  def _flag(self, frm, r):
+    bad = numpy.flatnonzero( numpy.abs( r ) > self._thresh )
+    for i in bad[ 0 : max( self._maxOut - len( self._out ), 0 ) ]:
+      self._out.append( ( int( frm[i] ), float( r[i] ) ) )
+
+  # estimate the threshold from the edges held back and check them
+  def _setThreshold(self):
+    r            = numpy.concatenate( [ p[1] for p in self._pend ] )
+    med          = numpy.median( r )
+    sig          = max( 1.4826 * numpy.median( numpy.abs( r - med ) ), self._minSig )
+    self._thresh = self._k * sig
+    for f, v in self._pend:
+      self._flag( f, v )
+    self._pend   = list()
+    self._npend  = 0
+
+  # if fewer than MIN_EDGES edges were seen the threshold is estimated
+  # from those
+  def _settle(self):
+    if ( self._thresh is None and self._npend > 0 ):
+      self._setThreshold()
+
+  # outlier threshold (ns)
+  @property
+  def threshold(self):
+    self._settle()
+    return self._thresh
+
+  # (frame, detrended offset ns) of the outliers
+  @property
+  def outliers(self):
+    self._settle()
+    return self._out
+
+  def _intercept(self):
+    n, sx, sy, sxx, sxy = self._sums
+    return ( sy - self.slope * sx ) / n if n > 0 else 0.0
+
+  # drift of the offset (ns/s)
+  @property
+  def slope(self):
+    n, sx, sy, sxx, sxy = self._sums
+    den = n * sxx - sx * sx
+    return ( n * sxy - sx * sy ) / den if n > 1 and den > 0 else 0.0
+
+  @property
+  def driftPpm(self):
+    return self.slope / 1000.0
+
+  # mean offset (DC - EVR time) in ns
+  @property
+  def meanOffsetNs(self):
+    n, sx, sy, sxx, sxy = self._sums
+    return self._ref[1] + sy / n if n > 0 else numpy.nan
+
+  @property
+  def nominalPeriodNs(self):
+    return self._nominal
+
+  def __str__(self):
+    if ( 0 == self.count ):
+      return "{}: no edges".format( self.name )
+    pj = ", ".join( [ "p{:g} {:.0f}".format( q, self.jitter.percentile( q ) ) for q in self.PERCENTILES ] )
+    pp = ", ".join( [ "p{:g} {:.0f}".format( q, self.period.percentile( q ) ) for q in self.PERCENTILES ] )
+    return ( "{}: {:d} edges, mean offset {:.0f} ns, drift {:.3f} ppm\n".format( self.name, self.count, self.meanOffsetNs, self.driftPpm ) +
+             "  jitter [ns]: std {:.1f}, {}\n".format( self.jitter.std, pj ) +
+             "  period [ns]: nominal {}, std {:.1f}, {}\n".format( self._nominal, self.period.std, pp ) +
+             "  outliers   : {:d} (> {:.0f} ns)".format( len( self.outliers ), self.threshold ) )
+
+class TimestampAnalysis(object):
+
+  # 'tickNs': period of the TimestampLo counter (1.0 if it counts ns;
+  #           1000.0/ClockConfig.freqMHz if it counts EVR clock ticks)
+  # 'dcEpochNs': added to DC times (DC_EPOCH_POSIX_NS if the EVR
+  #           seconds are POSIX time)
+  def __init__(self, tickNs = 1.0, binNs = 1.0, rangeNs = 100000.0, k = 6.0, latches = LATCH_FIELDS, dcEpochNs = 0):
+    super().__init__()
+    self._tick    = tickNs
+    self._latches = list( latches )
+    self._stats   = { l : EdgeStats( l, binNs, rangeNs, k, dcEpochNs = dcEpochNs ) for l in self._latches }
+    self._prev    = dict()
+    self._frames  = 0
+
+  @property
+  def frames(self):
+    return self._frames
+
+  def __getitem__(self, latch):
+    return self._stats[latch]
+
+  # 'rec': decoded TxPDO images (see PdoDtype); latches missing from
+  # the layout are ignored
+  def update(self, rec):
+    evr = evrTimeNs( rec, self._tick )
+    for l in self._latches:
+      if ( not l in rec.dtype.names ):
+        continue
+      dc  = rec[l]
+      e   = numpy.flatnonzero( newEdges( dc, self._prev.get( l ) ) )
+      self._stats[l].update( e + self._frames, evr[e], dc[e] )
+      if ( len( dc ) > 0 ):
+        self._prev[l] = dc[-1]
+    self._frames += len( rec )
+
+  def __str__(self):
+    return "\n".join( [ "{:d} frames".format( self._frames ) ] + [ str( self._stats[l] ) for l in self._latches if self._stats[l].count > 0 ] )
+
+if __name__ == '__main__':
+
+  import getopt
+  from   PdoDtype import loadEsi, txPdoDtype, decodeTxPdo
+
+  ( opts, args ) = getopt.getopt( sys.argv[1:], "hc:o:s:t:b:r:k:OP" )
+
+  chunk  = 100000
+  offset = 0
+  stride = None
+  tickNs = 1.0
+  binNs  = 1.0
+  rngNs  = 100000.0
+  k      = 6.0
+  lstOut = False
+  epoch  = 0
+
+  for opt in opts:
+    if opt[0] in ('-h'):
+      print("Usage: {} [-hOP] [-c chunk] [-o offset] [-s stride] [-t tickNs] [-b binNs] [-r rangeNs] [-k sigmas] esi-or-sii-file capture-file".format( sys.argv[0] ))
+      print("  EVR/DC timestamp (LATCH) offset, drift and jitter of raw TxPDO images")
+      print("   -h   : print this message")
+      print("   -c   : frames per chunk (default: {:d})".format( chunk ))
+      print("   -o   : byte offset of the first image (default: 0)")
+      print("   -s   : distance between images (default: TxPDO size)")
+      print("   -t   : period of the TimestampLo counter in ns (default: {:g}; 'clk': EVR clock of the ESI)".format( tickNs ))
+      print("   -b   : histogram resolution in ns (default: {:g})".format( binNs ))
+      print("   -r   : histogram range in ns (default: +/-{:g})".format( rngNs ))
+      print("   -k   : outlier threshold in robust standard deviations (default: {:g})".format( k ))
+      print("   -O   : list outliers")
+      print("   -P   : EVR seconds are POSIX time (convert DC time)")
+      sys.exit(0)
+    elif opt[0] in ('-c'):
+      chunk  = int( opt[1], 0 )
+    elif opt[0] in ('-o'):
+      offset = int( opt[1], 0 )
+    elif opt[0] in ('-s'):
+      stride = int( opt[1], 0 )
+    elif opt[0] in ('-t'):
+      tickNs = opt[1]
+    elif opt[0] in ('-b'):
+      binNs  = float( opt[1] )
+    elif opt[0] in ('-r'):
+      rngNs  = float( opt[1] )
+    elif opt[0] in ('-k'):
+      k      = float( opt[1] )
+    elif opt[0] in ('-O'):
+      lstOut = True
+    elif opt[0] in ('-P'):
+      epoch  = DC_EPOCH_POSIX_NS
+
+  if ( len( args ) < 2 ):
+    print( "Error: ESI (or SII) and capture file required", file = sys.stderr )
+    sys.exit(1)
+
+  esi    = loadEsi( args[0] )
+  tickNs = 1000.0 / esi.vendorData.clockConfig.freqMHz if tickNs == "clk" else float( tickNs )
+  rec    = decodeTxPdo( numpy.memmap( args[1], dtype = numpy.uint8, mode = "r" ), txPdoDtype( esi ), offset, stride )
+  ta     = TimestampAnalysis( tickNs, binNs, rngNs, k, dcEpochNs = epoch )
+  for i in range( 0, len( rec ), chunk ):
+    ta.update( rec[i:i+chunk] )
+  print( ta )
+  print( "EVR delay-compensation target (ESI): {:g} ns".format( esi.vendorData.getEvrDCTargetNS() ) )
+  if ( lstOut ):
+    for l in LATCH_FIELDS:
+      for f, r in ta[l].outliers:
+        print( "{} frame {:d}: {:+.0f} ns".format( l, f, r ) )
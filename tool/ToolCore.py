@@ -293,7 +293,8 @@ class PdoSegment(object):
       pd.append( tmp )
       pd.append( (off >> 0) & 0xff )
       pd.append( (off >> 8) & 0xff )
-      off += -4 if (i % 2 == 0) else +8
+      # exchange the dwords of each pair: base+4, base, base+12, base+8, ...
+      off += -4 if (i % 2 == 0) else +12
     return pd
 
   @staticmethod
@@ -1592,6 +1593,10 @@ class XMLBase(object):
       root = self.mkBasicTree()
     self._root = root
 
+  @property
+  def element(self):
+    return self._root
+
   def writeXML(self, fnam, pre=''):
     if ( isinstance(fnam, io.TextIOWrapper) ):
       txt = self.toString().split('\n')
@@ -1612,6 +1617,59 @@ class XMLBase(object):
     st = ET.tostring( et, xml_declaration = True, method = "xml", pretty_print=True, encoding='utf-8')
     return st.decode()
 
+  @staticmethod
+  def addVndCat(eepNod, catId, dat):
+    vndNod = eepNod.find("VendorSpecific")
+    catNod = ET.Element("Category")
+    ET.SubElement(catNod, "CatNo").text = str( catId )
+    ET.SubElement(catNod, "Data").text  = dat.hex()
+    try:
+      eepNod.remove( findCat( eepNod, catId ) )
+    except KeyError:
+      pass
+    eepNod.insert( eepNod.index( vndNod ), catNod )
+
+  def makeProm(self):
+    # fixup vendor-specific data
+    pgen   = ESIPromGenerator( self._root )
+    eepNod = mustFind( self._root, ".//Device/Eeprom" )
+    vndNod = eepNod.find("VendorSpecific")
+    if not vndNod is None:
+      nod    = vndNod.find("ClockFreqMHz")
+      if not nod is None:
+        drvId   = FirmwareConstants.CLK_DRIVER_MAP( nod.get("DriverName") )
+        freqMHz = float( nod.text )
+        catId   = FirmwareConstants.CLK_FREQ_VND_CAT_ID()
+        dat     = bytearray()
+        dat.append( drvId )
+        dat.extend( struct.pack( '<d', freqMHz ) )
+        self.addVndCat( eepNod, catId, dat )
+      nod = vndNod.find("EvrDCTargetNS")
+      if not nod is None:
+        catId   = FirmwareConstants.EVR_DC_TARGET_VND_CAT_ID()
+        dat     = struct.pack( '<d', float( nod.text ) )
+        self.addVndCat( eepNod, catId, dat )
+        dat     = bytearray()
+        for nod in vndNod.findall("Segment"):
+          dat.append( pgen.findAddStr( nod.text ) )
+          dat.append( int( nod.get( "Swap8" ) )   )
+        self.addVndCat( eepNod, FirmwareConstants.SEGNAMES_VND_CAT_ID(), dat )
+    return pgen.makeProm()
+
+  def writeProm(self, fnam, overwrite=False, prom = None):
+    mode = "wb" if overwrite else "xb"
+    if ( '-' == fnam ):
+      fnam    = sys.stdout.fileno()
+      closefd = False
+    else:
+      closefd = True
+
+    if prom is None:
+      prom = self.makeProm()
+
+    with io.open( fnam, mode=mode, closefd=closefd ) as f:
+      f.write( prom )
+
 class ESI(XMLBase):
 
   def __init__(self, root = None):
@@ -1697,10 +1755,6 @@ class ESI(XMLBase):
     self._txPdo = txPdo
     self.syncElms()
 
-  @property
-  def element(self):
-    return self._root
-
   @property
   def txPdo(self):
     return self._txPdo
@@ -1712,21 +1766,15 @@ class ESI(XMLBase):
   def update(self):
     self.syncElms()
 
+  # Return a private (deep) copy of the XML tree; this may be used
+  # e.g., by a worker thread to write the XML or generate the PROM
+  # while editing of the original continues.
+  def snapshot(self):
+    return XMLBase( copy.deepcopy( self._root ) )
+
   def syncElms(self):
     self._sms[ FirmwareConstants.TXPDO_SM() ].setSize( self.txPdo.pdoSize() )
 
-  @staticmethod
-  def addVndCat(eepNod, catId, dat):
-    vndNod = eepNod.find("VendorSpecific")
-    catNod = ET.Element("Category")
-    ET.SubElement(catNod, "CatNo").text = str( catId )
-    ET.SubElement(catNod, "Data").text  = dat.hex()
-    try:
-      eepNod.remove( findCat( eepNod, catId ) )
-    except KeyError:
-      pass
-    eepNod.insert( eepNod.index( vndNod ), catNod )
-    
   def _getAndMaybeBumpRev(self, bump=False):
     nod = mustFind( self._root, ".//Device/Type" )
     rev = hd2int( nod.get("RevisionNo") )
@@ -1740,33 +1788,6 @@ class ESI(XMLBase):
   def bumpRevision(self):
     return self._getAndMaybeBumpRev( True )
    
-  def makeProm(self):
-    # fixup vendor-specific data
-    pgen   = ESIPromGenerator( self._root )
-    eepNod = mustFind( self._root, ".//Device/Eeprom" )
-    vndNod = eepNod.find("VendorSpecific")
-    if not vndNod is None:
-      nod    = vndNod.find("ClockFreqMHz")
-      if not nod is None:
-        drvId   = FirmwareConstants.CLK_DRIVER_MAP( nod.get("DriverName") )
-        freqMHz = float( nod.text )
-        catId   = FirmwareConstants.CLK_FREQ_VND_CAT_ID()
-        dat     = bytearray()
-        dat.append( drvId )
-        dat.extend( struct.pack( '<d', freqMHz ) )
-        self.addVndCat( eepNod, catId, dat )
-      nod = vndNod.find("EvrDCTargetNS")
-      if not nod is None:
-        catId   = FirmwareConstants.EVR_DC_TARGET_VND_CAT_ID()
-        dat     = struct.pack( '<d', float( nod.text ) )
-        self.addVndCat( eepNod, catId, dat )
-        dat     = bytearray()
-        for nod in vndNod.findall("Segment"):
-          dat.append( pgen.findAddStr( nod.text ) )
-          dat.append( int( nod.get( "Swap8" ) )   )
-        self.addVndCat( eepNod, FirmwareConstants.SEGNAMES_VND_CAT_ID(), dat )
-    return pgen.makeProm()
-
   @staticmethod
   def fromProm(fnam):
     with io.open(fnam, 'rb') as f:
@@ -1817,20 +1838,6 @@ class ESI(XMLBase):
         
     return rootNod
 
-  def writeProm(self, fnam, overwrite=False, prom = None):
-    mode = "wb" if overwrite else "xb"
-    if ( '-' == fnam ):
-      fnam    = sys.stdout.fileno()
-      closefd = False
-    else:
-      closefd = True
-
-    if prom is None:
-      prom = self.makeProm()
-
-    with io.open( fnam, mode=mode, closefd=closefd ) as f:
-      f.write( prom )
-
   def _resolveOpen(self, fnam, flg):
     if ( isinstance(fnam, io.TextIOWrapper) ):
       return fnam
@@ -0,0 +1,48 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+# the tools import their siblings directly
+import os
+import sys
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import io
+import json
+import pytest
+from   ToolCore   import ESI, FixedPdoPart
+from   PdoElement import PdoElement
+from   PdoImport  import PdoLayoutImport
+
+# ESI with all fixed TxPDO entries enabled and (optionally) a layout
+# of segments/items imported (dict with 'segments' and 'items')
+def mkEsi(layout = None):
+  esi = ESI( None )
+  vd  = esi.vendorData
+  fix = []
+  for i in range( len( vd.fixedProperties ) ):
+    p = vd.fixedProperties[i]
+    fix.append( PdoElement( p["name"], 0x6000 + i, p["size"] // 8, p["nelms"] ) )
+  vd.update( FixedPdoPart.F_MASK, [] )
+  esi.txPdo.update( [], fix, [] )
+  esi.update()
+  esi = ESI( esi.element )
+  if ( not layout is None ):
+    PdoLayoutImport.fromJSON( io.StringIO( json.dumps( layout ) ) ).applyToEsi( esi )
+    esi = ESI( esi.element )
+  return esi
+
+LAYOUT = {
+  "segments" : [ { "name" : "S0", "byteOffset" : 0, "nDWords" : 6, "swap" : 1 } ],
+  "items"    : [ { "name" : "PulseID", "index" : "0x5000", "type" : "U64" },
+                 { "name" : "Flags",   "index" : "0x5001", "type" : "U16", "nelms" : 3 },
+                 { "name" : "Sig",     "index" : "0x5002", "type" : "S16" },
+                 { "name" : "Raw",     "index" : "0x5003", "type" : "U32", "nelms" : 2 } ] }
+
+@pytest.fixture
+def esi():
+  return mkEsi( LAYOUT )
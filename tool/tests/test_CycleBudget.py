@@ -0,0 +1,39 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+from   HbiTimingModel import HbiTiming
+from   CycleBudget    import SlaveBudget, CycleBudget
+from   ToolCore       import int2hd
+
+def test_hbiDefaults():
+  for clk in ( 100.0E6, 50.0E6 ):
+    s = SlaveBudget( "s", 100, 4, clkHz = clk )
+    h = HbiTiming( clk )
+    assert s.hbiWriteNs == h.ns( h.cycles( False ) )
+    assert s.hbiReadNs  == h.ns( h.cycles( True  ) )
+  s = SlaveBudget( "s", 100, 4 )
+  assert ( s.hbiWriteNs, s.hbiReadNs ) == ( 140.0, 270.0 )
+  s = SlaveBudget( "s", 100, 4, hbiWriteNs = 150.0 )
+  assert s.hbiWriteNs == 150.0
+
+def test_budget():
+  b = CycleBudget( 250000.0, 1000.0 )
+  b.add( SlaveBudget( "evr", 100, 4 ) )
+  b.add( SlaveBudget( "io", 8, 4, firmware = False ) )
+  assert b.problems() == []
+  b = CycleBudget( 100000.0, 1000.0 )
+  b.add( SlaveBudget( "evr", 100, 4 ) )
+  assert len( b.problems() ) > 0
+
+# PDO sizes from the ESI's SM elements (possibly written in hex)
+def test_fromEsi(esi):
+  s = SlaveBudget.fromEsi( esi )
+  assert ( s.txSize, s.rxSize ) == ( 96, 3 )
+  for sm in esi.element.findall( ".//Device/Sm" ):
+    sm.set( "DefaultSize", int2hd( int( sm.get( "DefaultSize" ) ) ) )
+  s = SlaveBudget.fromEsi( esi )
+  assert ( s.txSize, s.rxSize ) == ( 96, 3 )
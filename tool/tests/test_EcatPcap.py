@@ -0,0 +1,134 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import io
+import struct
+import numpy
+import pytest
+
+from   EcatPcap import EcatPdoReader, EcatCapture, CMD_FPWR, CMD_LRD, CMD_LWR
+from   ToolCore import int2hd
+from   conftest import mkEsi, LAYOUT
+
+TXSZ   = 96
+RXSZ   = 3
+TXLOG  = 0x00010000
+RXLOG  = 0x00020000
+MASTER = bytes( [ 0x00, 0x11, 0x22, 0x33, 0x44, 0x55 ] )
+# the devices set the locally-administered bit of the source MAC
+BACK   = bytes( [ 0x02, 0x11, 0x22, 0x33, 0x44, 0x55 ] )
+NCYC   = 5
+
+def datagram(cmd, adp, ado, data, wkc = 0, more = False):
+  return struct.pack( "<BBHHHH", cmd, 0, adp, ado, len( data ) | ( 0x8000 if more else 0 ), 0 ) + bytes( data ) + struct.pack( "<H", wkc )
+
+def frame(src, dgrams):
+  pl = b''.join( [ datagram( *d, more = ( i < len( dgrams ) - 1 ) ) for i, d in enumerate( dgrams ) ] )
+  return b'\xff' * 6 + src + struct.pack( ">H", 0x88a4 ) + struct.pack( "<H", len( pl ) | 0x1000 ) + pl
+
+def fmmu(log, ln, phys, typ):
+  return struct.pack( "<IHBBHBBB3x", log, ln, 0, 7, phys, 0, typ, 1 )
+
+def txData(i):
+  return bytes( [ i ] * TXSZ )
+
+def rxData(i):
+  return bytes( [ 0x80 + i ] * RXSZ )
+
+# (timestamp, frame) of the FMMU setup of two devices (station 0x1001
+# is ours) followed by NCYC cycles (a frame sent by the master and
+# the same frame returned by the devices)
+def traffic():
+  frms = list()
+  for station, off in ( ( 0x1002, 0x100 ), ( 0x1001, 0 ) ):
+    regs = fmmu( TXLOG + off, TXSZ, 0x1800, 1 ) + fmmu( RXLOG + off, RXSZ, 0x1400, 2 )
+    frms.append( ( 0.5, frame( MASTER, [ ( CMD_FPWR, station, 0x0600, regs ) ] ) ) )
+  for i in range( NCYC ):
+    t = 1.0 + 0.001*i
+    d = [ ( CMD_LRD, TXLOG & 0xffff, TXLOG >> 16, bytes( TXSZ ), 0 ), ( CMD_LWR, RXLOG & 0xffff, RXLOG >> 16, rxData( i ), 0 ) ]
+    frms.append( ( t, frame( MASTER, d ) ) )
+    d = [ ( CMD_LRD, TXLOG & 0xffff, TXLOG >> 16, txData( i ), 1 ), ( CMD_LWR, RXLOG & 0xffff, RXLOG >> 16, rxData( i ), 1 ) ]
+    frms.append( ( t + 0.0001, frame( BACK, d ) ) )
+  return frms
+
+def pcap(frms):
+  out = [ struct.pack( "<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1 ) ]
+  for t, f in frms:
+    us = int( round( t * 1.0e6 ) )
+    out.append( struct.pack( "<IIII", us // 1000000, us % 1000000, len( f ), len( f ) ) + f )
+  return b''.join( out )
+
+def block(typ, body):
+  body += bytes( -len( body ) % 4 )
+  return struct.pack( "<II", typ, len( body ) + 12 ) + body + struct.pack( "<I", len( body ) + 12 )
+
+# the last frame is stored in a simple packet block (no timestamp)
+def pcapng(frms, ifc = 0):
+  out = [ block( 0x0A0D0D0A, struct.pack( "<IHHq", 0x1A2B3C4D, 1, 0, -1 ) ),
+          # if_tsresol: ns
+          block( 1, struct.pack( "<HHI", 1, 0, 65535 ) + struct.pack( "<HHB3xHH", 9, 1, 9, 0, 0 ) ) ]
+  for t, f in frms[:-1]:
+    ns = int( round( t * 1.0e9 ) )
+    out.append( block( 6, struct.pack( "<IIIII", ifc, ns >> 32, ns & 0xffffffff, len( f ), len( f ) ) + f ) )
+  out.append( block( 3, struct.pack( "<I", len( frms[-1][1] ) ) + frms[-1][1] ) )
+  return b''.join( out )
+
+def check(rdr, lastTs):
+  got = { EcatPdoReader.TX : ( list(), list() ), EcatPdoReader.RX : ( list(), list() ) }
+  for kind, t, data in rdr.batches():
+    sz = rdr.pdoSize( kind )
+    got[kind][0].extend( t.tolist() )
+    got[kind][1].extend( [ bytes( data[i*sz:(i+1)*sz] ) for i in range( len( t ) ) ] )
+  assert rdr.txLogical == TXLOG
+  assert rdr.rxLogical == RXLOG
+  assert len( rdr.fmmus ) == 4
+  ts, d = got[EcatPdoReader.TX]
+  assert d == [ txData( i ) for i in range( NCYC ) ]
+  exp = [ 1.0001 + 0.001*i for i in range( NCYC ) ]
+  exp[-1] = lastTs
+  assert ts == pytest.approx( exp, abs = 1.0e-9 )
+  ts, d = got[EcatPdoReader.RX]
+  assert d == [ rxData( i ) for i in range( NCYC ) ]
+  assert ts == pytest.approx( [ 1.0 + 0.001*i for i in range( NCYC ) ], abs = 1.0e-9 )
+  assert rdr.frames == rdr.ecatFrms == 2 + 2*NCYC
+
+@pytest.fixture
+def esi():
+  esi = mkEsi( LAYOUT )
+  # sizes may be written in hex
+  for sm in esi.element.findall( ".//Device/Sm" ):
+    sm.set( "DefaultSize", int2hd( int( sm.get( "DefaultSize" ) ) ) )
+  return esi
+
+# small chunks exercise the buffer refills
+@pytest.mark.parametrize( "chunk", [ 32, 1 << 16 ] )
+def test_pcap(esi, chunk):
+  rdr = EcatPdoReader( io.BytesIO( pcap( traffic() ) ), esi, station = 0x1001, batch = 2, chunkSize = chunk )
+  check( rdr, 1.0001 + 0.001*(NCYC - 1) )
+
+@pytest.mark.parametrize( "chunk", [ 32, 1 << 16 ] )
+def test_pcapng(esi, chunk):
+  rdr = EcatPdoReader( io.BytesIO( pcapng( traffic() ) ), esi, station = 0x1001, batch = 2, chunkSize = chunk )
+  check( rdr, 0.0 )
+
+# PDO locations passed explicitly; without a station address the first
+# device's FMMU setup is used
+def test_firstDevice():
+  rdr = EcatPdoReader( io.BytesIO( pcap( traffic() ) ), txPhys = 0x1800, txSize = TXSZ, rxPhys = 0x1400, rxSize = RXSZ )
+  tx  = [ bytes( d ) for k, t, d in rdr.pdos() if EcatPdoReader.TX == k ]
+  assert rdr.txLogical == TXLOG + 0x100
+  assert len( tx ) == 0
+
+def test_undescribedInterface():
+  cap = EcatCapture( io.BytesIO( pcapng( traffic(), ifc = 1 ) ) )
+  with pytest.raises( ValueError ):
+    list( cap.frames() )
+
+def test_notACapture():
+  cap = EcatCapture( io.BytesIO( bytes( 64 ) ) )
+  with pytest.raises( ValueError ):
+    list( cap.frames() )
@@ -0,0 +1,75 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import pytest
+
+from   conftest          import mkEsi
+from   FirmwareConstants import FirmwareConstants
+from   ToolCore          import int2hd
+from   EoeMbxSim         import (fragmentPayload, fragments, udp2BusSizes, EoeMbxConfig, EoeMbxSim,
+                                 recommend, applyMbxSizes, readMbxSizes, MBX_HDR, EOE_HDR, ETH_IP_UDP)
+
+def test_fragments():
+  # fragments carry multiples of 32 bytes
+  assert fragmentPayload( 80 )  == 64
+  assert fragmentPayload( 106 ) == 96
+  assert fragments( 100, 80 )   == [ 64, 36 ]
+  assert fragments( 128, 80 )   == [ 64, 64 ]
+  assert fragments( 129, 80 )   == [ 64, 64, 1 ]
+  assert fragments( 10, 80 )    == [ 10 ]
+  for n in range( 1, 300 ):
+    f = fragments( n, 106 )
+    assert sum( f ) == n
+    assert all( [ x == 96 for x in f[:-1] ] ) and 0 < f[-1] <= 96
+  with pytest.raises( ValueError ):
+    fragments( 100, MBX_HDR + EOE_HDR + 31 )
+
+def test_udp2BusSizes():
+  assert udp2BusSizes()       == ( 6, 8 )
+  assert udp2BusSizes( 2, 1 ) == ( 2 + 3 * 4 + 4, 2 + 2 * 4 + 2 )
+
+def test_run():
+  cfg  = EoeMbxConfig( sm0Len = 80, sm1Len = 80, pollNs = 1.0E6 )
+  res  = EoeMbxSim( cfg ).run( 100, 100, nReq = 10 )
+  assert ( res.rxFrags, res.txFrags ) == ( len( fragments( ETH_IP_UDP + 100, 80 ) ), 3 )
+  assert len( res.rtt ) == 10
+  # one mailbox access per poll cycle and direction
+  assert min( res.rtt.values ) >= ( res.rxFrags + res.txFrags - 1 ) * cfg.pollNs
+  # larger mailboxes need fewer fragments and poll cycles
+  big  = EoeMbxSim( cfg.copy( sm0Len = 512, sm1Len = 512 ) ).run( 100, 100, nReq = 10 )
+  assert ( big.rxFrags, big.txFrags ) == ( 1, 1 )
+  assert big.rtt.mean() < res.rtt.mean()
+  assert big.rate > res.rate
+  # a larger window keeps the pipeline busy
+  assert EoeMbxSim( cfg ).run( 100, 100, nReq = 10, window = 4 ).rate > res.rate
+
+def test_problems():
+  cfg = EoeMbxConfig()
+  assert cfg.problems() == []
+  cfg = cfg.copy( sm0Len = FirmwareConstants.ESC_SM_MAX_LEN( 0 ) + 1, sm1Len = 32 )
+  assert len( cfg.problems() ) == 3
+
+def test_recommend():
+  cfg       = EoeMbxConfig()
+  best, res = recommend( cfg, 200, 200, nReq = 10 )
+  assert len( res ) > 1
+  assert best.rtt.mean() <= 1.01 * min( [ r.rtt.mean() for r in res ] )
+  assert best.cfg.sm1Len == cfg.sm1Len
+  # the smallest mailbox that fits the frame in one go suffices
+  assert best.rxFrags == 1
+  assert fragmentPayload( best.cfg.sm0Len ) - 32 < ETH_IP_UDP + 200
+
+def test_mbxSizes():
+  esi = mkEsi()
+  applyMbxSizes( esi, sm0Len = 138 )
+  cfg = readMbxSizes( esi, EoeMbxConfig( sm0Len = 0, sm1Len = 0 ) )
+  assert ( cfg.sm0Len, cfg.sm1Len ) == ( 138, FirmwareConstants.ESC_SM_LEN( 1 ) )
+  # sizes in ESI files may be hex
+  for el in esi.element.findall( ".//Device/Sm" ):
+    el.set( "DefaultSize", int2hd( int( el.get( "DefaultSize" ) ) ) )
+  cfg = readMbxSizes( esi, EoeMbxConfig( sm0Len = 0, sm1Len = 0 ) )
+  assert ( cfg.sm0Len, cfg.sm1Len ) == ( 138, FirmwareConstants.ESC_SM_LEN( 1 ) )
@@ -0,0 +1,58 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import os
+import pytest
+import lxml.etree as ET
+
+pytest.importorskip( "PyQt5" )
+
+from   ToolCore  import ESI
+from   EsiWorker import EsiJob
+
+# minimal schema; the real one (EtherCATInfo.xsd) is not part of the repo
+XSD = b"""<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="EtherCATInfo">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Vendor"       type="xs:anyType"/>
+        <xs:element name="Descriptions" type="xs:anyType"/>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>"""
+
+def runJob(job):
+  res = dict()
+  job.signals.finished.connect( lambda n: res.setdefault( "finished", n ) )
+  job.signals.failed.connect(   lambda m: res.setdefault( "failed",   m ) )
+  job.run()
+  return res
+
+def test_validateAndWrite(tmp_path):
+  schema = ET.XMLSchema( ET.fromstring( XSD ) )
+  fnam   = str( tmp_path / "esi.xml" )
+  job    = EsiJob( ESI( None ).snapshot(), "save" )
+  job.addValidate( schema )
+  job.addWriteXML( fnam )
+  res    = runJob( job )
+  assert "failed" not in res, res.get( "failed" )
+  assert res["finished"] == "save"
+  schema.assertValid( ET.parse( fnam ) )
+  assert not os.path.exists( fnam + ".tmp" )
+
+def test_validateFails(tmp_path):
+  schema = ET.XMLSchema( ET.fromstring( XSD ) )
+  snap   = ESI( None ).snapshot()
+  snap.element.append( ET.Element( "Bogus" ) )
+  fnam   = str( tmp_path / "esi.xml" )
+  job    = EsiJob( snap, "save" )
+  job.addValidate( schema )
+  job.addWriteXML( fnam )
+  res    = runJob( job )
+  assert "DocumentInvalid" in res["failed"]
+  assert not os.path.exists( fnam )
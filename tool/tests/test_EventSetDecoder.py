@@ -0,0 +1,59 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+from   EventSetDecoder import EventSetStats, NUM_CODES, eventCodes
+
+# 'nframes' EventSets with 'code' set in 'frames'
+def eventSets(frames, nframes = 100, code = 0x28):
+  e = numpy.zeros( ( nframes, NUM_CODES // 32 ), dtype = numpy.uint32 )
+  for f in frames:
+    e[f, code // 32] |= numpy.uint32( 1 << (code % 32) )
+  return e
+
+def stats(frames, period = 1, chunk = 100, code = 0x28):
+  st = EventSetStats()
+  st.expect( code, period )
+  e  = eventSets( frames, code = code )
+  for i in range( 0, len( e ), chunk ):
+    st.update( e[i:i+chunk] )
+  return st
+
+def test_eventCodes():
+  e = eventSets( [ 0 ], 1, 0x7d )[0]
+  e[0] |= 1 << 3
+  assert list( eventCodes( e ) ) == [ 3, 0x7d ]
+
+def test_regular():
+  st = stats( range( 100 ), chunk = 7 )
+  assert st.counts[0x28] == 100
+  assert st.missed[0x28] == 0
+  assert st.modalGap( 0x28 ) == 1 and st.irregular( 0x28 ) == 0
+  assert st.missing == []
+
+def test_gapsAcrossChunks():
+  st = stats( [ f for f in range( 100 ) if not f in ( 40, 41, 42 ) ], chunk = 41 )
+  assert st.missed[0x28] == 3
+  assert st.missing == [ ( 43, 0x28, 4 ) ]
+
+def test_stopsArriving():
+  st = stats( range( 10 ), chunk = 33 )
+  assert st.missed[0x28] == 90
+  assert st.missing == [ ( 100, 0x28, 91 ) ]
+
+def test_neverSeen():
+  assert stats( [] ).missed[0x28] == 100
+
+def test_leadingGap():
+  st = stats( range( 5, 100 ), chunk = 3 )
+  assert st.missed[0x28] == 5
+  assert st.missing == [ ( 5, 0x28, 6 ) ]
+
+def test_period():
+  assert stats( range( 5, 100, 10 ), 10 ).missed[0x28] == 0
+  # two missing before, four after
+  assert stats( range( 25, 60, 10 ), 10 ).missed[0x28] == 6
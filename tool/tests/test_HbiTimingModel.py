@@ -0,0 +1,89 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import os
+import re
+import math
+import pytest
+
+from   HbiTimingModel import HbiTiming, HbiModel, TxPdoWriter, MailboxLoad, sweep, PRIO_RXMBX, SYNC_STAGES
+
+VHDL = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "..", "hdl", "Lan9254HbiImpl.vhd" )
+
+# RETURNS: dict of the 'real' constants (seconds) of the HBI implementation
+def vhdlConstants():
+  with open( VHDL ) as f:
+    txt = f.read()
+  c = dict()
+  for m in re.finditer( r"constant\s+(\w+)_C\s*:\s*real\s*:=\s*([^;]+);", txt ):
+    terms = [ t.strip() for t in m.group(2).split( "+" ) ]
+    c[m.group(1)] = sum( [ c[t[:-2]] if t.endswith( "_C" ) else float( t ) for t in terms ] )
+  m = re.search( r"constant\s+SYNC_STAGES_C\s*:\s*positive\s*:=\s*(\d+)", txt )
+  c["SYNC_STAGES"] = int( m.group(1) )
+  return c
+
+# VHDL initCnt( t * CLOCK_FREQ_G )
+def initCnt(t, clk):
+  return int( math.ceil( t * clk ) ) - 1
+
+@pytest.mark.parametrize( "clk", [ 25.0E6, 50.0E6, 100.0E6, 125.0E6, 156.25E6, 200.0E6 ] )
+def test_constants(clk):
+  c = vhdlConstants()
+  h = HbiTiming( clk )
+  assert SYNC_STAGES == c["SYNC_STAGES"]
+  assert h.twale == initCnt( c["TWALE"], clk )
+  assert h.tadrh == initCnt( c["TADRH"], clk )
+  assert h.trdal == initCnt( c["TRDAL"], clk )
+  assert h.trdwa == initCnt( c["TRDWA"], clk ) + c["SYNC_STAGES"]
+  assert h.twr   == initCnt( c["TWR"],   clk )
+  assert h.tdwrh == initCnt( c["TDWRH"], clk )
+  assert h.timeo == initCnt( c["TWAK_TIMEO"], clk )
+
+def test_cycles():
+  h = HbiTiming( 100.0E6 )
+  assert ( h.cycles( False ), h.cycles( True ) ) == ( 14, 27 )
+  # the second half repeats the address/data phase after TRDAL
+  for rd in ( False, True ):
+    half = h.cycles( rd, 2 ) - h.cycles( rd ) - h.trdal
+    assert half == 3 + h.twale + h.tadrh + ( h.trdwa + h.rdAck if rd else h.twr + h.wrAck )
+  # a wait-ack that never comes is capped by the timeout
+  assert HbiTiming( 100.0E6, wrAckNs = 10000.0 ).wrAck == h.timeo + 1
+
+def test_updateRate():
+  # limited by TXPDO_MAX_UPDATE_FREQ_G when the bus is fast enough
+  txp = TxPdoWriter( 64, burstMax = 32, burstGap = 0, maxUpdHz = 10.0E3, nUpdates = 50 )
+  res = HbiModel( HbiTiming( 100.0E6 ), [ txp ] ).run()
+  assert txp.updateRate() == pytest.approx( 10.0E3, rel = 0.1 )
+  assert 0.0 < res.utilisation < 1.0
+  # ... by the bus otherwise
+  txp = TxPdoWriter( 4096, burstMax = 32, burstGap = 0, maxUpdHz = 100.0E3, nUpdates = 10 )
+  HbiModel( HbiTiming( 100.0E6 ), [ txp ] ).run()
+  assert txp.updateRate() < 100.0E3
+
+def test_competition():
+  tim  = HbiTiming( 100.0E6 )
+  def run(gap):
+    txp = TxPdoWriter( 512, burstMax = 16, burstGap = gap, nUpdates = 20 )
+    mbx = MailboxLoad( "EoE", PRIO_RXMBX, bytesPerSec = 4.0E6, frameBytes = 1500 )
+    return txp, mbx, HbiModel( tim, [ mbx, txp ] ).run()
+  alone = TxPdoWriter( 512, burstMax = 16, burstGap = 8, nUpdates = 20 )
+  HbiModel( tim, [ alone ] ).run()
+  txp, mbx, res = run( 8 )
+  assert len( mbx.latency ) > 0
+  # the mailbox gets the bus between TxPDO writes, i.e., never waits
+  # longer than a TxPDO access
+  assert mbx.waits.max() <= tim.cycles()
+  assert txp.latency.mean() > alone.latency.mean()
+  assert res.requesters[0] is txp
+
+def test_sweep():
+  tim        = HbiTiming( 100.0E6 )
+  loads      = lambda: [ MailboxLoad( "EoE", PRIO_RXMBX, bytesPerSec = 4.0E6 ) ]
+  best, res  = sweep( tim, 512, [ 4, 16 ], [ 0, 32 ], loads = loads, nUpdates = 10 )
+  assert len( res ) == 4
+  p99        = [ r.txPdo().latency.percentile( 99 ) for b, g, r in res ]
+  assert best[2].txPdo().latency.percentile( 99 ) == min( p99 )
@@ -0,0 +1,76 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+import pytest
+from   PdoCaptureStore import PdoCaptureWriter, PdoCaptureReader
+
+DTYPE = numpy.dtype( [ ( "TimestampHi", "<u4" ), ( "TimestampLo", "<u4" ), ( "Data", "<u2", (3,) ) ] )
+
+def mkRecords(ts):
+  r                = numpy.zeros( len( ts ), dtype = DTYPE )
+  r["TimestampHi"] = numpy.asarray( ts ) // 1000000000
+  r["TimestampLo"] = numpy.asarray( ts ) %  1000000000
+  r["Data"]        = numpy.arange( len( ts ) )[:, None]
+  return r
+
+def archive(path, ts, segmentRecords = 100, indexStride = 8):
+  rec = mkRecords( ts )
+  with PdoCaptureWriter( str( path ), DTYPE, segmentRecords, indexStride ) as w:
+    for i in range( 0, len( rec ), 37 ):
+      w.append( rec[i:i+37] )
+  return rec
+
+def count(views):
+  return sum( [ len( v ) for v in views ] )
+
+def test_roundtrip(tmp_path):
+  rec = archive( tmp_path / "a", 1000 * numpy.arange( 1000 ) )
+  r   = PdoCaptureReader( str( tmp_path / "a" ), DTYPE )
+  assert len( r ) == 1000
+  assert ( numpy.concatenate( r.range() ) == rec ).all()
+  v   = numpy.concatenate( r.range( 250500, 760000 ) )
+  assert v["Data"][0][0] == 251 and v["Data"][-1][0] == 759
+  r.close()
+
+# equal timestamps spanning segment boundaries
+def test_rangeEqualKeys(tmp_path):
+  ts  = numpy.concatenate( ( numpy.arange( 50 ), numpy.full( 900, 50 ), 51 + numpy.arange( 50 ) ) )
+  archive( tmp_path / "a", ts )
+  r   = PdoCaptureReader( str( tmp_path / "a" ), DTYPE )
+  assert count( r.range( 50, 51 ) ) == 900
+  assert count( r.range( 50 ) ) == 950
+  assert count( r.range( None, 50 ) ) == 50
+  assert count( r.range( 49, 50 ) ) == 1
+  r.close()
+
+def test_continue(tmp_path):
+  archive( tmp_path / "a", numpy.arange( 150 ) )
+  archive( tmp_path / "a", 150 + numpy.arange( 150 ) )
+  r   = PdoCaptureReader( str( tmp_path / "a" ), DTYPE )
+  assert len( r ) == 300
+  assert count( r.range( 140, 160 ) ) == 20
+  r.close()
+
+# decreasing timestamps are rejected across segment boundaries (and when
+# continuing an archive)
+def test_decreasingAcrossSegments(tmp_path):
+  p = str( tmp_path / "a" )
+  with PdoCaptureWriter( p, DTYPE, 4 ) as w:
+    w.append( mkRecords( [ 10, 20, 30, 40 ] ) )
+    with pytest.raises( ValueError ):
+      w.append( mkRecords( [ 5, 6 ] ) )
+    with pytest.raises( ValueError ):
+      w.append( mkRecords( [ 50, 45 ] ) )
+  with PdoCaptureWriter( p, DTYPE, 4 ) as w:
+    with pytest.raises( ValueError ):
+      w.append( mkRecords( [ 39 ] ) )
+    w.append( mkRecords( [ 40, 60 ] ) )
+  r = PdoCaptureReader( p, DTYPE )
+  assert len( r ) == 6
+  assert count( r.range( 6, 100 ) ) == 6
+  r.close()
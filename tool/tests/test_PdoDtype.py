@@ -0,0 +1,53 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+
+from   ToolCore import ESI
+from   PdoDtype import txPdoDtype, txPdoFields, rxPdoDtype, decodeTxPdo, loadEsi
+
+def test_fixed_entries(esi):
+  d = txPdoDtype( esi )
+  assert d.names[0:3] == ( "TimestampHi", "TimestampLo", "EventSet" )
+  assert d.fields["TimestampHi"][1] == 0
+  assert d.fields["TimestampLo"][1] == 4
+  assert d.fields["EventSet"][0]    == numpy.dtype( ( "<u4", (8,) ) )
+  assert d.fields["EventSet"][1]    == 8
+  assert d.fields["TimestampLatch0Rising"][0] == numpy.dtype( "<u8" )
+  assert d.fields["TimestampLatch0Rising"][1] == 40
+
+def test_user_items(esi):
+  d   = txPdoDtype( esi )
+  fix = esi.vendorData.segments[0].byteSz
+  assert d.fields["PulseID"][1] == fix
+  assert d.fields["Flags"][0]   == numpy.dtype( ( "<u2", (3,) ) )
+  assert d.fields["Sig"][0]     == numpy.dtype( "<i2" )
+  assert d.itemsize             == esi.vendorData.byteSz
+  f, sz = txPdoFields( esi )
+  assert sz == d.itemsize
+
+def test_decode_stride(esi):
+  d   = txPdoDtype( esi )
+  stw = d.itemsize + 8
+  buf = numpy.zeros( ( 3, stw ), dtype = numpy.uint8 )
+  off = d.fields["PulseID"][1]
+  for i in range( 3 ):
+    buf[i, off:off + 8] = numpy.array( [ 0x1000 + i ], dtype = "<u8" ).view( numpy.uint8 )
+    buf[i, d.itemsize:] = 0xff
+  rec = decodeTxPdo( buf.tobytes(), d, stride = stw )
+  assert len( rec ) == 3
+  assert list( rec["PulseID"] ) == [ 0x1000, 0x1001, 0x1002 ]
+  rec = decodeTxPdo( buf.tobytes(), d, offset = stw, stride = stw )
+  assert list( rec["PulseID"] ) == [ 0x1001, 0x1002 ]
+
+def test_sii_roundtrip(esi, tmp_path):
+  fnam = str( tmp_path / "esi.sii" )
+  esi.writeProm( fnam, True )
+  assert txPdoDtype( loadEsi( fnam ) ) == txPdoDtype( esi )
+
+def test_rx_default():
+  assert rxPdoDtype( ESI( None ) ) == numpy.dtype( [ ( "LED", "u1", (3,) ) ] )
@@ -0,0 +1,47 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import io
+import json
+import pytest
+
+from   ToolCore          import ESI
+from   PdoImport         import PdoLayoutImport, PdoImportError
+from   conftest          import mkEsi
+from   FirmwareConstants import FirmwareConstants
+
+def layout(segs, items = []):
+  return PdoLayoutImport.fromJSON( io.StringIO( json.dumps( { "segments" : segs, "items" : items } ) ) )
+
+def test_import():
+  esi = mkEsi()
+  layout( [ { "name" : "S", "byteOffset" : 0, "nDWords" : 3 } ],
+          [ { "name" : "A", "index" : "0x5000", "type" : "U32" },
+            { "name" : "B", "index" : "0x5001", "type" : "U16", "nelms" : 4 } ] ).applyToEsi( esi )
+  esi = ESI( esi.element )
+  vd  = esi.vendorData
+  fixed, managed = PdoLayoutImport.splitEntries( vd, esi.txPdo )
+  assert len( fixed ) == vd.numEntries
+  assert [ e.name for e in managed ] == [ "A", "B[1]" ]
+  assert vd.byteSz == 4 * vd.numDWords + 12
+
+def test_sizeIncludesFixedPart():
+  esi  = mkEsi()
+  fix  = 4 * esi.vendorData.numDWords
+  maxb = FirmwareConstants.ESC_SM_MAX_LEN( FirmwareConstants.TXPDO_SM() )
+  # user segments alone fit but not together with the fixed entries
+  nd   = ( maxb - fix ) // 4 + 1
+  assert 4 * nd <= maxb
+  with pytest.raises( PdoImportError ) as e:
+    layout( [ { "name" : "S", "byteOffset" : 0, "nDWords" : nd } ] ).applyToEsi( esi )
+  assert "size limit" in str( e.value )
+  layout( [ { "name" : "S", "byteOffset" : 0, "nDWords" : nd - 1 } ] ).applyToEsi( esi )
+
+def test_itemsMustFit():
+  with pytest.raises( PdoImportError ):
+    layout( [ { "name" : "S", "byteOffset" : 0, "nDWords" : 1 } ],
+            [ { "name" : "A", "index" : "0x5000", "type" : "U64" } ] ).applyToEsi( mkEsi() )
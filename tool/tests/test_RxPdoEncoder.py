@@ -0,0 +1,43 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+
+from   ToolCore     import ESI
+from   RxPdoEncoder import RxPdoEncoder
+
+def test_encode():
+  enc = RxPdoEncoder( ESI( None ) )
+  assert enc.size == 3
+  img = enc.encode( { "LED" : [ [ 1, 2, 3 ], [ 4, 5, 6 ] ] } )
+  assert img.shape == ( 2, 3 )
+  assert img.tolist() == [ [ 1, 2, 3 ], [ 4, 5, 6 ] ]
+  # broadcast over the requested number of images
+  img = enc.encode( { "LED" : [ 7, 8, 9 ] }, 4 )
+  assert img.tolist() == 4 * [ [ 7, 8, 9 ] ]
+
+def test_walking():
+  enc = RxPdoEncoder( ESI( None ) )
+  img = enc.walkingOnes( 25 )
+  for i in range( 25 ):
+    b = i % 24
+    exp = [ 0, 0, 0 ]
+    exp[ b // 8 ] = 1 << ( b % 8 )
+    assert img[i].tolist() == exp
+  img = enc.walkingZeros( 3, start = 9 )
+  assert img.tolist() == [ [ 0xff, 0xfd, 0xff ], [ 0xff, 0xfb, 0xff ], [ 0xff, 0xf7, 0xff ] ]
+
+def test_counter():
+  enc = RxPdoEncoder( ESI( None ) )
+  img = enc.counter( 300, start = 10 )
+  for i in ( 0, 1, 250, 299 ):
+    assert img[i].tolist() == [ ( 10 + i + e ) & 0xff for e in range( 3 ) ]
+
+def test_word_writes():
+  enc = RxPdoEncoder( ESI( None ) )
+  w   = enc.wordWrites( numpy.array( [ 0x11, 0x22, 0x33 ], dtype = numpy.uint8 ) )
+  assert w == [ ( 0, 0x2211, 3 ), ( 1, 0x33, 1 ) ]
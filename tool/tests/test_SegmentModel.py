@@ -0,0 +1,40 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+from   ToolCore     import PdoSegment
+from   SegmentModel import SegmentModel
+
+def test_swap8():
+  m = SegmentModel( [ PdoSegment( "s", 0x10, 6, 8 ) ], 8 )
+  assert [ off for off, n, swp in m.hwMaps ] == [ 0x14, 0x10, 0x1c, 0x18, 0x24, 0x20 ]
+  assert m.problems( 0x28 ) == []
+  d = numpy.arange( 0x28, dtype = numpy.uint8 )
+  t = m.apply( d )[0]
+  assert m.pdoSize == 8 + 24
+  # every 8-byte word is byte-reversed
+  assert list( t[8:] ) == [ 0x10 + 8*q + 7 - b for q in range( 3 ) for b in range( 8 ) ]
+  rec, ok = m.inverse( t )
+  assert ( rec[0][ok] == d[ok] ).all() and ok[0x10:].all()
+
+def test_swapModes():
+  m = SegmentModel( [ PdoSegment( "a", 0, 1, 1 ), PdoSegment( "b", 4, 1, 2 ), PdoSegment( "c", 8, 1, 4 ) ] )
+  assert list( m.sourceIndex ) == [ 0, 1, 2, 3, 5, 4, 7, 6, 11, 10, 9, 8 ]
+  assert m.problems() == []
+
+def test_problems():
+  # overlapping segments
+  m = SegmentModel( [ PdoSegment( "a", 0, 4, 4 ), PdoSegment( "b", 8, 4, 1 ) ] )
+  p = m.problems()
+  assert len( p ) == 1 and "more than once: 0x8, 0xc" in p[0]
+  # the (broken) 8-byte walk +4, -4, +8, -4, ...
+  prom = bytearray()
+  for off in [ 4, 0, 8, 4, 12, 8 ]:
+    prom.extend( [ 1, 0x20, off, 0 ] )
+  assert any( [ "more than once" in x for x in SegmentModel.fromPromData( prom ).problems() ] )
+  m = SegmentModel( [ PdoSegment( "a", 0, 2, 1 ) ] )
+  assert "exceeds" in m.problems( 4 )[0]
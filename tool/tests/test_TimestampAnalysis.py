@@ -0,0 +1,77 @@
+##############################################################################
+##      Copyright (c) 2022#2023 by Paul Scherrer Institute, Switzerland
+##      All rights reserved.
+##  Authors: Till Straumann
+##  License: GNU GPLv2 or later
+##############################################################################
+
+import numpy
+import pytest
+
+from   TimestampAnalysis import TimestampAnalysis, EdgeStats, newEdges
+
+LATCH = "TimestampLatch0Rising"
+DTYPE = numpy.dtype( [ ( "TimestampHi", "<u4" ), ( "TimestampLo", "<u4" ), ( LATCH, "<u8" ) ] )
+
+# 1 kHz frames, an edge every 10 frames; the DC time of the edges drifts
+# by 'ppm' against the EVR time and has gaussian jitter; 'spikes' maps
+# edge numbers to extra offsets (ns)
+def capture(frames, ppm = 2.0, jitter = 5.0, spikes = {}, seed = 1):
+  rnd = numpy.random.default_rng( seed )
+  rec = numpy.zeros( frames, dtype = DTYPE )
+  evr = 10**9 + numpy.arange( frames, dtype = numpy.int64 ) * 1000000
+  rec["TimestampHi"] = evr // 10**9
+  rec["TimestampLo"] = evr %  10**9
+  edg = numpy.arange( 0, frames, 10 )
+  t   = evr[edg]
+  dc  = t + 50000 + numpy.round( ppm * 1.0e-6 * ( t - t[0] ) + rnd.normal( 0.0, jitter, len( t ) ) ).astype( numpy.int64 )
+  for e, v in spikes.items():
+    dc[e] += v
+  # the latch holds its value until the next edge
+  rec[LATCH] = numpy.repeat( dc, 10 )[0:frames]
+  return rec
+
+def run(rec, chunks):
+  ta  = TimestampAnalysis( latches = [ LATCH ] )
+  off = 0
+  for n in chunks:
+    ta.update( rec[off:off + n] )
+    off += n
+  return ta
+
+def test_newEdges():
+  dc = numpy.array( [ 0, 5, 5, 7, 7, 7, 0, 9 ] )
+  assert list( numpy.flatnonzero( newEdges( dc ) ) ) == [ 1, 3, 7 ]
+  assert list( numpy.flatnonzero( newEdges( dc[3:], 7 ) ) ) == [ 4 ]
+
+def test_drift():
+  ta = run( capture( 20000, ppm = 2.0 ), [ 1000 ] * 20 )
+  st = ta[LATCH]
+  assert st.count == 2000
+  assert st.driftPpm == pytest.approx( 2.0, abs = 0.01 )
+  assert st.meanOffsetNs == pytest.approx( 50000 + 2000*10, abs = 100 )
+  assert st.nominalPeriodNs == pytest.approx( 10000000, abs = 20 )
+
+def test_jitter():
+  st = run( capture( 20000, jitter = 20.0 ), [ 1000 ] * 20 )[LATCH]
+  assert st.jitter.std == pytest.approx( 20.0, rel = 0.1 )
+  assert st.jitter.percentile( 50 ) == pytest.approx( 0.0, abs = 3.0 )
+  # difference of two jittered edges
+  assert st.period.std == pytest.approx( 20.0 * numpy.sqrt( 2.0 ), rel = 0.1 )
+  assert len( st.outliers ) == 0
+
+@pytest.mark.parametrize( "chunks", [ [ 1000 ] * 20, [ 7 ] + [ 1000 ] * 20 ] )
+def test_outliers(chunks):
+  spikes = { 3 : 400, 500 : -300, 1700 : 250 }
+  st     = run( capture( 20000, spikes = spikes ), chunks )[LATCH]
+  assert [ f for f, r in st.outliers ] == [ 10 * e for e in sorted( spikes ) ]
+  # well above the jitter (the least-squares detrending is affected by
+  # the spikes) but below the spikes
+  assert st.threshold > 3.0 * 5.0 and st.threshold < 250
+  assert "outliers   : 3" in str( st )
+
+def test_fewEdges():
+  st = EdgeStats( LATCH )
+  st.update( numpy.array( [ 0 ] ), numpy.array( [ 0 ] ), numpy.array( [ 1000 ] ) )
+  assert st.outliers == []
+  assert not st.threshold is None